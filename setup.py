@@ -25,5 +25,6 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=requirements,
+    extras_require={"fast": ["orjson"]},
     zip_safe=False,
 )
@@ -0,0 +1,31 @@
+import pytest
+import yaml
+
+from udronerc.dronehost import DroneHost
+from udronerc.simulator import DroneFleet
+
+
+@pytest.fixture
+def fleet():
+    with DroneFleet(4, seed=0) as fleet:
+        yield fleet
+
+
+@pytest.fixture
+def host(fleet):
+    host = DroneHost("127.0.0.1", hostid="test", addr=fleet.addr)
+    yield host
+    host.close()
+
+
+@pytest.fixture
+def write_suite(tmp_path):
+    """Return a function storing a suite in the temporary directory"""
+
+    def write(name, tasks, **suite):
+        path = tmp_path / f"{name}.yml"
+        suite = {"name": name, "id": name, "repeat": 0, **suite, "tasks": tasks}
+        path.write_text(yaml.safe_dump(suite))
+        return str(path)
+
+    return write
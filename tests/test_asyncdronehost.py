@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from udronerc.asyncdronehost import AsyncDroneHost
+from udronerc.constants import UDRONE_GROUP_DEFAULT
+from udronerc.errors import DroneNotFoundError
+from udronerc.simulator import DroneFleet
+
+
+def run(fleet, test):
+    """Run a coroutine function with an opened host talking to the fleet"""
+
+    async def main():
+        async with AsyncDroneHost("127.0.0.1", hostid="test", addr=fleet.addr) as host:
+            return await test(host)
+
+    return asyncio.run(main())
+
+
+def test_assign_call_reset(fleet):
+    async def test(host):
+        group = host.Group("async")
+        drones = await group.assign(2, board=None)
+        results = await group.call("sysinfo")
+        await group.reset()
+        free = await host.whois(UDRONE_GROUP_DEFAULT, need=4)
+        return drones, results, free
+
+    drones, results, free = run(fleet, test)
+    assert len(drones) == 2
+    assert set(results) == set(drones)
+    assert {r["status"] for r in results.values()} == {"ok"}
+    assert len(free) == 4
+
+
+def test_assign_fails_without_enough_drones(fleet):
+    async def test(host):
+        with pytest.raises(DroneNotFoundError):
+            await host.Group("many").assign(5, board=None)
+        return await host.whois(UDRONE_GROUP_DEFAULT, need=4)
+
+    assert len(run(fleet, test)) == 4  # Rolled back
+
+
+def test_concurrent_calls_of_groups(fleet):
+    async def test(host):
+        groups = [host.Group(f"async{i}") for i in range(2)]
+        for group in groups:
+            await group.assign(2, board=None)
+        results = await asyncio.gather(
+            *[
+                group.call("system", {"cmd": ["cat"], "stdin": [group.groupid]})
+                for group in groups
+            ]
+        )
+        await host.disband()
+        return groups, results
+
+    groups, results = run(fleet, test)
+    for group, answers in zip(groups, results):
+        assert len(answers) == 2
+        assert {a["data"]["stdout"] for a in answers.values()} == {group.groupid}
+
+
+def test_call_times_out(fleet):
+    async def test(host):
+        group = host.Group("lost")
+        await group.assign(2, board=None)
+        fleet.loss = 1.0
+        started = time.monotonic()
+        results = await group.call("sysinfo", timeout=0.5)
+        elapsed = time.monotonic() - started
+        fleet.loss = 0.0
+        await group.reset()
+        return results, elapsed
+
+    results, elapsed = run(fleet, test)
+    assert {r["status"] for r in results.values()} == {"unreachable"}
+    assert elapsed < 2
+
+
+def test_keepalive_keeps_drones_in_group():
+    fleet = DroneFleet(4, idle_timeout=0.3, seed=0)
+
+    async def test(host):
+        kept, dropped = host.Group("kept"), host.Group("dropped")
+        for group in (kept, dropped):
+            group.idle_intval = 0.1
+            await group.assign(2, board=None)
+        dropped.stop()
+        await asyncio.sleep(1.2)
+        await host.whois(UDRONE_GROUP_DEFAULT, need=0)  # Let drones idle out
+        results = await kept.call("sysinfo", timeout=1)
+        await kept.reset()
+        return kept, dropped, results
+
+    with fleet:
+        kept, dropped, results = run(fleet, test)
+        groups = {d.droneid: d.group for d in fleet.drones.values()}
+    assert {r["status"] for r in results.values()} == {"ok"}
+    assert not any(groups[drone] for drone in dropped.assigned_drones)
@@ -0,0 +1,17 @@
+from udronerc.bench import run_scenario
+
+
+def test_startup_runs_cached_whois():
+    scenario = {"drones": 3, "loss": 0.0, "payload": 64}
+    report = run_scenario(scenario, operations=["startup"], iterations=1)
+    assert report["startup"]["samples"] == 1
+    assert report["startup"]["errors"] == 0
+    assert report["startup"]["messages"] == 0
+
+
+def test_assign_and_call_release_drones():
+    scenario = {"drones": 3, "loss": 0.0, "payload": 64}
+    report = run_scenario(scenario, operations=["assign", "call"], iterations=3)
+    assert report["assign"]["errors"] == 0
+    assert report["call"]["errors"] == 0
+    assert report["call"]["samples"] == 3
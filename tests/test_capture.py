@@ -0,0 +1,42 @@
+from udronerc.capture import SENT, Replay, read_capture
+from udronerc.dronehost import DroneHost
+from udronerc.udronerc import run_suite
+
+TASKS = [
+    {"sysinfo": {}},
+    {"system": {"cmd": ["cat"], "stdin": ["hello"]}},
+    {"uci_set": {"data": {"system": {"@system[0]": {"hostname": "captured"}}}}},
+    {"uci_get": {"config": "system"}},
+]
+
+
+def answers(results: list) -> list:
+    return [
+        (task, {drone: (a["status"], a.get("data")) for drone, a in r.items()})
+        for task, r in results
+    ]
+
+
+def test_replay_reproduces_captured_run(fleet, write_suite, tmp_path):
+    path = write_suite("capture", TASKS, drones_min=2, drones_max=2)
+    capture = tmp_path / "run.cap"
+
+    host = DroneHost("127.0.0.1", hostid="test", addr=fleet.addr, capture=capture)
+    try:
+        captured = run_suite(host, path)
+    finally:
+        host.close()
+
+    replay = Replay(capture)
+    host = DroneHost(replay=replay)
+    try:
+        replayed = run_suite(host, path)
+    finally:
+        host.close()
+
+    assert host.hostid == "test"
+    assert [len(r) for _, r in captured] == [2] * len(TASKS)
+    assert answers(replayed) == answers(captured)
+    sent = sum(kind == SENT for _, kind, _, _ in read_capture(capture)[1])
+    assert replay.counters["matched"] == sent
+    assert replay.counters["skipped"] == 0
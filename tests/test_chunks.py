@@ -0,0 +1,46 @@
+import json
+
+from udronerc.dronehost import DroneHost
+from udronerc.simulator import DroneFleet
+
+CONTENT = "".join(f"{i:08d}\n" for i in range(20000))  # ~25 chunks
+READ = {"path": "file", "method": "read", "param": {"path": "/big"}}
+
+
+def read_big(loss: float, seed: int = 0):
+    with DroneFleet(2, seed=seed, files={"/big": CONTENT}) as fleet:
+        host = DroneHost("127.0.0.1", hostid="test", addr=fleet.addr)
+        try:
+            group = host.Group("chunks")
+            group.assign(2, board=None)
+            fleet.loss = loss
+            streamed = {}
+
+            def sink(drone, data):
+                streamed[drone] = streamed.get(drone, "") + data
+
+            results = group.call("ubus", READ, stream=sink)
+            fleet.loss = 0.0
+            group.reset()
+            return results, streamed, host.metrics.state()["retransmits"]
+        finally:
+            host.close()
+
+
+def test_chunked_reply_is_reassembled():
+    results, streamed, retransmits = read_big(0.0)
+    assert "!chunks" not in retransmits
+    assert len(results) == 2
+    for drone, answer in results.items():
+        assert answer["status"] == "ok"
+        assert answer["data"]["data"] == CONTENT
+        assert json.loads(streamed[drone]) == {"data": CONTENT}
+
+
+def test_lost_chunks_are_requested_again():
+    results, streamed, retransmits = read_big(0.1, seed=3)
+    assert retransmits["!chunks"] > 0
+    for drone, answer in results.items():
+        assert answer["status"] == "ok"
+        assert answer["data"]["data"] == CONTENT
+        assert json.loads(streamed[drone]) == {"data": CONTENT}
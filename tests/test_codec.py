@@ -0,0 +1,52 @@
+import json
+import sys
+
+import pytest
+
+from udronerc.codec import Envelope, JsonCodec, codecs, get_codec
+
+
+def installed():
+    available = []
+    for name in codecs:
+        try:
+            available.append(get_codec(name))
+        except ImportError:
+            continue
+    return available
+
+
+@pytest.mark.parametrize("codec", installed(), ids=lambda codec: codec.name)
+def test_envelope_round_trip(codec):
+    envelope = Envelope("host", codec)
+    data = {"cmd": ["cat"], "stdin": ["ä\n"], "nested": {"n": 1.5, "none": None}}
+    for to in ("!all-default", "drone0001", "!all-default"):
+        packet = envelope.encode(to, 42, "system", data)
+        assert json.loads(packet) == {
+            "from": "host",
+            "to": to,
+            "type": "system",
+            "seq": 42,
+            "data": data,
+        }
+        assert codec.loads(packet) == json.loads(packet)
+    assert set(envelope.prefixes) == {"!all-default", "drone0001"}
+    assert json.loads(envelope.encode("drone0001", 1, "sysinfo"))["data"] is None
+
+
+@pytest.mark.parametrize("codec", installed(), ids=lambda codec: codec.name)
+def test_non_str_keys_are_encoded_like_json(codec):
+    data = {"network": {1: "a", 2.5: "b", None: "c"}}
+    assert json.loads(codec.dumps(data)) == json.loads(JsonCodec().dumps(data))
+
+
+@pytest.mark.parametrize("codec", installed(), ids=lambda codec: codec.name)
+def test_invalid_packets_raise_codec_error(codec):
+    with pytest.raises(codec.error):
+        codec.loads(b'{"from": ')
+
+
+def test_falls_back_to_json(monkeypatch):
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    assert get_codec().name == "json"
@@ -0,0 +1,128 @@
+import json
+import logging
+import socket
+import threading
+import time
+
+import pytest
+
+from udronerc.config import load_config
+from udronerc.daemon import Daemon, _Handler, _Server
+
+
+@pytest.fixture
+def daemon(host, tmp_path, monkeypatch):
+    monkeypatch.setattr("udronerc.udronerc.get_host", lambda conf: host)
+    return Daemon({"hostid": "test", "daemon": str(tmp_path / "daemon.sock")})
+
+
+def run(daemon, path, tmp_path):
+    """Run a suite in the daemon, failing instead of hanging"""
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(
+            daemon.rpc_run(paths=[path], output=str(tmp_path / "results.json"))
+        ),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), f"Running {path} hangs"
+    return daemon.rpc_status()["groups"]
+
+
+def test_rerun_reuses_kept_group(daemon, write_suite, tmp_path, caplog):
+    path = write_suite("rerun", [{"sysinfo": {}}], drones_min=2, drones_max=2)
+    drones = run(daemon, path, tmp_path)["test_rerun"]
+    assert len(drones) == 2
+
+    caplog.set_level("INFO")
+    assert run(daemon, path, tmp_path)["test_rerun"] == drones
+    assert "Reusing 2 drones of group rerun" in caplog.text
+
+
+def test_suite_takes_back_drones_of_kept_groups(daemon, write_suite, tmp_path):
+    first = write_suite("first", [{"sysinfo": {}}], drones_min=4, drones_max=4)
+    second = write_suite("second", [{"sysinfo": {}}], drones_min=1, drones_max=1)
+    assert len(run(daemon, first, tmp_path)["test_first"]) == 4
+
+    groups = run(daemon, second, tmp_path)
+    assert len(groups["test_second"]) == 1
+    assert groups["test_first"] == []
+
+
+def test_disband_releases_kept_groups(daemon, write_suite, tmp_path, host):
+    path = write_suite("disband", [{"sysinfo": {}}], drones_min=2, drones_max=2)
+    run(daemon, path, tmp_path)
+    daemon.rpc_disband()
+    assert daemon.rpc_status()["groups"] == {}
+    assert host.leases.leased() == []
+    assert len(host.inventory.candidates()) == 4
+
+
+def test_forwards_only_logs_of_the_request(daemon, write_suite, tmp_path, caplog):
+    caplog.set_level("INFO")
+    server = _Server(str(daemon.path), _Handler)
+    server.daemon = daemon
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop = threading.Event()
+
+    def noise():
+        while not stop.wait(0.01):
+            logging.getLogger("udronerc.noise").warning("Other request")
+
+    threading.Thread(target=noise, daemon=True).start()
+    path = write_suite("logs", [{"sysinfo": {}}], drones_min=1, drones_max=1)
+    request = {
+        "method": "run",
+        "params": {"paths": [path], "output": str(tmp_path / "results.json")},
+        "log_level": logging.INFO,
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(daemon.path))
+            file = sock.makefile("rwb")
+            file.write((json.dumps(request) + "\n").encode("utf-8"))
+            file.flush()
+            logs = []
+            for line in file:
+                msg = json.loads(line)
+                if "log" not in msg:
+                    break
+                logs.append(msg["log"])
+    finally:
+        stop.set()
+        server.shutdown()
+        server.server_close()
+
+    assert "result" in msg
+    assert "TASK [sysinfo]" in logs
+    assert "Other request" not in logs
+
+
+def test_serve_cleans_up_when_disband_fails(daemon, host, monkeypatch):
+    def disband(reset=None):
+        raise SystemExit(1)
+
+    closed = []
+    monkeypatch.setattr("signal.signal", lambda *args: None)
+    monkeypatch.setattr(host, "disband", disband)
+    monkeypatch.setattr(host, "close", lambda: closed.append(True))
+
+    def stop():
+        while daemon.server is None or not daemon.path.exists():
+            time.sleep(0.01)
+        daemon.rpc_stop()
+
+    threading.Thread(target=stop, daemon=True).start()
+    daemon.serve()
+    assert closed == [True]
+    assert not daemon.path.exists()
+
+
+def test_daemon_socket_is_relative_to_config(tmp_path, monkeypatch):
+    config = tmp_path / "config.yml"
+    config.write_text("hostid: test\ndaemon: udronerc.sock\n")
+    monkeypatch.chdir("/")
+    assert load_config(config)["daemon"] == str(tmp_path / "udronerc.sock")
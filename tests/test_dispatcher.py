@@ -0,0 +1,31 @@
+import json
+import socket
+import time
+
+
+def test_malformed_datagrams_dropped(host):
+    group = host.Group("malformed")
+    group.assign(2)
+    port = host.sockets[0].getsockname()[1]
+    bad = [
+        {"from": ["drone0000"], "to": "test", "type": "status", "seq": 1},
+        {"from": {"a": 1}, "to": "test", "type": "status", "seq": 1},
+        {"from": "drone0000", "to": "test", "type": 1, "seq": 1},
+        {"from": "drone0000", "to": "test", "type": "status", "seq": [1]},
+        ["test"],
+        "test",
+    ]
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for msg in bad:
+            sock.sendto(json.dumps(msg).encode(), ("127.0.0.1", port))
+        sock.sendto(b"{test", ("127.0.0.1", port))
+
+    deadline = time.monotonic() + 2
+    while host.counters["malformed"] < len(bad) + 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert host.counters["malformed"] == len(bad) + 1
+    assert host.dispatcher.thread.is_alive()
+
+    results = group.call("sysinfo")
+    assert {r["status"] for r in results.values()} == {"ok"}
+    group.reset()
@@ -0,0 +1,30 @@
+from udronerc.dronegroup import evaluate
+from udronerc.dronehost import DroneHost
+from udronerc.message import Message
+from udronerc.udronerc import print_results
+
+
+def test_assign_takes_over_group_unknown_to_inventory(fleet, host):
+    drones = host.Group("kept").assign(2, board=None)
+
+    other = DroneHost("127.0.0.1", hostid="test", addr=fleet.addr)
+    try:
+        assert other.inventory.groups() == {}
+        group = other.Group("kept")
+        assert set(group.assign(2, board=None)) == set(drones)
+        group.reset()
+    finally:
+        other.close()
+
+
+def test_evaluate_marks_answers_of_unassigned_drones():
+    result = {
+        drone: Message(drone, "test", "sysinfo", 1, {"board": "generic"})
+        for drone in ("member", "left")
+    }
+    result["gone"] = None
+    result = evaluate(result, {"member", "gone"})
+    assert result["member"]["status"] == "ok"
+    assert result["left"]["status"] == "unknown"
+    assert result["gone"]["status"] == "unreachable"
+    print_results(result)
@@ -0,0 +1,92 @@
+from udronerc.constants import UDRONE_GROUP_DEFAULT
+from udronerc.dronehost import DroneHost
+from udronerc.simulator import DroneFleet
+
+
+def test_whois_waits_for_slow_replies_with_warm_rtt():
+    with DroneFleet(20, jitter=0.3, seed=0) as fleet:
+        host = DroneHost("127.0.0.1", hostid="test", addr=fleet.addr)
+        try:
+            host.rtt.sample("drone0000", 0.001)  # Minimal RTO
+            assert len(host.whois(UDRONE_GROUP_DEFAULT, need=20)) == 20
+        finally:
+            host.close()
+
+
+def test_unicast_retransmit(fleet, host):
+    group = host.Group("unicast")
+    group.assign(4)
+    fleet.drones["drone0003"].group = "elsewhere"  # Ignores group requests
+    try:
+        answers = host.call(
+            group.groupid,
+            None,
+            "sysinfo",
+            expect={"drone0002", "drone0003"},
+            retransmit=True,
+            members=8,
+        )
+        assert set(answers) == {"drone0002", "drone0003"}
+        assert host.metrics.state()["retransmits"] == {"sysinfo": 2}
+
+        # Too many pending drones are asked again on the group
+        answers = host.call(
+            group.groupid,
+            None,
+            "sysinfo",
+            expect={"drone0002", "drone0003"},
+            retransmit=True,
+            members=4,
+        )
+        assert "drone0002" in answers and "drone0003" not in answers
+        assert host.metrics.state()["retransmits"] == {"sysinfo": 3}
+    finally:
+        fleet.drones["drone0003"].group = group.groupid
+        group.reset()
+
+
+class _Link(object):
+    """Socket of one interface, reaching only the fleet on its network"""
+
+    def __init__(self, sock, addr):
+        self.socket = sock
+        self.addr = addr
+        self.sent = []
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+    def sendto(self, packet, addr):
+        self.sent.append(packet)
+        return self.socket.sendto(packet, self.addr)
+
+
+def test_routes_per_interface():
+    with DroneFleet(2, prefix="a", seed=0) as a, DroneFleet(2, prefix="b", seed=0) as b:
+        b.stop()
+        b.start(bind=("127.0.0.2", 0))
+        links = {"127.0.0.1": a.addr, "127.0.0.2": b.addr}
+
+        class Host(DroneHost):
+            def _open(self, local_ip=None):
+                return _Link(super()._open(local_ip), links[local_ip])
+
+        host = Host(["127.0.0.1", "127.0.0.2"], hostid="test")
+        try:
+            assert len(host.whois(UDRONE_GROUP_DEFAULT, need=4)) == 4
+            assert host.interface("a0000") == "127.0.0.1"
+            assert host.interface("b0001") == "127.0.0.2"
+
+            first, second = host.sockets
+            del first.sent[:], second.sent[:]
+            host.send("b0001", 1, "!whois")
+            assert not first.sent and len(second.sent) == 1
+
+            # Group messages leave on every interface, each is counted
+            before = host.metrics.state()["sent"]
+            host.send(UDRONE_GROUP_DEFAULT, 2, "!whois")
+            after = host.metrics.state()["sent"]
+            assert after["packets"] - before["packets"] == 2
+            assert after["bytes"] - before["bytes"] == 2 * len(first.sent[-1])
+        finally:
+            host.close()
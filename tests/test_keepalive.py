@@ -0,0 +1,33 @@
+import time
+
+from udronerc.keepalive import KeepAliveScheduler
+
+
+class Group(object):
+    def __init__(self, groupid, fail=False):
+        self.groupid = groupid
+        self.idle_intval = 0.05
+        self.last_activity = time.monotonic()
+        self.fail = fail
+        self.sent = 0
+
+    def _keepalive(self):
+        self.sent += 1
+        if self.fail:
+            raise ValueError("broken group")
+        self.last_activity = time.monotonic()
+
+
+def test_failing_group_keeps_other_keepalives_running(caplog):
+    scheduler = KeepAliveScheduler(slack=0)
+    broken, healthy = Group("broken", fail=True), Group("healthy")
+    scheduler.start()
+    try:
+        scheduler.add(broken)
+        scheduler.add(healthy)
+        time.sleep(0.5)
+    finally:
+        scheduler.stop()
+    assert healthy.sent >= 5
+    assert 2 <= broken.sent <= 11
+    assert "Keep-alive of broken failed" in caplog.text
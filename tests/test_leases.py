@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from udronerc.errors import DroneNotFoundError
+
+
+def test_release_serves_waiting_group(host):
+    first = host.Group("first")
+    with first.in_use():
+        assert len(first.assign(4, board=None)) == 4
+
+        leased = []
+        second = host.Group("second")
+        waiter = threading.Thread(
+            target=lambda: leased.extend(second.assign(2, board=None, timeout=10))
+        )
+        waiter.start()
+        first.reset()
+    waiter.join()
+    assert len(leased) == 2
+    assert set(host.leases.leased(second)) == set(leased)
+
+
+def test_acquire_gives_up_on_idle_groups(host):
+    idle = host.Group("idle")
+    idle.assign(4, board=None)
+    with pytest.raises(DroneNotFoundError):
+        host.Group("waiting").assign(1, board=None)
+    idle.reset()
+    assert host.leases.leased() == []
+
+
+def test_expired_leases_are_reclaimed(host):
+    running = host.Group("running")
+    abandoned = host.Group("abandoned")
+    abandoned.idle_intval = 0.1
+    with running.in_use():
+        running.assign(2, board=None)
+        drones = abandoned.assign(2, board=None)
+        host.keepalive.remove(abandoned)
+
+        reclaimed = host.Group("reclaimed").assign(2, board=None, timeout=10)
+    assert set(reclaimed) == set(drones)
+    assert abandoned.assigned_drones == set()
+
+
+def test_run_suites_shares_drones_per_call(host, write_suite):
+    from udronerc.udronerc import run_suites
+
+    tasks = [{"sysinfo": {}}]
+    paths = [
+        write_suite(name, tasks, drones_min=1, drones_max=4) for name in ("a", "b")
+    ]
+    results = run_suites(host, paths, parallel=2)
+    for path in paths:
+        (task, answers), = results[path]
+        assert len(answers) == 2
+    assert host.leases.slots == 1
+
+
+def test_keepalives_renew_leases_of_idle_groups(host):
+    idle = host.Group("idle")
+    idle.idle_intval = 0.1
+    drones = idle.assign(2, board=None)
+    host.keepalive.add(idle)
+    running = host.Group("running")
+    with running.in_use():
+        running.assign(2, board=None)
+        with pytest.raises(DroneNotFoundError):
+            host.Group("waiting").assign(2, board=None, timeout=1)
+    assert set(host.leases.leased(idle)) == set(drones)
+    assert idle.assigned_drones == set(drones)
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from udronerc.message import Message, jsonable
+
+
+def test_dict_like_access():
+    msg = Message.from_dict(
+        {"from": "drone0000", "to": "host", "type": "status", "seq": 7, "data": {}}
+    )
+    assert msg["from"] == msg.sender == "drone0000"
+    assert msg["data"] == {}
+    assert msg.get("data", "default") == {}
+    assert msg.get("status", "default") == "default"
+    assert "status" not in msg and "from" in msg
+    with pytest.raises(KeyError):
+        msg["status"]
+    with pytest.raises(KeyError):
+        msg["unknown"]
+    assert msg.get("unknown") is None
+
+    msg["status"] = "ok"
+    assert msg["status"] == "ok" and "status" in msg
+
+
+def test_to_dict_round_trip():
+    packet = {"from": "drone0000", "to": "host", "type": "sysinfo", "seq": 1}
+    msg = Message.from_dict({**packet, "data": {"board": "generic"}})
+    assert msg.to_dict() == {**packet, "data": {"board": "generic"}}
+    assert Message.from_dict(msg.to_dict()) == msg
+
+    msg.status, msg.latency = "ok", 0.5
+    assert msg.to_dict()["status"] == "ok"
+    expected = {**packet, "data": {"board": "generic"}, "status": "ok", "latency": 0.5}
+    assert msg == expected
+    assert json.loads(json.dumps({"d": msg}, default=jsonable))["d"] == msg.to_dict()
+    with pytest.raises(TypeError):
+        jsonable(object())
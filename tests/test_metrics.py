@@ -0,0 +1,48 @@
+import json
+import re
+
+from udronerc.metrics import Histogram
+from udronerc.udronerc import run_paths
+
+
+def test_histogram_buckets_and_quantiles():
+    h = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 0.7, 2):
+        h.observe(value)
+    assert h.counts == [2, 2, 1]  # Upper bounds are inclusive
+    assert (h.count, h.min, h.max) == (5, 0.05, 2)
+    assert abs(h.sum - 3.35) < 1e-9
+    assert h.quantile(0.4) == 0.1
+    assert 0.1 < h.quantile(0.6) < 1
+    assert h.quantile(1) == 2
+    assert Histogram().quantile(0.5) is None
+
+    merged = Histogram(buckets=(0.1, 1))
+    merged.merge(h)
+    merged.observe(0.01)
+    assert merged.counts == [3, 2, 1] and merged.min == 0.01
+
+
+def test_suite_metrics_files(host, tmp_path, write_suite):
+    suite = write_suite("metrics", [{"sysinfo": {}}], drones_min=2, drones_max=2)
+    output = tmp_path / "results.json"
+    run_paths(host, [suite], output=output, metrics=tmp_path / "metrics.json")
+    run_paths(host, [suite], output=output, metrics=tmp_path / "metrics.prom")
+
+    state = json.loads((tmp_path / "metrics.json").read_text())
+    assert state["latency"]["type"]["sysinfo"]["count"] == 2
+    assert len(state["latency"]["drone"]) >= 2  # Also drones answering !whois
+
+    text = (tmp_path / "metrics.prom").read_text()
+    assert "# TYPE udronerc_type_latency_seconds histogram" in text
+    buckets = re.findall(
+        r'udronerc_type_latency_seconds_bucket\{type="sysinfo",le="([^"]+)"\} (\d+)',
+        text,
+    )
+    assert buckets[-1] == ("+Inf", "4")  # Cumulative over both runs
+    counts = [int(count) for _, count in buckets]
+    assert counts == sorted(counts)
+    assert 'udronerc_type_latency_seconds_count{type="sysinfo"} 4' in text
+    sample = re.compile(r'^udronerc_\w+(\{(\w+="[^"]*",?)+\})? [-+.\deE]+$')
+    for line in text.splitlines():
+        assert line.startswith("# ") or sample.match(line), line
@@ -0,0 +1,29 @@
+import json
+
+from udronerc.store import ResultStore
+from udronerc.udronerc import run_paths
+
+
+def test_db_keeps_results_json(host, tmp_path, write_suite):
+    suite = write_suite("info", [{"sysinfo": {}}], drones_max=2)
+    output = tmp_path / "results.json"
+    run_paths(host, [suite], output=output, db=tmp_path / "results.db")
+
+    results = json.loads(output.read_text())
+    assert len(results) == 1
+    task, responses = results[0]
+    assert task == {"sysinfo": {}}
+    assert {r["status"] for r in responses.values()} == {"ok"}
+    with ResultStore(tmp_path / "results.db") as store:
+        assert len(store.query(task="sysinfo")) == len(responses)
+
+
+def test_jsonl_streams(host, tmp_path, write_suite):
+    suite = write_suite("info", [{"sysinfo": {}}], drones_max=2)
+    output = tmp_path / "results.jsonl"
+    run_paths(host, [suite], output=output)
+    run_paths(host, [suite], output=output)  # Replaces the previous run
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(records) == 2
+    assert {r["cmd"] for r in records} == {"sysinfo"}
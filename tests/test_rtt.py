@@ -0,0 +1,38 @@
+from udronerc.dronehost import DroneHost
+from udronerc.rtt import RttEstimator
+from udronerc.simulator import DroneFleet
+
+
+def test_estimator_backoff():
+    estimator = RttEstimator(initial=0.5, minimum=0.05, maximum=8)
+    estimator.sample(0.1)
+    assert estimator.srtt == 0.1
+    rto = estimator.timeout()
+    estimator.expired()
+    assert estimator.timeout() == 2 * rto
+    estimator.sample(0.1)
+    assert estimator.backoff == 0
+
+
+def test_command_runtime_not_sampled():
+    with DroneFleet(2, accept_delay=0.3, seed=0) as fleet:
+        host = DroneHost("127.0.0.1", hostid="test", addr=fleet.addr)
+        group = host.Group("rtt")
+        group.assign(2)
+        samples = {d: host.rtt.get(d).samples for d in group.assigned_drones}
+        assert all(samples.values())
+
+        results = group.call("sysinfo")
+        assert {r["status"] for r in results.values()} == {"ok"}
+        for drone, count in samples.items():
+            assert host.rtt.get(drone).samples == count
+
+        results = group.call("system", {"cmd": ["true"]})
+        assert {r["status"] for r in results.values()} == {"ok"}
+        for drone in group.assigned_drones:
+            estimator = host.rtt.get(drone)
+            assert estimator.samples == samples[drone] + 1  # The accept only
+            assert estimator.srtt < 0.3
+
+        group.reset()
+        host.close()
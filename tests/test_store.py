@@ -0,0 +1,54 @@
+import subprocess
+import sys
+
+from udronerc.store import ResultStore
+
+
+def test_store_imports_no_transport():
+    code = (
+        "import sys, udronerc.store; "
+        "print(' '.join(m for m in sys.modules if m.startswith('udronerc')))"
+    )
+    loaded = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.split()
+    assert "udronerc.store" in loaded
+    assert "udronerc.bench" not in loaded
+    assert "udronerc.dronehost" not in loaded
+
+
+def test_summary(tmp_path):
+    with ResultStore(tmp_path / "results.db") as store:
+        suite = {"id": "suite"}
+        for latency in (0.1, 0.2, 0.3):
+            store.write(
+                suite,
+                0,
+                {"name": "info", "sysinfo": {}},
+                {"drone0000": {"status": "ok", "latency": latency}},
+            )
+        store.write(
+            suite,
+            0,
+            {"name": "info", "sysinfo": {}},
+            {"drone0000": {"status": "failed"}},
+        )
+        rows = store.query(drone="drone0000")
+        (summary,) = store.summary(rows)
+        assert summary["count"] == 4
+        assert summary["failed"] == 1
+        assert summary["p50"] == 0.2
+
+
+def test_runs_of_the_same_suite_are_separate(host, write_suite, tmp_path):
+    from udronerc.udronerc import run_suite, run_suites
+
+    tasks = [{"sysinfo": {}}]
+    paths = [write_suite(name, tasks, id="same") for name in ("a", "b")]
+    with ResultStore(tmp_path / "results.db") as store:
+        run_suites(host, paths, parallel=2, writer=store)
+        run_suite(host, paths[0], writer=store)
+        runs = store.db.execute("SELECT suite, COUNT(*) FROM runs GROUP BY suite")
+        assert runs.fetchall() == [("same", 3)]
+        tasks = store.db.execute("SELECT run_id, COUNT(*) FROM tasks GROUP BY run_id")
+        assert [count for _, count in tasks.fetchall()] == [1, 1, 1]
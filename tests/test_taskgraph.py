@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+
+import pytest
+
+from udronerc.commands import task_command, task_name
+from udronerc.soak import SoakWriter
+from udronerc.store import ResultStore
+from udronerc.taskgraph import TaskGraph
+from udronerc.udronerc import run_paths, run_suite
+
+TASKS = [
+    {"id": "probe", "sysinfo": {}},
+    {"id": "hello", "depends_on": [], "system": {"cmd": ["echo"]}},
+    {"name": "Check", "depends_on": ["probe", "hello"], "sysinfo": {}},
+]
+
+
+def test_task_command():
+    assert task_command(TASKS[0]) == "sysinfo"
+    assert task_name(TASKS[0]) == "probe"
+    assert task_command(TASKS[2]) == "sysinfo"
+    assert task_name(TASKS[2]) == "Check"
+    assert task_command({"name": "x"}) is None
+    assert task_command({"sysinfo": {}, "system": {}}) is None
+
+
+def test_dependencies():
+    graph = TaskGraph(
+        [
+            {"id": "a", "sysinfo": {}},
+            {"parallel": [{"id": "b", "sysinfo": {}}, {"id": "c", "sysinfo": {}}]},
+            {"id": "d", "sysinfo": {}},
+            {"id": "e", "depends_on": "a", "sysinfo": {}},
+        ]
+    )
+    assert graph.depends == [set(), {0}, {0}, {1, 2}, {0}]
+
+
+def test_cycle():
+    with pytest.raises(SystemExit):
+        TaskGraph(
+            [
+                {"id": "a", "depends_on": ["b"], "sysinfo": {}},
+                {"id": "b", "depends_on": ["a"], "sysinfo": {}},
+            ]
+        )
+
+
+def test_parallel_block_runs_concurrently():
+    graph = TaskGraph([{"parallel": [{"id": str(i), "sysinfo": {}} for i in range(3)]}])
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def run_task(task):
+        with lock:
+            running.append(task["id"])
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(task["id"])
+        return task["id"]
+
+    results = graph.run(run_task, concurrency=3)
+    assert [r for _, r in results] == ["0", "1", "2"]
+    assert max(peak) == 3
+
+
+def test_task_ids_recorded(host, tmp_path, write_suite):
+    suite = write_suite("dag", TASKS, drones_max=2)
+    output = tmp_path / "results.jsonl"
+    run_paths(host, [suite], output=output, db=tmp_path / "results.db")
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert {(r["task"], r["cmd"]) for r in records} == {
+        ("probe", "sysinfo"),
+        ("hello", "system"),
+        ("Check", "sysinfo"),
+    }
+    with ResultStore(tmp_path / "results.db") as store:
+        rows = store.query()
+        assert {(r["task"], r["cmd"]) for r in rows} == {
+            ("probe", "sysinfo"),
+            ("hello", "system"),
+            ("Check", "sysinfo"),
+        }
+
+    soak = SoakWriter(interval=3600)
+    run_suite(host, suite, writer=soak)
+    assert set(soak.state()["tasks"]) == {"dag/probe", "dag/hello", "dag/Check"}
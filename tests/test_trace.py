@@ -0,0 +1,25 @@
+import json
+
+from udronerc.udronerc import run_paths
+
+
+def test_suite_trace_file(host, tmp_path, write_suite):
+    tasks = [{"sysinfo": {}}, {"system": {"cmd": ["true"]}}]
+    suite = write_suite("trace", tasks, drones_min=2, drones_max=2)
+    trace = tmp_path / "trace.json"
+    run_paths(host, [suite], output=tmp_path / "results.json", trace=trace)
+
+    content = json.loads(trace.read_text())
+    assert content["displayTimeUnit"] == "ms"
+    events = content["traceEvents"]
+    names = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    spans = [e for e in events if e["ph"] == "X"]
+    for event in spans:
+        assert {"name", "cat", "ts", "dur", "pid", "tid", "args"} <= set(event)
+        assert event["ts"] >= 0 and event["dur"] >= 0
+        assert event["tid"] in names
+    tasks = {e["name"]: e for e in spans if e["cat"] == "task"}
+    assert set(tasks) == {"sysinfo", "system"}
+    assert tasks["system"]["args"]["cmd"] == "system"
+    assert any(e["cat"] == "round" for e in spans)
+    assert not host.tracer  # Disabled again after the run
@@ -0,0 +1,42 @@
+from udronerc.dronehost import DroneHost
+from udronerc.modules.waitfor import wait_for
+from udronerc.simulator import DroneFleet
+from udronerc.udronerc import service
+
+
+def test_wait_for_network_restart():
+    with DroneFleet(3, restart_delay=0.6, seed=0) as fleet:
+        host = DroneHost("127.0.0.1", hostid="test", addr=fleet.addr)
+        group = host.Group("wait")
+        group.assign(3)
+        service(group, "network", "restart")
+
+        results = wait_for(group, timeout=5, interval=0.1, checkip={"interface": "lan"})
+        assert {r["status"] for r in results.values()} == {"ok"}
+        assert all(0.2 < r["latency"] < 2 for r in results.values())
+
+        group.reset()
+        host.close()
+
+
+def test_wait_for_timeout(host):
+    group = host.Group("wait")
+    group.assign(2)
+    results = wait_for(
+        group, timeout=0.5, interval=0.1, system={"cmd": ["false"]}, until={"code": 1}
+    )
+    assert {r["status"] for r in results.values()} == {"failed"}
+    group.reset()
+
+
+def test_wait_for_uci_set(host):
+    group = host.Group("wait")
+    group.assign(2)
+    data = {"system": {"@system[0]": {"hostname": "waited"}}}
+    results = wait_for(group, timeout=3, interval=0.1, uci_set={"data": data})
+    assert {r["status"] for r in results.values()} == {"ok"}
+
+    # Unchanged options are answered from the UCI cache without a request
+    results = wait_for(group, timeout=3, interval=0.1, uci_set={"data": data})
+    assert {r["status"] for r in results.values()} == {"ok"}
+    group.reset()
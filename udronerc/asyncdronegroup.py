@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from errno import ENOENT, ETIMEDOUT
+
+from .constants import UDRONE_GROUP_DEFAULT, UDRONE_IDLE_INTVAL
+from .dronegroup import evaluate
+from .errors import DroneNotFoundError, DroneNotReachableError
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDroneGroup(object):
+    """asyncio counterpart of `DroneGroup`
+
+    The keep-alive runs as a task on the event loop of the host and is
+    postponed by every request of the group. Groups must be created from
+    within a running event loop.
+    """
+
+    def __init__(self, host, groupid: str):
+        """
+        Args:
+            host (AsyncDroneHost): Opened drone host
+            groupid (str): Unique identifier for the group
+        """
+        self.host = host
+        self.groupid = groupid
+        self.idle_intval = UDRONE_IDLE_INTVAL
+        self.seq = self.host.genseq()
+        self.assigned_drones = set()
+        self.loop = asyncio.get_running_loop()
+        self.last_activity = self.loop.time()
+        self.keepalive = self.loop.create_task(self._keepalive())
+        logger.debug(f"Group {self.groupid} created.")
+
+    def stop(self):
+        """Stop the keep-alive task"""
+        self.keepalive.cancel()
+
+    def _touch(self):
+        self.last_activity = self.loop.time()
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(
+                max(self.last_activity + self.idle_intval - self.loop.time(), 0)
+            )
+            if self.loop.time() - self.last_activity < self.idle_intval:
+                continue
+            logger.debug("Group %s keep-alive triggered", self.groupid)
+            if len(self.assigned_drones) > 0:
+                await self.host.whois(self.groupid, need=0, seq=0)
+            self._touch()
+
+    async def _assign_drones(self, drones: list) -> set:
+        """Send `!assign` command to list of drones
+
+        Args:
+            drones (list): List of drone IDs to assign to the group
+
+        Returns:
+            set: Set of successfully assigned drones
+        """
+        logger.debug(f"Assign {drones} to {self.groupid}")
+        responses = await self.host.call_multi(
+            drones, None, "!assign", {"group": self.groupid, "seq": self.seq}, "status"
+        )
+        assigned_drones = set()
+        for drone_id, response in responses.items():
+            if response["data"]["code"] == 0:
+                assigned_drones.add(drone_id)
+                self.assigned_drones.add(drone_id)
+
+        return assigned_drones
+
+    async def assign(
+        self, min_drones: int = 1, max_drones: int = None, board: str = "generic"
+    ) -> list:
+        """Assign new drones to a group
+
+        Args:
+            max_drones (int): Maximal number of drones required
+            min_drones (int): Mimimal number of drones required
+            board (str): Limit assignment to specific board
+
+        Returns:
+            list: New member of group
+        """
+        logger.debug(
+            f"Assign {min_drones}/{max_drones} {board} drones to {self.groupid}"
+        )
+        self._touch()
+
+        if not max_drones:
+            max_drones = min_drones
+
+        ingroup = await self.host.whois(self.groupid, max_drones, board=board)
+
+        if max_drones >= len(ingroup) >= min_drones:
+            self.assigned_drones.update(ingroup.keys())
+            return list(ingroup.keys())
+
+        new_members = set()
+        for _ in range(2):
+            need = max_drones - len(new_members)
+            available = list(
+                (await self.host.whois(UDRONE_GROUP_DEFAULT, need, board=board)).keys()
+            )[:need]
+            new_members |= await self._assign_drones(available)
+            if len(new_members) >= min_drones:
+                return list(new_members)
+
+        if len(new_members) > 0:  # Rollback
+            await self.host.call_multi(new_members, None, "!reset", None, "status")
+            self.assigned_drones -= new_members
+        raise DroneNotFoundError((ENOENT, "You must construct additional drones"))
+
+    async def reset(self, reset=None):
+        if len(self.assigned_drones) < 1:
+            return
+        expect = self.assigned_drones.copy()
+        await self.host.reset(self.groupid, reset, expect)
+        self.assigned_drones = expect
+        if len(expect) > 0:
+            raise DroneNotReachableError((ETIMEDOUT, "Request Timeout"))
+
+    async def request(self, msg_type, data=None, timeout=60):
+        if len(self.assigned_drones) < 1:
+            raise DroneNotFoundError((ENOENT, "Drone group is empty"))
+        if msg_type[0] != "!":
+            self.seq += 1
+            seq = self.seq
+        else:
+            seq = self.host.genseq()
+
+        with self.host.subscribe(seq):
+            return await self._request(seq, msg_type, data, timeout)
+
+    async def _request(self, seq, msg_type, data, timeout):
+        pending = self.assigned_drones.copy()
+        i = 0
+        answers = {}
+        accepts = {}
+        deadline = self.loop.time() + timeout
+        started = time.monotonic()
+        self._touch()
+
+        while len(pending) > 0 and self.loop.time() < deadline:
+            expect = pending.copy()
+            i += 1
+            if i % 2 == 1:
+                answers.update(
+                    await self.host.call(
+                        self.groupid,
+                        seq,
+                        msg_type,
+                        data,
+                        expect=expect,
+                        deadline=deadline,
+                        retransmit=i > 1,
+                        members=len(self.assigned_drones),
+                        started=started,
+                    )
+                )
+            else:
+                await self.host.recv_until(
+                    answers,
+                    seq,
+                    expect=expect,
+                    timeout=min(10, deadline - self.loop.time()),
+                )
+                self.host.observe(answers, msg_type, started)
+
+            for drone in expect:  # Timed out
+                answers[drone] = None
+            for drone, ans in answers.items():
+                if ans and ans["type"] == "accept":
+                    answers[drone] = None  # In Progress
+                    accepts[drone] = accepts.get(drone, 0) + 1
+                    self.host.metrics.accepted(msg_type)
+                elif drone in pending and ans is not None:
+                    pending.remove(drone)
+            self._touch()
+
+        for drone, count in accepts.items():
+            if answers.get(drone) is not None:
+                answers[drone].accepts = count
+        return answers
+
+    async def call(self, msg_type, data=None, timeout=60):
+        return evaluate(
+            await self.request(msg_type, data, timeout), self.assigned_drones
+        )
@@ -0,0 +1,418 @@
+import asyncio
+import binascii
+import logging
+import os
+import socket
+import struct
+import time
+from contextlib import contextmanager
+
+from .constants import (
+    UDRONE_ADDR,
+    UDRONE_MAX_DGRAM,
+    UDRONE_RESENT_ATTEMPTS,
+    UDRONE_UNICAST_RATIO,
+    UDRONE_WHOIS_WINDOW,
+)
+from .asyncdronegroup import AsyncDroneGroup
+from .codec import Envelope, get_codec
+from .hostbase import HostBase
+from .metrics import Metrics
+from .rtt import RttTable
+
+logger = logging.getLogger(__name__)
+
+
+class DroneProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol handing received packets to an `AsyncDroneHost`"""
+
+    def __init__(self, host):
+        self.host = host
+
+    def datagram_received(self, packet: bytes, addr: tuple):
+        self.host.received(packet)
+
+    def error_received(self, exc: Exception):
+        logger.debug(f"Socket error: {exc}")
+
+
+class AsyncDroneHost(HostBase):
+    """asyncio counterpart of `DroneHost`
+
+    Replies are routed by sequence number to per-call queues, so any number
+    of calls, groups and keep-alives may be awaited concurrently on a single
+    event loop. Call `open` (or use `async with`) before sending.
+    """
+
+    def __init__(self, local_ip=None, hostid=None, addr=None, codec=None):
+        if not hostid:
+            self.hostid = f"udronerc_{binascii.hexlify(os.urandom(3)).decode()}"
+        else:
+            self.hostid = hostid
+
+        self.local_ip = local_ip
+        self.addr = addr or UDRONE_ADDR
+        self.resent_attempts = UDRONE_RESENT_ATTEMPTS
+        self.rtt = RttTable()
+        self.unicast_ratio = UDRONE_UNICAST_RATIO
+        self.maxsize = UDRONE_MAX_DGRAM
+        self.codec = get_codec(codec)
+        self.envelope = Envelope(self.hostid, self.codec)
+        self.transport = None
+        self.waiters = {}
+        self.hostid_bytes = self.hostid.encode("utf-8")
+        self.counters = {
+            "packets": 0,
+            "bytes": 0,
+            "foreign": 0,
+            "malformed": 0,
+            "dropped": 0,
+        }
+        self.metrics = Metrics(self.counters)
+        self.groups = []
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    async def open(self):
+        """Create the socket and start receiving"""
+        logger.info(f"Initializing host on {self.local_ip} with ID {self.hostid}")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("", 0))
+        if self.local_ip:
+            sock.setsockopt(
+                socket.SOL_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.local_ip)
+            )
+        sock.setblocking(0)
+        self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: DroneProtocol(self), sock=sock
+        )
+
+    def close(self):
+        for group in self.groups:
+            group.stop()
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    def genseq(self) -> int:
+        """
+        Generate random sequence number
+
+        Returns:
+            int: generated sequence
+        """
+        return struct.unpack("=I", os.urandom(4))[0] % 2000000000
+
+    def send(self, to: str, seq: int, msg_type: str, data: dict = {}):
+        """
+        Send message to drone
+
+        Args:
+            to (str): receiving group
+            seq (int): sequence number
+            msg_type (str): type of message to receive
+            data (dict): data to send to node
+        """
+        packet = self.envelope.encode(to, seq, msg_type, data)
+        logger.debug("Sending: %s", packet)
+        self.transport.sendto(packet, self.addr)
+        self.metrics.send(len(packet))
+
+    def received(self, packet: bytes):
+        """Route a received packet to the queue waiting for its sequence
+
+        Packets not containing the host ID are dropped before decoding.
+
+        Args:
+            packet (bytes): Raw datagram
+        """
+        self.counters["packets"] += 1
+        self.counters["bytes"] += len(packet)
+        if self.hostid_bytes not in packet:
+            self.counters["foreign"] += 1
+            return
+
+        msg = self.decode(packet)
+        if msg is None:
+            return
+        if msg.to != self.hostid:
+            self.counters["foreign"] += 1
+            return
+        queue = self.waiters.get(msg.seq)
+
+        logger.debug("Received: %s", msg)
+        msg.received = time.monotonic()
+        if queue is None:
+            self.counters["dropped"] += 1
+            return
+        queue[0].put_nowait(msg)
+
+    @contextmanager
+    def subscribe(self, seq: int):
+        """Receive messages of a sequence for the duration of a with block
+
+        Args:
+            seq (int): Sequence number to receive
+
+        Returns:
+            asyncio.Queue: Queue of received messages
+        """
+        waiter = self.waiters.setdefault(seq, [asyncio.Queue(), 0])
+        waiter[1] += 1
+        try:
+            yield waiter[0]
+        finally:
+            waiter[1] -= 1
+            if waiter[1] == 0:
+                del self.waiters[seq]
+
+    def _remaining(self, timeout: float, deadline: float = None) -> float:
+        if deadline is None:
+            return timeout
+        return min(timeout, deadline - asyncio.get_running_loop().time())
+
+    async def recv_until(
+        self,
+        answers: dict,
+        seq: int,
+        msg_type: str = None,
+        timeout: float = 1,
+        expect: set = None,
+        sent: float = None,
+        request: str = None,
+    ):
+        """
+        Recevie messages from drones until requirement is fulfilled
+
+        Args:
+            answers (dict): Empty dict to be filled with received answers
+            seq (int): sequence number
+            msg_type (str): type of message to receive
+            timeout (float): number of seconds before receiving timeouts
+            expect (set): drones expected to anser
+            sent (float): event loop time the request was sent, used to
+                sample round trip times if the request was not retransmitted
+            request (str): type of the request, required to sample round trip
+                times
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        with self.subscribe(seq) as queue:
+            while expect is None or len(expect) > 0:
+                try:
+                    msg = await asyncio.wait_for(queue.get(), end - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                if msg_type and msg.type != msg_type:
+                    continue
+                if sent and request and msg.sender not in answers:
+                    self.sample(msg, request, loop.time() - sent)
+                answers[msg.sender] = msg
+                if expect is not None and msg.sender in expect:
+                    expect.remove(msg.sender)
+
+    async def call(
+        self,
+        to: str,
+        seq: int,
+        msg_type: str,
+        data: dict = None,
+        resp_type: str = None,
+        expect: set = None,
+        deadline: float = None,
+        retransmit: bool = False,
+        members: int = None,
+        started: float = None,
+    ) -> dict:
+        """
+        Send data to drone and receive response
+
+        Args:
+            to (str): selected group
+            seq (int): sequence number
+            msg_type (str): send message of type
+            data (dict): data to send to group
+            resp_type (str): receive message of type
+            expect (set): drones expected to anser
+            deadline (float): event loop time after which to stop waiting
+            retransmit (bool): the sequence was sent before
+            members (int): number of drones in the group, defaults to the
+                number of expected drones
+            started (float): monotonic time the sequence was first sent,
+                latencies are measured from it
+
+        Returns:
+            dict: received message from drones
+        """
+        if not seq:
+            seq = self.genseq()
+
+        loop = asyncio.get_running_loop()
+        answers = {}
+        if expect is not None and members is None:
+            members = len(expect)
+        if started is None:
+            started = time.monotonic()
+        with self.subscribe(seq):
+            for attempt in range(self.resent_attempts):
+                timeout = self._remaining(self.rtt.timeout(expect), deadline)
+                if timeout <= 0:
+                    break
+                sent = loop.time() if attempt == 0 and not retransmit else None
+                if (attempt > 0 or retransmit) and self.unicast(expect, members):
+                    for drone in list(expect):
+                        self.send(drone, seq, msg_type, data)
+                    self.metrics.retransmit(msg_type, len(expect))
+                else:
+                    self.send(to, seq, msg_type, data)
+                    if attempt > 0 or retransmit:
+                        self.metrics.retransmit(msg_type)
+                await self.recv_until(
+                    answers, seq, resp_type, timeout, expect, sent, msg_type
+                )
+                if expect is not None and len(expect) == 0:
+                    break
+                if expect:
+                    self.rtt.expired(expect)
+        for drone in expect or ():
+            self.metrics.timeout(drone)
+        self.observe(answers, msg_type, started)
+        return answers
+
+    async def call_multi(
+        self,
+        nodes: set,
+        seq: int,
+        msg_type: str,
+        data: dict = None,
+        resp_type: str = None,
+        deadline: float = None,
+        retransmit: bool = False,
+    ) -> dict:
+        """
+        Send data to multiple drones and receive responses
+
+        Args:
+            nodes (set): selected drones
+            seq (int): sequence number
+            msg_type (str): send message of type
+            data (dict): data to send to group
+            resp_type (str): receive message of type
+            deadline (float): event loop time after which to stop waiting
+            retransmit (bool): the sequence was sent before
+
+        Returns:
+            dict: received message from drones
+        """
+        if not seq:
+            seq = self.genseq()
+
+        loop = asyncio.get_running_loop()
+        answers = {}
+        started = time.monotonic()
+        with self.subscribe(seq):
+            for attempt in range(self.resent_attempts):
+                timeout = self._remaining(self.rtt.timeout(nodes), deadline)
+                if timeout <= 0:
+                    break
+                sent = loop.time() if attempt == 0 and not retransmit else None
+                for node in nodes:
+                    self.send(node, seq, msg_type, data)
+                if attempt > 0 or retransmit:
+                    self.metrics.retransmit(msg_type, len(nodes))
+                await self.recv_until(
+                    answers, seq, resp_type, timeout, nodes, sent, msg_type
+                )
+                if len(nodes) == 0:
+                    break
+                self.rtt.expired(nodes)
+        for node in nodes:
+            self.metrics.timeout(node)
+        self.observe(answers, msg_type, started)
+        return answers
+
+    async def whois(
+        self,
+        group: str,
+        need: int = 1,
+        seq: int = None,
+        board: str = None,
+        deadline: float = None,
+    ) -> dict:
+        """
+        Return online drones
+
+        Args:
+            group (str): limit request to specific group
+            need (int): minimum number of ansers
+            seq (int): sequence number
+            board (str): limit request to specific board
+            deadline (float): event loop time after which to stop waiting
+
+        Returns:
+            dict: received answers of boards
+        """
+        logger.debug(f"Group {group} needs {need} {board} drones")
+        answers = {}
+        if seq is None:
+            seq = self.genseq()
+        data = {}
+        if board:
+            data["board"] = board
+
+        if need == 0:
+            self.send(group, seq, "!whois", data)
+            return answers
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        with self.subscribe(seq):
+            for attempt in range(self.resent_attempts):
+                window = max(self.rtt.timeout(), UDRONE_WHOIS_WINDOW)
+                timeout = self._remaining(window, deadline)
+                if timeout <= 0:
+                    break
+                sent = loop.time() if attempt == 0 else None
+                self.send(group, seq, "!whois", data)
+                if attempt > 0:
+                    self.metrics.retransmit("!whois")
+                await self.recv_until(
+                    answers, seq, "status", timeout, sent=sent, request="!whois"
+                )
+                if need and len(answers) >= need:
+                    break
+
+        self.observe(answers, "!whois", started)
+        return answers
+
+    async def reset(self, whom, how=None, expect=None):
+        data = {"how": how} if how else None
+        return await self.call(whom, None, "!reset", data, "status", expect)
+
+    def Group(self, groupid: str, absolute: bool = False):
+        """Create new group
+
+        Args:
+            groupid (str): Name of the new group
+            absolute (bool): Prefix group name with hostid
+
+        Returns:
+            AsyncDroneGroup: Newly created group
+        """
+        if not absolute:
+            groupid = f"{self.hostid}_{groupid}"
+
+        group = AsyncDroneGroup(self, groupid)
+        self.groups.append(group)
+        return group
+
+    async def disband(self, reset=None):
+        await asyncio.gather(*[group.reset(reset) for group in self.groups])
+        for group in self.groups:
+            group.stop()
+        self.groups = []
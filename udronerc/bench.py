@@ -0,0 +1,277 @@
+import itertools
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .constants import BENCH_OPERATIONS, UDRONE_GROUP_DEFAULT
+from .errors import DroneNotFoundError
+from .dronehost import DroneHost
+from .metrics import percentile
+from .simulator import DroneFleet
+
+logger = logging.getLogger(__name__)
+
+
+def scenario_matrix(drones: list, loss: list, payload: list) -> list:
+    """Create all combinations of fleet size, loss rate and payload size
+
+    Returns:
+        list: Scenario dicts
+    """
+    return [
+        {"drones": d, "loss": l, "payload": p}
+        for d, l, p in itertools.product(drones, loss, payload)
+    ]
+
+
+class Measurement(object):
+    """Collect timings and message counts of a benchmarked operation"""
+
+    def __init__(self, fleet: DroneFleet):
+        self.fleet = fleet
+        self.latencies = []
+        self.errors = 0
+        self.messages = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self):
+        self._messages = self.fleet.rx_packets + self.fleet.tx_packets
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall += time.perf_counter() - self._wall
+        self.cpu += time.process_time() - self._cpu
+        self.messages += self.fleet.rx_packets + self.fleet.tx_packets - self._messages
+        if exc_type in (SystemExit, DroneNotFoundError):
+            logger.warning(f"Benchmark aborted: {exc_value}")
+            self.errors += 1
+            return True
+
+    def sample(self, start: float):
+        self.latencies.append(time.perf_counter() - start)
+
+    def report(self) -> dict:
+        """Summarize the measurement
+
+        The CPU time covers the whole process and therefore includes the
+        simulated fleet answering the requests.
+
+        Returns:
+            dict: Latency percentiles, throughput and CPU usage
+        """
+        return {
+            "samples": len(self.latencies),
+            "errors": self.errors,
+            "p50": percentile(self.latencies, 50),
+            "p95": percentile(self.latencies, 95),
+            "p99": percentile(self.latencies, 99),
+            "messages": self.messages,
+            "msgs_per_sec": self.messages / self.wall if self.wall else 0.0,
+            "cpu_per_msg": self.cpu / self.messages if self.messages else 0.0,
+        }
+
+
+def bench_whois(host: DroneHost, fleet: DroneFleet, scenario: dict, iterations: int):
+    m = Measurement(fleet)
+    for _ in range(iterations):
+        with m:
+            start = time.perf_counter()
+            host.whois(UDRONE_GROUP_DEFAULT, need=scenario["drones"])
+            m.sample(start)
+    return m
+
+
+def bench_assign(host: DroneHost, fleet: DroneFleet, scenario: dict, iterations: int):
+    m = Measurement(fleet)
+    for i in range(iterations):
+        group = host.Group(f"bench_assign_{i}")
+        with m:
+            start = time.perf_counter()
+            group.assign(1, scenario["drones"])
+            m.sample(start)
+        group.reset()
+    return m
+
+
+def bench_call(host: DroneHost, fleet: DroneFleet, scenario: dict, iterations: int):
+    group = host.Group("bench_call")
+    group.assign(1, scenario["drones"])
+    data = {"cmd": ["cat"], "stdin": ["x" * scenario["payload"]]}
+    m = Measurement(fleet)
+    for _ in range(iterations):
+        with m:
+            start = time.perf_counter()
+            group.call("system", data, result={})
+            m.sample(start)
+    group.reset()
+    return m
+
+
+def bench_suite(host: DroneHost, fleet: DroneFleet, scenario: dict, iterations: int):
+    from .udronerc import run_suite
+
+    suite = {
+        "name": "Benchmark suite",
+        "id": "bench_suite",
+        "drones_min": 1,
+        "drones_max": scenario["drones"],
+        "repeat": 0,
+        "board": "generic",
+        "tasks": [
+            {"sysinfo": {}},
+            {"system": {"cmd": ["cat"], "stdin": ["x" * scenario["payload"]]}},
+            {"checkip": {"interface": "lan", "check_ipv4": False}},
+        ],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        suite_path = Path(tmp) / "bench.yml"
+        suite_path.write_text(json.dumps(suite))
+        m = Measurement(fleet)
+        for _ in range(iterations):
+            with m:
+                start = time.perf_counter()
+                run_suite(host, str(suite_path))
+                m.sample(start)
+    return m
+
+
+def bench_startup(host: DroneHost, fleet: DroneFleet, scenario: dict, iterations: int):
+    """Measure how long a fresh CLI process takes to answer `whois --cached`
+
+    The process loads the CLI and the configuration, reads the inventory of
+    the simulated fleet and lists its drones, which is what short commands
+    called from shell loops pay on every invocation. No datagrams are sent,
+    so the time does not depend on the network or the fleet.
+    """
+    from .inventory import Inventory
+
+    host.whois(UDRONE_GROUP_DEFAULT, need=scenario["drones"])
+    with tempfile.TemporaryDirectory() as tmp:
+        inventory = Inventory(Path(tmp) / "inventory.json")
+        inventory.restore(host.inventory.snapshot())
+        inventory.save()
+        config = Path(tmp) / "config.yml"
+        config.write_text(
+            json.dumps(
+                {
+                    "address": "127.0.0.1",
+                    "hostid": "bench",
+                    "log_level": "ERROR",
+                    "inventory": str(inventory.path),
+                }
+            )
+        )
+        cmd = [sys.executable, "-m", "udronerc.cli", "-c", str(config)]
+        cmd += ["whois", "--cached"]
+        m = Measurement(fleet)
+        for _ in range(iterations):
+            with m:
+                start = time.perf_counter()
+                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+                m.sample(start)
+    return m
+
+
+bench_operations = {
+    "whois": bench_whois,
+    "assign": bench_assign,
+    "call": bench_call,
+    "suite": bench_suite,
+    "startup": bench_startup,
+}
+
+
+def run_scenario(
+    scenario: dict,
+    operations: list = BENCH_OPERATIONS,
+    iterations: int = 10,
+    latency: float = 0.001,
+    jitter: float = 0.002,
+) -> dict:
+    """Benchmark operations against a simulated fleet
+
+    Args:
+        scenario (dict): Fleet size, loss rate and payload size
+        operations (list): Operations to benchmark
+        iterations (int): Repetitions per operation
+        latency (float): Base reply latency of simulated drones
+        jitter (float): Reply jitter of simulated drones
+
+    Returns:
+        dict: Report per operation
+    """
+    logger.info(f"Benchmark scenario {scenario}")
+    report = {}
+    with DroneFleet(
+        scenario["drones"],
+        latency=latency,
+        jitter=jitter,
+        loss=scenario["loss"],
+        seed=0,
+    ) as fleet:
+        host = DroneHost("127.0.0.1", addr=fleet.addr)
+        for operation in operations:
+            m = bench_operations[operation](host, fleet, scenario, iterations)
+            report[operation] = m.report()
+            logger.info(
+                f"{operation}: p50 {report[operation]['p50'] * 1000:.1f}ms "
+                f"p95 {report[operation]['p95'] * 1000:.1f}ms "
+                f"p99 {report[operation]['p99'] * 1000:.1f}ms "
+                f"{report[operation]['msgs_per_sec']:.0f} msgs/s"
+            )
+        host.close()
+    return report
+
+
+def scenario_key(scenario: dict) -> str:
+    return f"drones={scenario['drones']},loss={scenario['loss']},payload={scenario['payload']}"
+
+
+def run_bench(scenarios: list, **kwargs) -> dict:
+    """Run all scenarios
+
+    Returns:
+        dict: Reports keyed by scenario
+    """
+    return {scenario_key(s): run_scenario(s, **kwargs) for s in scenarios}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.1) -> list:
+    """Compare benchmark results against a baseline
+
+    Latency and CPU usage regress when growing more than `tolerance`,
+    throughput regresses when shrinking more than `tolerance`.
+
+    Args:
+        results (dict): Current results of `run_bench`
+        baseline (dict): Stored results of `run_bench`
+        tolerance (float): Accepted relative change
+
+    Returns:
+        list: Human readable regressions
+    """
+    regressions = []
+    for scenario, operations in results.items():
+        for operation, report in operations.items():
+            base = baseline.get(scenario, {}).get(operation)
+            if not base:
+                continue
+            for metric in ["p50", "p95", "p99", "cpu_per_msg"]:
+                if base[metric] and report[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{scenario} {operation} {metric}: "
+                        f"{base[metric]:.6f} -> {report[metric]:.6f}"
+                    )
+            if report["msgs_per_sec"] < base["msgs_per_sec"] * (1 - tolerance):
+                regressions.append(
+                    f"{scenario} {operation} msgs_per_sec: "
+                    f"{base['msgs_per_sec']:.1f} -> {report['msgs_per_sec']:.1f}"
+                )
+    return regressions
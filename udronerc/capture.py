@@ -0,0 +1,263 @@
+import collections
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"UDRC"
+VERSION = 1
+HEADER = struct.Struct("<4sBI")  # magic, version, length of the JSON metadata
+RECORD = struct.Struct("<dBBH")  # seconds since start, kind, interface, length
+
+SENT = 0
+RECEIVED = 1
+SEQ = 2
+
+
+class Capture(object):
+    """Record the datagrams of a host to a binary capture file
+
+    The file starts with a header holding JSON metadata: the host ID, the
+    number of interfaces and the inventory when the capture started. Every
+    datagram sent or received is stored as a fixed size record header, with
+    the time since the capture started, the direction and the interface,
+    followed by the datagram as is. Generated sequence numbers are recorded
+    as well, so a replay can reproduce them.
+    """
+
+    def __init__(self, path: Path, meta: dict):
+        """
+        Args:
+            path (Path): Capture file, overwritten
+            meta (dict): Metadata stored in the header
+        """
+        self.path = Path(path)
+        self.file = self.path.open("wb")
+        meta = json.dumps(meta).encode("utf-8")
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(meta)) + meta)
+        self.started = time.monotonic()
+        self.records = 0
+        self.lock = threading.Lock()
+
+    def write(self, kind: int, interface: int, payload: bytes):
+        """Append a record
+
+        Args:
+            kind (int): `SENT`, `RECEIVED` or `SEQ`
+            interface (int): Index of the host socket
+            payload (bytes): Datagram or packed sequence number
+        """
+        header = RECORD.pack(
+            time.monotonic() - self.started, kind, interface, len(payload)
+        )
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(header)
+            self.file.write(payload)
+            self.records += 1
+
+    def seq(self, seq: int):
+        self.write(SEQ, 0, struct.pack("<I", seq))
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+                logger.info(f"Stored {self.records} records to {self.path}")
+
+
+class RecordingSocket(object):
+    """Socket recording every datagram it sends and receives"""
+
+    def __init__(self, sock: socket.socket, capture: Capture, interface: int):
+        """
+        Args:
+            sock (socket.socket): Socket of the host
+            capture (Capture): Capture to record to
+            interface (int): Index of the socket within the host sockets
+        """
+        self.socket = sock
+        self.capture = capture
+        self.interface = interface
+
+    def __getattr__(self, name: str):
+        return getattr(self.socket, name)
+
+    def recv_into(self, buffer) -> int:
+        size = self.socket.recv_into(buffer)
+        self.capture.write(RECEIVED, self.interface, bytes(buffer[:size]))
+        return size
+
+    def sendto(self, packet: bytes, addr: tuple) -> int:
+        self.capture.write(SENT, self.interface, packet)
+        return self.socket.sendto(packet, addr)
+
+
+def read_capture(path: Path) -> tuple:
+    """Read a capture file
+
+    Args:
+        path (Path): Capture file
+
+    Returns:
+        tuple: Metadata and list of records as (time, kind, interface,
+            payload)
+    """
+    data = Path(path).read_bytes()
+    magic, version, size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is no udronerc capture")
+    offset = HEADER.size
+    meta = json.loads(data[offset : offset + size])
+    offset += size
+
+    records = []
+    while offset < len(data):
+        when, kind, interface, size = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        records.append((when, kind, interface, data[offset : offset + size]))
+        offset += size
+    return meta, records
+
+
+class ReplaySocket(object):
+    """Host side of a replay, sent datagrams are handed to the replay"""
+
+    def __init__(self, sock: socket.socket, replay):
+        self.socket = sock
+        self.replay = replay
+
+    def __getattr__(self, name: str):
+        return getattr(self.socket, name)
+
+    def setsockopt(self, *args):
+        pass
+
+    def sendto(self, packet: bytes, addr: tuple) -> int:
+        self.replay.sent(packet)
+        return len(packet)
+
+
+class Replay(object):
+    """Feed a capture back into a host instead of the network
+
+    Received datagrams of the capture are delivered in their recorded
+    order. A datagram is only delivered once the host sent every datagram
+    recorded before it, so replies never overtake the requests they answer.
+    Recorded sends the host does not repeat within `stall` seconds are
+    skipped, e.g. keep-alives sent at other times. With `realtime` the
+    recorded gaps between datagrams are kept, otherwise datagrams are
+    delivered as fast as the host sends. Sequence numbers are generated in
+    the recorded order, so replies match the requests of the replay.
+    """
+
+    def __init__(self, path: Path, realtime: bool = False, stall: float = 5.0):
+        """
+        Args:
+            path (Path): Capture file
+            realtime (bool): Keep the recorded timing
+            stall (float): Seconds to wait for a recorded send
+        """
+        self.path = Path(path)
+        self.meta, records = read_capture(path)
+        self.hostid = self.meta["hostid"]
+        self.realtime = realtime
+        self.stall = stall
+        self.seqs = collections.deque(
+            struct.unpack("<I", payload)[0]
+            for _, kind, _, payload in records
+            if kind == SEQ
+        )
+        self.records = [record for record in records if record[1] != SEQ]
+        self.pending = collections.Counter()
+        self.counters = {"delivered": 0, "matched": 0, "skipped": 0}
+        self.condition = threading.Condition()
+        self.feeds = []
+        self.running = False
+        self.thread = None
+        self.done = threading.Event()
+
+    def open(self) -> list:
+        """Create the sockets of the replayed host
+
+        Returns:
+            list: One `ReplaySocket` per recorded interface
+        """
+        sockets = []
+        for _ in range(self.meta.get("interfaces", 1)):
+            host, feed = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            host.setblocking(0)
+            self.feeds.append(feed)
+            sockets.append(ReplaySocket(host, self))
+        return sockets
+
+    def genseq(self) -> int:
+        """
+        Returns:
+            int: Next recorded sequence number, random once exhausted
+        """
+        try:
+            return self.seqs.popleft()
+        except IndexError:
+            return struct.unpack("=I", os.urandom(4))[0] % 2000000000
+
+    def sent(self, packet: bytes):
+        with self.condition:
+            self.pending[packet] += 1
+            self.condition.notify()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="replay", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread:
+            self.thread.join()
+        for feed in self.feeds:
+            feed.close()
+        logger.info(f"Replayed {self.path}: {self.counters}")
+
+    def _match(self, packet: bytes):
+        deadline = time.monotonic() + self.stall
+        with self.condition:
+            while self.running and not self.pending[packet]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["skipped"] += 1
+                    logger.debug(f"Recorded send not repeated: {packet[:80]}")
+                    return
+                self.condition.wait(remaining)
+            if self.pending[packet]:
+                self.pending[packet] -= 1
+                self.counters["matched"] += 1
+
+    def _run(self):
+        started = time.monotonic()
+        for when, kind, interface, payload in self.records:
+            if not self.running:
+                break
+            if kind == SENT:
+                self._match(payload)
+                continue
+            if self.realtime:
+                delay = started + when - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                self.feeds[interface % len(self.feeds)].send(payload)
+            except OSError as e:
+                logger.debug(f"Replay stopped: {e}")
+                break
+            self.counters["delivered"] += 1
+        self.done.set()
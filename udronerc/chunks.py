@@ -0,0 +1,225 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .constants import (
+    UDRONE_CHUNK_DONE_TTL,
+    UDRONE_CHUNK_RETRIES,
+    UDRONE_CHUNK_WINDOW,
+)
+from .message import Message
+
+logger = logging.getLogger(__name__)
+
+
+def split(payload: str, size: int) -> list:
+    """Split a serialized reply into chunk parts
+
+    Args:
+        payload (str): Serialized reply data
+        size (int): Maximal characters per part
+
+    Returns:
+        list: Parts, at least one
+    """
+    return [payload[i : i + size] for i in range(0, len(payload), size)] or [""]
+
+
+class Transfer(object):
+    """Chunks of a single reply received so far"""
+
+    def __init__(self, msg: Message, window: int):
+        """
+        Args:
+            msg (Message): First received chunk
+            window (int): Chunks the drone sends unsolicited
+        """
+        self.sender = msg.sender
+        self.to = msg.to
+        self.seq = msg.seq
+        self.type = msg.data["type"]
+        self.count = msg.data["count"]
+        self.parts = [None] * self.count
+        self.received = 0
+        self.delivered = 0
+        self.requested = min(window, self.count)
+        self.progress = time.monotonic()
+        self.retries = 0
+
+    def add(self, index: int, part: str) -> str:
+        """Store a chunk
+
+        Args:
+            index (int): Position of the chunk
+            part (str): Content of the chunk
+
+        Returns:
+            str: Data completing the in-order prefix, empty if none
+        """
+        if self.parts[index] is not None:
+            return ""
+        self.parts[index] = part
+        self.received += 1
+        self.progress = time.monotonic()
+        self.retries = 0
+
+        start = self.delivered
+        while self.delivered < self.count and self.parts[self.delivered] is not None:
+            self.delivered += 1
+        return "".join(self.parts[start : self.delivered])
+
+    def complete(self) -> bool:
+        return self.received == self.count
+
+    def missing(self) -> list:
+        """
+        Returns:
+            list: Requested chunks not received yet
+        """
+        return [
+            i for i in range(self.delivered, self.requested) if self.parts[i] is None
+        ]
+
+    def message(self) -> Message:
+        """
+        Returns:
+            Message: Reassembled reply
+        """
+        msg = Message(
+            self.sender, self.to, self.type, self.seq, json.loads("".join(self.parts))
+        )
+        msg.received = time.monotonic()
+        return msg
+
+
+class Reassembler(object):
+    """Reassemble replies a drone split into `chunk` messages
+
+    Drones send replies exceeding a datagram as numbered `chunk` messages
+    carrying a part of the serialized reply data, its type and the number of
+    chunks. Only the first `window` chunks are sent unsolicited. Once half of
+    the requested chunks arrived the next window is requested with a
+    `!chunks` message listing the wanted chunks, at most two windows beyond
+    the first missing chunk. Stalled transfers request their missing chunks
+    again. Chunks of replies which were already reassembled, e.g. resent
+    after a retransmitted request, are ignored.
+
+    The reassembled reply is routed like any other message, in-order data
+    may additionally be streamed to a sink while the transfer is running.
+    """
+
+    def __init__(
+        self,
+        host,
+        window: int = UDRONE_CHUNK_WINDOW,
+        retries: int = UDRONE_CHUNK_RETRIES,
+    ):
+        """
+        Args:
+            host (DroneHost): Host receiving the chunks
+            window (int): Chunks requested at once
+            retries (int): Re-requests without progress before giving up
+        """
+        self.host = host
+        self.window = window
+        self.retries = retries
+        self.transfers = {}
+        self.done = {}
+        self.sinks = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stream(self, seq: int, sink):
+        """Stream reassembled data of a sequence for the duration of a with block
+
+        Args:
+            seq (int): Sequence number of the request
+            sink (callable): Called with the drone ID and the next in-order
+                part of the serialized reply data
+        """
+        self.sinks[seq] = sink
+        try:
+            yield
+        finally:
+            self.sinks.pop(seq, None)
+
+    def _request(self, transfer: Transfer, chunks: list):
+        self.host.send(transfer.sender, transfer.seq, "!chunks", {"chunks": chunks})
+
+    def handle(self, msg: Message) -> Message:
+        """Add a received chunk
+
+        Args:
+            msg (Message): Message of type `chunk`
+
+        Returns:
+            Message: Reassembled reply once all chunks arrived, otherwise None
+        """
+        key = (msg.seq, msg.sender)
+        if key in self.done:
+            return None
+        try:
+            index = msg.data["index"]
+            part = msg.data["part"]
+            with self.lock:
+                transfer = self.transfers.get(key)
+                if transfer is None:
+                    transfer = self.transfers[key] = Transfer(msg, self.window)
+                data = transfer.add(index, part)
+        except (KeyError, TypeError, IndexError):
+            self.host.counters["malformed"] += 1
+            return None
+
+        sink = self.sinks.get(msg.seq)
+        if sink and data:
+            sink(msg.sender, data)
+
+        if transfer.complete():
+            with self.lock:
+                self.transfers.pop(key, None)
+                self.done[key] = time.monotonic()
+            try:
+                return transfer.message()
+            except ValueError:
+                self.host.counters["malformed"] += 1
+                return None
+
+        if (
+            transfer.received + self.window // 2 >= transfer.requested
+            and transfer.requested - transfer.delivered < 2 * self.window
+            and transfer.requested < transfer.count
+        ):
+            start = transfer.requested
+            transfer.requested = min(start + self.window, transfer.count)
+            self._request(transfer, list(range(start, transfer.requested)))
+        return None
+
+    def poll(self):
+        """Request missing chunks of stalled transfers"""
+        if self.done:
+            expired = time.monotonic() - UDRONE_CHUNK_DONE_TTL
+            with self.lock:
+                for key in [k for k, t in self.done.items() if t < expired]:
+                    del self.done[key]
+        if not self.transfers:
+            return
+        now = time.monotonic()
+        with self.lock:
+            transfers = list(self.transfers.items())
+        for key, transfer in transfers:
+            if now - transfer.progress < self.host.rtt.timeout([transfer.sender]):
+                continue
+            transfer.retries += 1
+            if transfer.retries > self.retries:
+                logger.warning(
+                    f"Transfer of seq {transfer.seq} from {transfer.sender} failed "
+                    f"after {transfer.received}/{transfer.count} chunks"
+                )
+                with self.lock:
+                    self.transfers.pop(key, None)
+                continue
+            transfer.progress = now
+            self.host.metrics.retransmit("!chunks")
+            self._request(transfer, transfer.missing())
@@ -1,18 +1,16 @@
 import json
 import logging
+import time
 from pathlib import Path
 
 import click
-import yaml
 
-import udronerc.udronerc
+from udronerc.config import DEFAULT_CONFIG, load_config
+from udronerc.constants import BENCH_OPERATIONS, UDRONE_GROUP_DEFAULT
 
-from udronerc.constants import UDRONE_GROUP_DEFAULT
+# Commands import their modules on invocation, so small commands like
+# `whois` do not pay for loading the suite runner, simulator or database.
 
-with open("config.yml") as c:
-    conf = yaml.safe_load(c.read())
-
-logging.basicConfig(level=conf["log_level"])
 logger = logging.getLogger(__name__)
 
 
@@ -21,32 +19,133 @@ logger = logging.getLogger(__name__)
     "-c",
     "--config",
     "option_config",
-    default="config.yml",
+    default=DEFAULT_CONFIG,
     type=Path,
     help="Path to config.yml",
 )
-def cli(option_config):
-    config_path = Path(option_config)
-    if not config_path.is_file():
-        logger.error(f"No config file found at {option_config}")
+@click.pass_context
+def cli(ctx, option_config):
+    ctx.obj = load_config(option_config)
+    logging.basicConfig(level=ctx.obj["log_level"])
+    logger.info("Starting CLI")
+
+
+def attach(conf: dict):
+    """Connect to the daemon if one is running
+
+    Args:
+        conf (dict): Loaded config.yml
+
+    Returns:
+        DaemonClient: Connected client, None to run the command locally
+    """
+    if not conf.get("daemon"):
+        return None
+    import udronerc.daemon
+
+    return udronerc.daemon.connect(conf["daemon"])
+
+
+@cli.command()
+@click.pass_obj
+def daemon(conf):
+    """Keep the host, drone inventory and groups running for other commands"""
+    import udronerc.daemon
+
+    if not conf.get("daemon"):
+        logger.error("No daemon socket set in the config")
         quit(1)
+    udronerc.daemon.Daemon(conf).serve()
 
-    conf = yaml.safe_load(config_path.read_text())
-    logging.basicConfig(level=conf["log_level"])
-    logger.info("Starting CLI")
+
+@cli.command()
+@click.pass_obj
+def status(conf):
+    """Print groups, drones and metrics of the running daemon"""
+    client = attach(conf)
+    if client is None:
+        logger.error("No daemon running")
+        quit(1)
+    click.echo(json.dumps(client.call("status"), indent="  "))
+    client.close()
 
 
 @cli.command()
 @click.option("-b", "--board", default="generic", help="Limit to specific board type")
-def whois(board):
+@click.option("--cached", is_flag=True, help="List drones of the inventory only")
+@click.pass_obj
+def whois(conf, board, cached):
     """Return number and names of all active drones"""
-    whois = list(udronerc.udronerc.whois(UDRONE_GROUP_DEFAULT, board).keys())
+    client = None if cached else attach(conf)
+    if cached:
+        from udronerc.inventory import Inventory
+
+        whois = Inventory(conf.get("inventory")).candidates(board)
+    elif client:
+        whois = client.call("whois", board=board)
+        client.close()
+    else:
+        import udronerc.udronerc
+
+        host = udronerc.udronerc.get_host(conf)
+        whois = list(host.whois(UDRONE_GROUP_DEFAULT, board=board).keys())
+        host.close()
     logger.info(f"Active drones ({len(whois)}): {whois}")
 
 
 @cli.command()
-def disband():
-    udronerc.udronerc.disband()
+@click.option("--stop", is_flag=True, help="Also stop the daemon")
+@click.pass_obj
+def disband(conf, stop):
+    """Reset all groups of this host"""
+    client = attach(conf)
+    if client:
+        client.call("disband")
+        if stop:
+            client.call("stop")
+        client.close()
+        return
+
+    import udronerc.udronerc
+
+    udronerc.udronerc.disband(conf)
+
+
+@cli.command()
+@click.option("-n", "--drones", multiple=True, type=int, default=[10, 100])
+@click.option("-l", "--loss", multiple=True, type=float, default=[0.0])
+@click.option("-p", "--payload", multiple=True, type=int, default=[64])
+@click.option(
+    "-O",
+    "--operation",
+    "operations",
+    multiple=True,
+    type=click.Choice(BENCH_OPERATIONS),
+    default=BENCH_OPERATIONS,
+)
+@click.option("-i", "--iterations", default=10, help="Repetitions per operation")
+@click.option("-o", "--output", default="bench.json", type=Path)
+@click.option("-b", "--baseline", type=Path, help="Compare against stored results")
+@click.option("-t", "--tolerance", default=0.1, help="Accepted relative change")
+def bench(drones, loss, payload, operations, iterations, output, baseline, tolerance):
+    """Benchmark against a simulated drone fleet"""
+    import udronerc.bench
+
+    scenarios = udronerc.bench.scenario_matrix(drones, loss, payload)
+    results = udronerc.bench.run_bench(
+        scenarios, operations=operations, iterations=iterations
+    )
+    output.write_text(json.dumps(results, indent="  "))
+    logger.info(f"Stored benchmark results to {output}")
+
+    if baseline:
+        regressions = udronerc.bench.compare(
+            results, json.loads(baseline.read_text()), tolerance
+        )
+        for regression in regressions:
+            logger.warning(f"Regression {regression}")
+        if regressions:
+            quit(1)
 
 
 @cli.group()
@@ -56,13 +155,135 @@ def suite():
 
 
 @suite.command()
-@click.argument("path")
-def run(path):
-    """Run test suite at given path"""
-    host = udronerc.udronerc.get_host()
-    results_suite = udronerc.udronerc.run_suite(host, path)
-    Path("results.json").write_text(json.dumps(results_suite, indent="  "))
-    logger.info("Stored suite results to results.json")
+@click.argument("paths", nargs=-1, required=True)
+@click.option("-j", "--parallel", default=1, help="Number of suites run at once")
+@click.option(
+    "-o",
+    "--output",
+    default="results.json",
+    type=Path,
+    help="Results file, *.jsonl streams one record per task and drone",
+)
+@click.option("--db", type=Path, help="Also index results in a SQLite database")
+@click.option(
+    "-m",
+    "--metrics",
+    type=Path,
+    help="Store host metrics, *.json as JSON, otherwise in Prometheus text format",
+)
+@click.option("--trace", type=Path, help="Store a Chrome trace of the run")
+@click.option("-r", "--repeat", type=int, help="Override the repetitions of suites")
+@click.option(
+    "--soak",
+    is_flag=True,
+    help="Keep aggregates and failures only, the output holds the statistics",
+)
+@click.option(
+    "--progress", default=60.0, help="Seconds between soak progress summaries"
+)
+@click.option("--capture", type=Path, help="Record all datagrams to a capture file")
+@click.option("--replay", type=Path, help="Replay a capture instead of the network")
+@click.option("--realtime", is_flag=True, help="Replay with the recorded timing")
+@click.pass_obj
+def run(
+    conf,
+    paths,
+    parallel,
+    output,
+    db,
+    metrics,
+    trace,
+    repeat,
+    soak,
+    progress,
+    capture,
+    replay,
+    realtime,
+):
+    """Run test suites at given paths
+
+    If a daemon is running the suites run in the daemon, which keeps the
+    groups and their drones for the next run. Captures and replays always
+    run locally.
+    """
+    params = dict(
+        parallel=parallel,
+        output=output,
+        db=db,
+        metrics=metrics,
+        trace=trace,
+        repeat=repeat,
+        soak=soak,
+        progress=progress,
+    )
+    client = None if capture or replay else attach(conf)
+    if client:
+        paths = [str(Path(path).resolve()) for path in paths]
+        for key in ("output", "db", "metrics", "trace"):
+            if params[key]:
+                params[key] = str(params[key].resolve())
+        client.call("run", paths=paths, **params)
+        client.close()
+        return
+
+    import udronerc.udronerc
+
+    host = udronerc.udronerc.get_host(conf, capture, replay, realtime)
+    start = time.monotonic()
+    try:
+        udronerc.udronerc.run_paths(host, paths, **params)
+    finally:
+        host.close()
+    if replay:
+        logger.info(f"Replay took {time.monotonic() - start:.3f}s")
+
+
+@cli.group()
+def results():
+    """Query stored suite results"""
+    pass
+
+
+@results.command("import")
+@click.argument("paths", nargs=-1, required=True, type=Path)
+@click.option("--db", default="results.db", type=Path, help="SQLite database")
+def results_import(paths, db):
+    """Import results.json or *.jsonl files into the database"""
+    import udronerc.store
+
+    with udronerc.store.ResultStore(db) as store:
+        for path in paths:
+            runs = store.import_results(path)
+            logger.info(f"Imported {runs} runs from {path}")
+
+
+@results.command("query")
+@click.option("--db", default="results.db", type=Path, help="SQLite database")
+@click.option("-d", "--drone", help="Limit to drone")
+@click.option("-t", "--task", help="Limit to task name or command")
+@click.option("-s", "--status", help="Limit to status, e.g. failed")
+@click.option("--suite", help="Limit to suite ID")
+@click.option("-b", "--board", help="Limit to board")
+@click.option("--days", type=float, help="Limit to the last days")
+@click.option("-n", "--limit", type=int, help="Maximal number of responses")
+@click.option(
+    "-g",
+    "--group-by",
+    multiple=True,
+    type=click.Choice(["drone", "task", "suite", "board", "status"]),
+    help="Print counts, failures and latency percentiles per group",
+)
+def results_query(db, drone, task, status, suite, board, days, limit, group_by):
+    """Print stored responses matching all filters as JSON lines"""
+    import udronerc.store
+
+    since = time.time() - days * 86400 if days else None
+    with udronerc.store.ResultStore(db) as store:
+        rows = store.query(drone, task, status, suite, board, since, limit)
+        if group_by:
+            rows = store.summary(rows, group_by)
+    for row in rows:
+        click.echo(json.dumps(row))
 
 
 if __name__ == "__main__":
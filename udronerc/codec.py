@@ -0,0 +1,131 @@
+import functools
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec(object):
+    """Codec using the standard library JSON module"""
+
+    name = "json"
+    error = ValueError
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, packet):
+        return json.loads(bytes(packet))
+
+
+class OrjsonCodec(object):
+    """Codec using `orjson`
+
+    Non-string dict keys, e.g. numbers from YAML suites, are converted to
+    strings like the standard library does instead of being rejected.
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self.dumps = functools.partial(orjson.dumps, option=orjson.OPT_NON_STR_KEYS)
+        self.loads = orjson.loads
+        self.error = orjson.JSONDecodeError
+
+
+class MsgspecCodec(object):
+    """Codec using `msgspec`"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self.dumps = msgspec.json.Encoder().encode
+        self.loads = msgspec.json.Decoder().decode
+        self.error = msgspec.DecodeError
+
+
+codecs = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "json": JsonCodec,
+}
+
+
+def get_codec(name: str = None):
+    """Return a message codec
+
+    Without a name the fastest installed codec is used, falling back to the
+    standard library.
+
+    Args:
+        name (str): Codec name, one of `orjson`, `msgspec` or `json`
+
+    Returns:
+        object: Codec offering `dumps` to bytes, `loads` from a buffer and the
+            `error` raised for invalid input
+    """
+    if name:
+        return codecs[name]()
+
+    for codec in codecs.values():
+        try:
+            return codec()
+        except ImportError:
+            continue
+
+
+class Envelope(object):
+    """Serialize messages of a host reusing the constant envelope
+
+    The `from` and `to` fields only change with the destination, their
+    serialized form is created once per destination and reused.
+    """
+
+    def __init__(self, hostid: str, codec):
+        """
+        Args:
+            hostid (str): ID of the sending host
+            codec: Codec used to serialize the variable fields
+        """
+        self.hostid = hostid
+        self.codec = codec
+        self.prefixes = {}
+
+    def prefix(self, to: str) -> bytes:
+        prefix = self.prefixes.get(to)
+        if prefix is None:
+            prefix = self.prefixes[to] = (
+                b'{"from":'
+                + self.codec.dumps(self.hostid)
+                + b',"to":'
+                + self.codec.dumps(to)
+                + b',"type":'
+            )
+        return prefix
+
+    def encode(self, to: str, seq: int, msg_type: str, data=None) -> bytes:
+        """
+        Args:
+            to (str): receiving group or drone
+            seq (int): sequence number
+            msg_type (str): type of message
+            data (dict): data to send
+
+        Returns:
+            bytes: serialized message
+        """
+        return b"".join(
+            (
+                self.prefix(to),
+                self.codec.dumps(msg_type),
+                b',"seq":',
+                self.codec.dumps(seq),
+                b',"data":',
+                self.codec.dumps(data),
+                b"}",
+            )
+        )
@@ -0,0 +1,91 @@
+import importlib
+
+# this is the map of all complex call helpers, helpers are given as
+# "module:function" and imported on first use, so looking up the command of
+# a task does not load the suite runner
+cmds_drone = {
+    "read_file": ".udronerc:read_file",
+    "checkip": ".modules.checkip:checkip",
+    "checknetmask": {},
+    "cloudlogin": {},
+    "cloudlogout": {},
+    "cloudwispr": {},
+    "comment": {},
+    "dhcp": {},
+    "dns_flood": {},
+    "download": {},
+    "essid": {},
+    "fatserver": {},
+    "getifaddrs": {},
+    "ping": {},
+    "readfile": {},
+    "setmask": {},
+    "sysinfo": ".udronerc:sysinfo",
+    "system": ".udronerc:system",
+    "ubus": {},
+    "service": ".udronerc:service",
+    "ubus_call": {},
+    "uci_dump": ".udronerc:uci_dump",
+    "uci_get": ".udronerc:uci_get",
+    "uci_replace": {},
+    "uci_set": ".udronerc:uci_set",
+    "upgrade": {},
+    "wait_for": ".modules.waitfor:wait_for",
+    "webui_auth": {},
+    "webui_ip": {},
+    "webui_rpc": {},
+}
+
+cmds_host = {
+    "host_sleep": ".udronerc:host_sleep",
+    "host_comment": ".udronerc:host_comment",
+    "host_raw": ".udronerc:host_raw",
+}
+
+
+cmds_drone_set = set(cmds_drone.keys())
+cmds_host_set = set(cmds_host.keys())
+
+
+def get_helper(cmd: str):
+    """Return the call helper of a drone or host command
+
+    Args:
+        cmd (str): Command of a task
+
+    Returns:
+        callable: Helper running the command
+    """
+    cmds = cmds_host if cmd in cmds_host else cmds_drone
+    helper = cmds[cmd]
+    if isinstance(helper, str):
+        module, name = helper.split(":")
+        helper = getattr(importlib.import_module(module, __package__), name)
+        cmds[cmd] = helper
+    return helper
+
+
+def task_command(task: dict) -> str:
+    """Return the command of a task
+
+    Other keys like `name`, `id` or `depends_on` describe the task.
+
+    Args:
+        task (dict): Task as defined in a suite
+
+    Returns:
+        str: The known command of the task, None if it has none or several
+    """
+    cmd_set = set(task.keys()) & (cmds_drone_set ^ cmds_host_set)
+    return cmd_set.pop() if len(cmd_set) == 1 else None
+
+
+def task_name(task: dict) -> str:
+    """
+    Args:
+        task (dict): Task as defined in a suite
+
+    Returns:
+        str: Name of the task, its ID or command if it has no name
+    """
+    return task.get("name", task.get("id", task_command(task)))
@@ -0,0 +1,33 @@
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = "config.yml"
+
+
+def load_config(path: Path = DEFAULT_CONFIG) -> dict:
+    """Load the controller configuration
+
+    The configuration is only read when a command needs it, importing the
+    package does not touch the file system. A relative `daemon` socket is
+    relative to the config file, so commands find the daemon from any
+    working directory.
+
+    Args:
+        path (Path): Path to config.yml
+
+    Returns:
+        dict: Loaded configuration
+    """
+    import yaml
+
+    config_path = Path(path)
+    if not config_path.is_file():
+        logger.error(f"No config file found at {path}")
+        quit(1)
+
+    conf = yaml.safe_load(config_path.read_text())
+    if conf.get("daemon"):
+        conf["daemon"] = str((config_path.parent / conf["daemon"]).absolute())
+    return conf
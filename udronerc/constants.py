@@ -1,6 +1,21 @@
 UDRONE_ADDR = ("239.6.6.6", 21337)
 UDRONE_GROUP_DEFAULT = "!all-default"
 UDRONE_MAX_DGRAM = 32 * 1024
-UDRONE_RESENT_STRATEGY = [0.5, 1, 1]
-UDRONE_RESENT_STRATEGY = [0.5]
+UDRONE_CHUNK_SIZE = 8 * 1024
+UDRONE_CHUNK_WINDOW = 16
+UDRONE_CHUNK_RETRIES = 5
+UDRONE_CHUNK_DONE_TTL = 60
+UDRONE_RESENT_ATTEMPTS = 1
+UDRONE_RTO_INITIAL = 0.5
+UDRONE_RTO_MIN = 0.05
+UDRONE_RTO_MAX = 8
+UDRONE_WHOIS_WINDOW = 0.5
 UDRONE_IDLE_INTVAL = 19
+UDRONE_KEEPALIVE_SLACK = 1
+UDRONE_LEASE_TTL_FACTOR = 3
+UDRONE_DAEMON_LEASE_TIMEOUT = 300
+UDRONE_UNICAST_RATIO = 0.25
+UDRONE_INVENTORY_TTL = 300
+UDRONE_TASK_CONCURRENCY = 4
+
+BENCH_OPERATIONS = ["whois", "assign", "call", "suite", "startup"]
@@ -0,0 +1,238 @@
+import contextvars
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+from pathlib import Path
+
+from .constants import UDRONE_DAEMON_LEASE_TIMEOUT, UDRONE_GROUP_DEFAULT
+from .message import jsonable
+
+logger = logging.getLogger(__name__)
+
+# handler of the request running in the current thread, worker threads of a
+# request inherit it by running in a copy of the submitting context
+_forward = contextvars.ContextVar("forward", default=None)
+
+
+class _Forward(logging.Handler):
+    """Send log records of a request to the client
+
+    Records of other requests and of background threads, e.g. keep-alives,
+    are not sent.
+    """
+
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+        self.setFormatter(logging.Formatter("%(message)s"))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return _forward.get() is self and super().filter(record)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.send(
+                {
+                    "log": self.format(record),
+                    "level": record.levelno,
+                    "logger": record.name,
+                }
+            )
+        except OSError:
+            pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, msg: dict):
+        line = json.dumps(msg, default=jsonable) + "\n"
+        self.wfile.write(line.encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                method = getattr(self.server.daemon, f"rpc_{request['method']}")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self.send({"error": f"Invalid request: {e!r}"})
+                continue
+
+            forward = _Forward(self.send)
+            forward.setLevel(request.get("log_level", logging.INFO))
+            token = _forward.set(forward)
+            logging.getLogger().addHandler(forward)
+            try:
+                self.send({"result": method(**request.get("params", {}))})
+            except (SystemExit, Exception) as e:
+                logger.exception(f"Request {request['method']} failed")
+                self.send({"error": repr(e)})
+            finally:
+                logging.getLogger().removeHandler(forward)
+                _forward.reset(token)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon(object):
+    """Keep a drone host running for short lived CLI commands
+
+    The daemon owns the host socket, the inventory and the groups of
+    finished suites including their keep-alives. CLI commands connect to the
+    Unix socket `path` and send one JSON request per line, e.g.
+    `{"method": "run", "params": {"paths": [...]}}`. Log records created
+    while the request runs are sent back as `{"log": ...}` lines, followed by
+    a final `{"result": ...}` or `{"error": ...}` line.
+
+    Groups stay assigned after a suite, so running the same suite again
+    skips discovery and assignment. Suite runs are serialized, so a suite
+    needing drones of kept groups takes them back instead of waiting, and
+    waiting for drones is bounded by `UDRONE_DAEMON_LEASE_TIMEOUT`.
+    """
+
+    def __init__(self, conf: dict, path: Path = None):
+        """
+        Args:
+            conf (dict): Loaded config.yml
+            path (Path): Unix socket to listen on, defaults to `daemon` of
+                the config
+        """
+        from .udronerc import get_host
+
+        self.conf = conf
+        self.path = Path(path or conf["daemon"])
+        self.host = get_host(conf)
+        self.host.leases.timeout = UDRONE_DAEMON_LEASE_TIMEOUT
+        self.lock = threading.Lock()
+        self.server = None
+
+    def serve(self):
+        """Answer requests until stopped by a signal or a `stop` request"""
+        if self.path.exists():
+            client = connect(self.path)
+            if client is not None:
+                client.close()
+                logger.error(f"Daemon already running on {self.path}")
+                quit(1)
+            self.path.unlink()
+
+        self.server = _Server(str(self.path), _Handler)
+        self.server.daemon = self
+        signal.signal(signal.SIGTERM, lambda *args: self._shutdown())
+        logger.info(f"Daemon of {self.host.hostid} listening on {self.path}")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            self.path.unlink(missing_ok=True)
+            logger.info("Disbanding groups")
+            try:
+                self.host.disband()
+            except (SystemExit, OSError) as e:
+                logger.error(f"Disbanding groups failed: {e}")
+            finally:
+                self.host.close()
+
+    def _shutdown(self):
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def rpc_whois(self, board: str = None) -> list:
+        answers = self.host.whois(UDRONE_GROUP_DEFAULT, board=board)
+        return list(answers.keys())
+
+    def rpc_run(self, **params):
+        from .udronerc import run_paths
+
+        with self.lock:
+            return run_paths(self.host, keep=True, **params)
+
+    def rpc_disband(self, reset: str = None):
+        with self.lock:
+            self.host.disband(reset)
+
+    def rpc_status(self) -> dict:
+        return {
+            "hostid": self.host.hostid,
+            "pid": os.getpid(),
+            "groups": {
+                group.groupid: sorted(group.assigned_drones)
+                for group in self.host.groups
+            },
+            "inventory": len(self.host.inventory),
+            "metrics": self.host.metrics.state(),
+        }
+
+    def rpc_stop(self):
+        self._shutdown()
+
+
+class DaemonClient(object):
+    """Connection of a CLI command to a running daemon"""
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self.file = sock.makefile("rwb")
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def call(self, method: str, **params):
+        """Run a request in the daemon
+
+        Log records of the daemon are logged by this process as they arrive.
+
+        Args:
+            method (str): Name of the request, e.g. `run`
+            params: Parameters of the request
+
+        Returns:
+            Result of the request
+
+        Raises:
+            RuntimeError: The request failed in the daemon
+        """
+        request = {
+            "method": method,
+            "params": params,
+            "log_level": logging.getLogger().getEffectiveLevel(),
+        }
+        self.file.write((json.dumps(request, default=str) + "\n").encode("utf-8"))
+        self.file.flush()
+        for line in self.file:
+            msg = json.loads(line)
+            if "log" in msg:
+                logging.getLogger(msg.get("logger")).log(msg["level"], msg["log"])
+            elif "error" in msg:
+                raise RuntimeError(f"Daemon failed: {msg['error']}")
+            else:
+                return msg["result"]
+        raise RuntimeError("Daemon closed the connection")
+
+
+def connect(path: Path) -> DaemonClient:
+    """Connect to a running daemon
+
+    Args:
+        path (Path): Unix socket of the daemon, None if not configured
+
+    Returns:
+        DaemonClient: Connected client, None if no daemon is running
+    """
+    if not path or not Path(path).exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except OSError as e:
+        logger.debug(f"No daemon on {path}: {e}")
+        sock.close()
+        return None
+    return DaemonClient(sock)
@@ -0,0 +1,164 @@
+import logging
+import queue
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Waiter(object):
+    """Queue of received messages for a single sequence number"""
+
+    def __init__(self, seq: int):
+        """
+        Args:
+            seq (int): Sequence number the waiter receives messages for
+        """
+        self.seq = seq
+        self.refs = 0
+        self.queue = queue.Queue()
+
+    def put(self, msg: dict):
+        self.queue.put(msg)
+
+    def get(self, timeout: float = 0) -> dict:
+        """Return the next message of the sequence
+
+        Args:
+            timeout (float): Seconds to wait for a message
+
+        Returns:
+            dict: Received message or None on timeout
+        """
+        try:
+            if timeout <= 0:
+                return self.queue.get_nowait()
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Subscription(object):
+    def __init__(self, dispatcher, seq: int):
+        self.dispatcher = dispatcher
+        self.seq = seq
+
+    def __enter__(self) -> Waiter:
+        return self.dispatcher.acquire(self.seq)
+
+    def __exit__(self, *args):
+        self.dispatcher.release(self.seq)
+
+
+class Dispatcher(object):
+    """Single receive loop routing replies to waiting callers
+
+    The dispatcher owns all reads of the host sockets. Every received message
+    is routed by its sequence number to the `Waiter` of the call expecting
+    it, so concurrent calls, groups and keep-alive timers can share a socket
+    without discarding each others replies. Messages nobody waits for are
+    counted as `dropped` in the host counters.
+    """
+
+    def __init__(self, host, interval: float = 0.1):
+        """
+        Args:
+            host (DroneHost): Host owning the sockets
+            interval (float): Seconds between checks for a stop request
+        """
+        self.host = host
+        self.interval = interval
+        self.waiters = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, name=f"{self.host.hostid}-dispatcher", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def subscribe(self, seq: int) -> Subscription:
+        """Receive messages of a sequence for the duration of a with block
+
+        Nested subscriptions of the same sequence share one `Waiter`, so
+        replies arriving between two receive calls are kept.
+
+        Args:
+            seq (int): Sequence number to receive
+
+        Returns:
+            Subscription: Context manager returning the `Waiter`
+        """
+        return Subscription(self, seq)
+
+    def acquire(self, seq: int) -> Waiter:
+        with self.lock:
+            waiter = self.waiters.get(seq)
+            if waiter is None:
+                waiter = self.waiters[seq] = Waiter(seq)
+            waiter.refs += 1
+            return waiter
+
+    def release(self, seq: int):
+        with self.lock:
+            waiter = self.waiters[seq]
+            waiter.refs -= 1
+            if waiter.refs == 0:
+                del self.waiters[seq]
+
+    def route(self, msg: dict):
+        """Deliver a message to the waiter of its sequence
+
+        Chunks of large replies are passed to the host reassembler, the
+        waiter receives the reassembled reply.
+
+        Args:
+            msg (Message): Received message
+        """
+        self.host.inventory.seen(msg)
+        with self.lock:
+            waiter = self.waiters.get(msg.seq)
+        if waiter is None:
+            self.host.counters["dropped"] += 1
+            logger.debug("No waiter for seq %s from %s", msg.seq, msg.sender)
+            return
+        if msg.type == "chunk":
+            msg = self.host.chunks.handle(msg)
+            if msg is None:
+                return
+        waiter.put(msg)
+
+    def _run(self):
+        poll = select.poll()
+        sockets = {}
+        for sock in self.host.sockets:
+            sockets[sock.fileno()] = sock
+            poll.register(sock, select.POLLIN)
+        while self.running:
+            try:
+                events = poll.poll(self.interval * 1000)
+            except OSError:
+                break
+            for fd, _ in events:
+                while True:
+                    messages = self.host.recv_batch(sockets[fd])
+                    for msg in messages:
+                        try:
+                            self.route(msg)
+                        except Exception:
+                            logger.exception(f"Dropping message from {msg.sender}")
+                    if not messages:
+                        break
+            try:
+                self.host.chunks.poll()
+            except Exception:
+                logger.exception("Polling chunked replies failed")
@@ -1,6 +1,7 @@
 import logging
 import threading
 import time
+from contextlib import contextmanager
 from errno import ENOENT
 
 from .constants import *
@@ -27,24 +28,43 @@ class DroneGroup(object):
         self.host = host
         self.groupid = groupid
         self.idle_intval = UDRONE_IDLE_INTVAL
-        self.timer = None
-        self._timer_setup()
+        self.last_activity = time.monotonic()
         self.seq = self.host.genseq()
+        self.seq_lock = threading.Lock()
         self.assigned_drones = set()
+        self.users = 0
+        self.users_lock = threading.Lock()
+        self.host.keepalive.add(self)
         logger.debug(f"Group {self.groupid} created.")
 
-    def _timer_action(self):
-        logger.debug("Group %s keep-alive timer triggered", self.groupid)
+    @contextmanager
+    def in_use(self):
+        """Mark the group as running, e.g. while a suite runs on it
+
+        The drones of running groups are not taken back by the lease manager
+        and other groups wait for them to be released.
+        """
+        with self.users_lock:
+            self.users += 1
+        try:
+            yield self
+        finally:
+            with self.users_lock:
+                self.users -= 1
+
+    def _keepalive(self):
+        """Keep assigned drones in the group, called by the host scheduler"""
+        logger.debug("Group %s keep-alive triggered", self.groupid)
         if len(self.assigned_drones) > 0:
-            self.host.whois(self.groupid, need=0, seq=0)
-        self._timer_setup()
+            with self.host.tracer.span("keep-alive", "keepalive", group=self.groupid):
+                self.host.whois(self.groupid, need=0, seq=0)
+        self.last_activity = time.monotonic()
+        if len(self.assigned_drones) > 0:
+            self.host.leases.renew(self)
 
-    def _timer_setup(self):
-        if self.timer:
-            self.timer.cancel()
-        self.timer = threading.Timer(self.idle_intval, self._timer_action)
-        self.timer.setDaemon(True)
-        self.timer.start()
+    def _touch(self):
+        self.last_activity = time.monotonic()
+        self.host.leases.renew(self)
 
     def _assign_drones(self, drones: list) -> list:
         """Send `!assign` command to list of drones
@@ -73,93 +93,191 @@ class DroneGroup(object):
         return assigned_drones
 
     def assign(
-        self, min_drones: int = 1, max_drones: int = None, board: str = "generic"
+        self,
+        min_drones: int = 1,
+        max_drones: int = None,
+        board: str = "generic",
+        candidates: list = None,
+        priority: int = 0,
+        timeout: float = None,
+        slots: int = None,
     ) -> list:
         """Assign new drones to a group
 
-        Assigning works by sending a `!whois` broadcast message and wait for
-        the responses of unassigned drones. A number of drones between
-        `max_drones` and `min_drones` is then tried to assign, meaning the drones
-        wont respond to other requests for that time.
+        Drones are leased from the lease manager of the host, which shares
+        the unassigned drones of the inventory between all groups and only
+        broadcasts a `!whois` if it does not know enough drones. A number of
+        drones between `max_drones` and `min_drones` is then tried to assign,
+        meaning the drones wont respond to other requests for that time.
+        Drones refusing the assignment are replaced by further leases.
+
+        If `candidates` are given they are assigned directly instead. Drones
+        still in this group are taken over, they are looked for if the
+        inventory lists members of the group or has no record of it.
 
         Args:
             max_drones (int): Maximal number of drones required
             min_drones (int): Mimimal number of drones required
             board (str): Limit assignment to specific board
+            candidates (list): Drones to assign instead of leased ones
+            priority (int): Lease requests with higher priority are served
+                first
+            timeout (float): Seconds to wait for drones released by other
+                groups
+            slots (int): Number of groups expected to share the drones
 
         Returns:
             list: New member of group
+
+        Raises:
+            DroneNotFoundError: Not enough drones could be assigned
         """
         logger.debug(
             f"Assign {min_drones}/{max_drones} {board} drones to {self.groupid}"
         )
+        self.host.keepalive.add(self)
+        leases = self.host.leases
 
         if not max_drones:
             max_drones = min_drones
 
-        ingroup = self.host.whois(self.groupid, max_drones, board=board)
-
-        if max_drones >= len(ingroup) >= min_drones:
-            self.assigned_drones.update(list(ingroup.keys()))
-            return list(ingroup.keys())
-
-        available = list(
-            self.host.whois(UDRONE_GROUP_DEFAULT, max_drones, board=board).keys()
-        )[:max_drones]
-
-        if len(available) < min_drones:
-            logger.error("You must construct additional drones")
-            quit(1)
-        new_members = self._assign_drones(available)
-
-        if len(new_members) < min_drones:
-            max_drones -= len(new_members)
-            available = list(self.host.whois(UDRONE_GROUP_DEFAULT, max_drones).keys())[
-                :max_drones
-            ]
-            new_members += self._assign_drones(available)
-
-        if len(new_members) < min_drones:
-            if len(new_members) > 0:  # Rollback
-                self.host.call_multi(new_members, None, "!reset", None, "status")
-            raise DroneNotFoundError((ENOENT, "You must construct additional drones"))
-
-        return new_members
+        if candidates is not None:
+            candidates = list(candidates)[:max_drones]
+            leases.claim(self, candidates)
+            new_members = self._assign_drones(candidates)
+            leases.release(self, set(candidates) - new_members)
+            if len(new_members) < min_drones:
+                self._rollback(new_members)
+                raise DroneNotFoundError(
+                    (ENOENT, "You must construct additional drones")
+                )
+            return list(new_members)
+
+        new_members = set()
+        inventory = self.host.inventory
+        if (
+            inventory.candidates(board, self.groupid)
+            or self.groupid not in inventory.groups()
+        ):
+            ingroup = self.host.whois(self.groupid, max_drones, board=board)
+            if max_drones >= len(ingroup) >= min_drones:
+                leases.claim(self, ingroup)
+                self.assigned_drones.update(ingroup)
+                return list(ingroup)
+
+        while len(new_members) < min_drones:
+            try:
+                leased = leases.acquire(
+                    self,
+                    min_drones - len(new_members),
+                    max_drones - len(new_members),
+                    board,
+                    priority,
+                    timeout,
+                    slots,
+                )
+            except DroneNotFoundError:
+                self._rollback(new_members)
+                raise
+            assigned = self._assign_drones(leased)
+            leases.release(self, set(leased) - assigned)  # Busy or gone
+            new_members |= assigned
+
+        return list(new_members)
+
+    def _rollback(self, drones: set):
+        """Reset drones assigned by a failed assignment"""
+        if len(drones) > 0:
+            self.host.call_multi(list(drones), None, "!reset", None, "status")
+            self.assigned_drones -= drones
+        self.host.leases.release(self, drones)
 
     def reset(self, reset=None):
 
+        self.host.keepalive.remove(self)
         if len(self.assigned_drones) < 1:
+            self.host.leases.release(self)
             return
         expect = self.assigned_drones.copy()
         self.host.reset(self.groupid, reset, expect)
+        self.host.leases.release(self, self.assigned_drones - expect)
         self.assigned_drones = expect
         if len(expect) > 0:
             logger.error("Request Timeout")
             quit(1)
 
-    def request(self, msg_type, data=None, timeout=60):
+    def request(self, msg_type, data=None, timeout=60, stream=None, drones=None):
+        """Send a request to all drones of the group and collect their answers
 
+        Args:
+            msg_type (str): Type of the request
+            data (dict): Data of the request
+            timeout (int): Seconds to wait for all answers
+            stream (callable): Called with drone ID and the next part of the
+                serialized answer while large answers are transferred
+            drones (set): Send the request to these members only, each
+                addressed individually
+
+        Returns:
+            dict: Answers by drone, None for drones without answer
+        """
         if len(self.assigned_drones) < 1:
             raise DroneNotFoundError((ENOENT, "Drone group is empty"))
         if msg_type[0] != "!":
-            self.seq += 1
-            seq = self.seq
+            with self.seq_lock:  # Tasks of a suite may run concurrently
+                self.seq += 1
+                seq = self.seq
         else:
             seq = self.host.genseq()
 
-        pending = self.assigned_drones.copy()
+        if drones is not None and set(drones) >= self.assigned_drones:
+            drones = None
+
+        with self.host.dispatcher.subscribe(seq):
+            if stream is None:
+                return self._request(seq, msg_type, data, timeout, drones)
+            with self.host.chunks.stream(seq, stream):
+                return self._request(seq, msg_type, data, timeout, drones)
+
+    def _request(self, seq, msg_type, data, timeout, drones=None):
+        if drones is None:
+            pending = self.assigned_drones.copy()
+        else:
+            pending = set(drones) & self.assigned_drones
         i = 0
         answers = {}
+        accepts = {}
         start = time.time()
+        started = time.monotonic()
         now = start
-        self._timer_setup()
+        self._touch()
 
         while len(pending) > 0 and (now - start) >= 0 and (now - start) < timeout:
             expect = pending.copy()
             i += 1
-            if i % 2 == 1:
+            if i % 2 == 1 and drones is not None:
+                answers.update(
+                    self.host.call_multi(
+                        expect,
+                        seq,
+                        msg_type,
+                        data,
+                        retransmit=i > 1,
+                        started=started,
+                    )
+                )
+            elif i % 2 == 1:
                 answers.update(
-                    self.host.call(self.groupid, seq, msg_type, data, expect=expect)
+                    self.host.call(
+                        self.groupid,
+                        seq,
+                        msg_type,
+                        data,
+                        expect=expect,
+                        retransmit=i > 1,
+                        members=len(self.assigned_drones),
+                        started=started,
+                    )
                 )
             else:
                 self.host.recv_until(
@@ -168,44 +286,68 @@ class DroneGroup(object):
                     expect=expect,
                     timeout=min(10, timeout - (now - start)),
                 )
+                self.host.observe(answers, msg_type, started)
 
             for drone in expect:  # Timed out
                 answers[drone] = None
             for drone, ans in answers.items():
                 if ans and ans["type"] == "accept":
                     answers[drone] = None  # In Progress
+                    accepts[drone] = accepts.get(drone, 0) + 1
+                    self.host.metrics.accepted(msg_type)
                 elif drone in pending and ans is not None:
                     pending.remove(drone)
             now = time.time()
-            self._timer_setup()
+            self._touch()
+
+        for drone, count in accepts.items():
+            if answers.get(drone) is not None:
+                answers[drone].accepts = count
         return answers
 
-    def call(self, msg_type, data=None, timeout=60, result={}):
-        result.update(self.request(msg_type, data, timeout))
+    def call(
+        self, msg_type, data=None, timeout=60, result=None, stream=None, drones=None
+    ):
+        if result is None:
+            result = {}
+        result.update(self.request(msg_type, data, timeout, stream, drones))
+        return evaluate(result, self.assigned_drones)
 
-        for drone, answer in result.items():
-            if not answer:
-                logger.warning(f"Unreachable drone {drone}")
-                result[drone]["status"] = "unreachable"
-                continue
 
-            if drone not in self.assigned_drones:
-                logger.warning(f"Unknown drone {drone} responded")
-                continue
+def evaluate(result: dict, assigned_drones: set) -> dict:
+    """Add a `status` to every answer of a group request
 
-            if answer["type"] == "unsupported":
-                logger.warning(f"Unsupported call for {drone}")
-                result[drone]["status"] = "unsupported"
-                continue
+    Args:
+        result (dict): Answers of a request by drone ID
+        assigned_drones (set): Drones expected to answer
 
-            if answer.get("type") ==  "status":
-                if answer.get("data", {}).get("code", 0) > 0:
-                    errstr = answer.get("data", {}).get("errstr")
-                    errcode = answer.get("data", {}).get("code")
-                    logger.warning(f"drone {drone} responded with {errcode}: {errstr}")
-                    result[drone]["status"] = "failed"
-                    continue
+    Returns:
+        dict: Answers including their status
+    """
+    for drone, answer in result.items():
+        if not answer:
+            logger.warning(f"Unreachable drone {drone}")
+            result[drone] = {"status": "unreachable"}
+            continue
+
+        if drone not in assigned_drones:
+            logger.warning(f"Unknown drone {drone} responded")
+            result[drone]["status"] = "unknown"
+            continue
+
+        if answer["type"] == "unsupported":
+            logger.warning(f"Unsupported call for {drone}")
+            result[drone]["status"] = "unsupported"
+            continue
+
+        if answer.get("type") == "status":
+            if answer.get("data", {}).get("code", 0) > 0:
+                errstr = answer.get("data", {}).get("errstr")
+                errcode = answer.get("data", {}).get("code")
+                logger.warning(f"drone {drone} responded with {errcode}: {errstr}")
+                result[drone]["status"] = "failed"
+                continue
 
-            result[drone]["status"] = "ok"
+        result[drone]["status"] = "ok"
 
-        return result
+    return result
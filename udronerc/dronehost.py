@@ -1,45 +1,172 @@
-from errno import EWOULDBLOCK
 import binascii
-import json
 import logging
 import os
-import select
 import socket
 import struct
 import time
 import fcntl
 
-from .constants import UDRONE_ADDR, UDRONE_RESENT_STRATEGY, UDRONE_MAX_DGRAM
+from .constants import (
+    UDRONE_ADDR,
+    UDRONE_MAX_DGRAM,
+    UDRONE_RESENT_ATTEMPTS,
+    UDRONE_UNICAST_RATIO,
+    UDRONE_WHOIS_WINDOW,
+)
+from .capture import Capture, RecordingSocket
+from .chunks import Reassembler
+from .codec import Envelope, get_codec
+from .dispatcher import Dispatcher
 from .dronegroup import DroneGroup
+from .hostbase import HostBase
+from .inventory import Inventory
+from .keepalive import KeepAliveScheduler
+from .leases import LeaseManager
+from .metrics import Metrics
+from .rtt import RttTable
+from .trace import Tracer
+from .ucicache import UciCache
 
 logger = logging.getLogger(__name__)
 
 
-class DroneHost(object):
-    def __init__(self, local_ip=None, hostid=None):
+class DroneHost(HostBase):
+    """Controller talking to drones on one or more network interfaces
+
+    One socket is opened per local address. Group messages are sent on every
+    socket, replies of all sockets are received by the dispatcher. The socket
+    a drone last answered on is remembered, so messages addressed to a
+    single drone, e.g. unicast retransmits, only leave on its interface.
+    """
+
+    def __init__(
+        self,
+        local_ip=None,
+        hostid=None,
+        addr=None,
+        codec=None,
+        inventory=None,
+        interfaces=None,
+        capture=None,
+        replay=None,
+    ):
+        """
+        Args:
+            local_ip (str): Local address or list of local addresses to send
+                multicasts from, None uses the default interface
+            hostid (str): ID of the host, random if not set
+            addr (tuple): Multicast address and port of the drones
+            codec (str): Name of the message codec
+            inventory (Path): File to persist the drone inventory in
+            interfaces (list): Names of local interfaces whose addresses are
+                used in addition to `local_ip`
+            capture (Path): Record all datagrams to this capture file
+            replay (Replay): Talk to a recorded capture instead of the
+                network, the host ID defaults to the recorded one
+        """
+        if replay and not hostid:
+            hostid = replay.hostid
         if not hostid:
             self.hostid = f"udronerc_{binascii.hexlify(os.urandom(3)).decode()}"
         else:
             self.hostid = hostid
 
-        logger.info(f"Initializing host on {local_ip} with ID {self.hostid}")
-        self.addr = UDRONE_ADDR
-        self.resent_strategy = UDRONE_RESENT_STRATEGY
+        if isinstance(local_ip, (list, tuple)):
+            local_ips = list(local_ip)
+        else:
+            local_ips = [local_ip] if local_ip else []
+        for interface in interfaces or ():
+            local_ips.append(self.get_ip_address(interface))
+        self.local_ips = local_ips or [None]
+
+        logger.info(f"Initializing host on {local_ips} with ID {self.hostid}")
+        self.addr = addr or UDRONE_ADDR
+        self.resent_attempts = UDRONE_RESENT_ATTEMPTS
+        self.rtt = RttTable()
+        self.inventory = Inventory(None if replay else inventory, self.rtt)
+        self.unicast_ratio = UDRONE_UNICAST_RATIO
         self.maxsize = UDRONE_MAX_DGRAM
+        self.buffer = bytearray(self.maxsize)
+        self.view = memoryview(self.buffer)
+        self.codec = get_codec(codec)
+        self.envelope = Envelope(self.hostid, self.codec)
+        self.hostid_bytes = self.hostid.encode("utf-8")
+        self.counters = {
+            "packets": 0,
+            "bytes": 0,
+            "foreign": 0,
+            "malformed": 0,
+            "dropped": 0,
+        }
+        self.metrics = Metrics(self.counters)
+        self.tracer = Tracer(enabled=False)
+        self.chunks = Reassembler(self)
+        self.uci = UciCache()
+        self.leases = LeaseManager(self)
+
+        self.replay = replay
+        if replay:
+            self.inventory.restore(replay.meta.get("inventory", {}))
+            self.sockets = replay.open()
+        else:
+            self.sockets = [self._open(ip) for ip in self.local_ips]
+        self.capture = None
+        if capture:
+            self.capture = Capture(
+                capture,
+                {
+                    "hostid": self.hostid,
+                    "interfaces": len(self.sockets),
+                    "inventory": self.inventory.snapshot(),
+                },
+            )
+            self.sockets = [
+                RecordingSocket(sock, self.capture, i)
+                for i, sock in enumerate(self.sockets)
+            ]
+        self.routes = {}
 
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.bind(("", 0))
+        self.groups = []
 
-        self.socket.setsockopt(
-            socket.SOL_IP, socket.IP_MULTICAST_IF, socket.inet_aton(local_ip)
-        )
+        self.dispatcher = Dispatcher(self)
+        self.dispatcher.start()
+        self.keepalive = KeepAliveScheduler()
+        self.keepalive.start()
+        if replay:
+            replay.start()
+
+    def close(self):
+        """Stop receiving, close the socket and persist the inventory"""
+        self.keepalive.stop()
+        self.dispatcher.stop()
+        if self.replay:
+            self.replay.stop()
+        for sock in self.sockets:
+            sock.close()
+        if self.capture:
+            self.capture.close()
+        self.inventory.save()
+
+    def _open(self, local_ip: str = None) -> socket.socket:
+        """Open a socket sending multicasts on the interface of an address
 
-        self.socket.setblocking(0)
+        Args:
+            local_ip (str): Local address, None uses the default interface
 
-        self.poll = select.poll()
-        self.poll.register(self.socket, select.POLLIN)
+        Returns:
+            socket.socket: Non-blocking UDP socket
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+        sock.bind(("", 0))
 
-        self.groups = []
+        if local_ip:
+            sock.setsockopt(
+                socket.SOL_IP, socket.IP_MULTICAST_IF, socket.inet_aton(local_ip)
+            )
+
+        sock.setblocking(0)
+        return sock
 
     def get_ip_address(self, interface: str) -> str:
         """
@@ -51,14 +178,14 @@ class DroneHost(object):
         Returns:
             str: IP address of interface
         """
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        return socket.inet_ntoa(
-            fcntl.ioctl(
-                s.fileno(),
-                0x8915,
-                struct.pack("256s", interface[:15].encode("utf-8")),  # SIOCGIFADDR
-            )[20:24]
-        )
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            return socket.inet_ntoa(
+                fcntl.ioctl(
+                    s.fileno(),
+                    0x8915,
+                    struct.pack("256s", interface[:15].encode("utf-8")),  # SIOCGIFADDR
+                )[20:24]
+            )
 
     def genseq(self) -> int:
         """
@@ -67,55 +194,106 @@ class DroneHost(object):
         Returns:
             int: generated sequence
         """
-        return struct.unpack("=I", os.urandom(4))[0] % 2000000000
+        if self.replay:
+            return self.replay.genseq()
+        seq = struct.unpack("=I", os.urandom(4))[0] % 2000000000
+        if self.capture:
+            self.capture.seq(seq)
+        return seq
 
     def send(self, to: str, seq: int, msg_type: str, data: dict = {}):
         """
         Send message to drone
 
+        Messages to a drone which answered before are sent on the socket it
+        answered on, all other messages on every socket.
+
         Args:
             to (str): receiving group
             seq (int): sequence number
             msg_type (str): type of message to receive
             data (dict): data to send to node
         """
-        msg = {
-            "from": self.hostid,
-            "to": to,
-            "type": msg_type,
-            "seq": seq,
-            "data": data,
-        }
-        packet = json.dumps(msg, separators=(",", ":"))
-        logger.debug(f"Sending: {packet}")
-        self.socket.sendto(packet.encode("utf-8"), self.addr)
+        packet = self.envelope.encode(to, seq, msg_type, data)
+        logger.debug("Sending: %s", packet)
+        sock = self.routes.get(to)
+        sockets = [sock] if sock else self.sockets
+        with self.tracer.span("send", "net", to=to, type=msg_type, seq=seq):
+            for sock in sockets:
+                sock.sendto(packet, self.addr)
+                self.metrics.send(len(packet))
+
+    def interface(self, drone: str) -> str:
+        """
+        Args:
+            drone (str): Drone ID
+
+        Returns:
+            str: Local address the drone last answered on, None if unknown
+                or sent from the default interface
+        """
+        sock = self.routes.get(drone)
+        if sock is None:
+            return None
+        index = self.sockets.index(sock)
+        return self.local_ips[index] if index < len(self.local_ips) else None
 
-    def recv(self, seq: int, msg_type: str = None) -> dict:
+    def recv_batch(self, sock: socket.socket = None, limit: int = 64) -> list:
         """
-        Recevie messages from drones
+        Drain pending datagrams addressed to this host from a socket
+
+        Datagrams are read into a reusable buffer. Packets not containing the
+        host ID can't be addressed to this host and are dropped before JSON
+        decoding, e.g. traffic of other controllers on the multicast group.
+        Only the dispatcher reads from the socket, callers wait for replies
+        via `recv_until`.
 
         Args:
-            seq (int): sequence number
-            msg_type (str): type of message to receive
+            sock (socket.socket): socket to read, defaults to the first one
+            limit (int): maximal number of datagrams to read
 
         Returns:
-            dict: received message from drone
+            list: received messages from drones, empty if none is pending
         """
-        while True:
+        if sock is None:
+            sock = self.sockets[0]
+        messages = []
+        begin = time.perf_counter()
+        for _ in range(limit):
             try:
-                msg = json.loads(self.socket.recv(self.maxsize))
-                if (
-                    msg["from"]
-                    and msg["type"]
-                    and msg["to"] == self.hostid
-                    and (not msg_type or msg["type"] == msg_type)
-                    and (not seq or msg["seq"] == seq)
-                ):
-                    logger.debug(f"Received: {msg}")
-                    return msg
-            except Exception as e:
-                if isinstance(e, socket.error) and e.errno == EWOULDBLOCK:
-                    return None
+                size = sock.recv_into(self.buffer)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                logger.warning(f"Receiving failed: {e}")
+                break
+
+            self.counters["packets"] += 1
+            self.counters["bytes"] += size
+            if self.buffer.find(self.hostid_bytes, 0, size) < 0:
+                self.counters["foreign"] += 1
+                continue
+
+            msg = self.decode(self.view[:size])
+            if msg is None:
+                continue
+            if msg.to != self.hostid:
+                self.counters["foreign"] += 1
+                continue
+
+            logger.debug("Received: %s", msg)
+            msg.received = time.monotonic()
+            self.routes[msg.sender] = sock
+            messages.append(msg)
+        if messages and self.tracer:
+            self.tracer.complete(
+                "recv_batch",
+                "net",
+                begin,
+                time.perf_counter(),
+                {"messages": len(messages)},
+            )
+        return messages
 
     def recv_until(
         self,
@@ -124,6 +302,8 @@ class DroneHost(object):
         msg_type: str = None,
         timeout: int = 1,
         expect: list = None,
+        sent: float = None,
+        request: str = None,
     ):
         """
         Recevie messages from drones until requirement is fulfilled
@@ -134,6 +314,8 @@ class DroneHost(object):
             msg_type (str): type of message to receive
             timeout (int): number of seconds before receiving timeouts
             expect (list): list of drones expected to anser
+            sent (float): time the request was sent, used to sample round
+                trip times if the request was not retransmitted
         """
 
         logger.debug(
@@ -142,23 +324,19 @@ class DroneHost(object):
             timeout,
             expect,
         )
-        start = time.time()
-        now = start
-        while (
-            (now - start) >= 0
-            and (now - start) < timeout
-            and (expect is None or len(expect) > 0)
-        ):
-            self.poll.poll((timeout - (now - start)) * 1000)
-            while True:
-                msg = self.recv(seq, msg_type)
-                if msg:
-                    answers[msg["from"]] = msg
-                    if expect is not None and msg["from"] in expect:
-                        expect.remove(msg["from"])
-                elif not msg:
+        deadline = time.time() + timeout
+        with self.dispatcher.subscribe(seq) as waiter:
+            while expect is None or len(expect) > 0:
+                msg = waiter.get(deadline - time.time())
+                if not msg:
                     break
-            now = time.time()
+                if msg_type and msg.type != msg_type:
+                    continue
+                if sent and request and msg.sender not in answers:
+                    self.sample(msg, request, time.time() - sent)
+                answers[msg.sender] = msg
+                if expect is not None and msg.sender in expect:
+                    expect.remove(msg.sender)
 
     def call(
         self,
@@ -168,10 +346,19 @@ class DroneHost(object):
         data: dict = None,
         resp_type: str = None,
         expect: list = None,
+        retransmit: bool = False,
+        members: int = None,
+        started: float = None,
     ) -> dict:
         """
         Send data to drone and receive response
 
+        The time to wait for answers is the retransmission timeout of the
+        slowest expected drone. Retransmissions are addressed to the still
+        pending drones instead of the group if only a small share of the
+        group members is pending, so drones which already answered do not
+        receive the request again.
+
         Args:
             to (str): selected group
             seq (int): sequence number
@@ -179,6 +366,11 @@ class DroneHost(object):
             data (dict): data to send to group
             resp_type (str): receive message of type
             expect (list): list of drones expected to anser
+            retransmit (bool): the sequence was sent before
+            members (int): number of drones in the group, defaults to the
+                number of expected drones
+            started (float): monotonic time the sequence was first sent,
+                latencies are measured from it
 
         Returns:
             dict: received message from drones
@@ -188,14 +380,73 @@ class DroneHost(object):
             seq = self.genseq()
 
         answers = {}
-
-        for timeout in self.resent_strategy:
-            self.send(to, seq, msg_type, data)
-            self.recv_until(answers, seq, resp_type, timeout, expect)
-            if expect is not None and len(expect) == 0:
-                break
+        if expect is not None and members is None:
+            members = len(expect)
+        if started is None:
+            started = time.monotonic()
+
+        with self.dispatcher.subscribe(seq):
+            for attempt in range(self.resent_attempts):
+                timeout = self.rtt.timeout(expect)
+                sent = time.time() if attempt == 0 and not retransmit else None
+                with self._round(msg_type, seq, attempt > 0 or retransmit, expect):
+                    if (attempt > 0 or retransmit) and self.unicast(expect, members):
+                        for drone in list(expect):
+                            self.send(drone, seq, msg_type, data)
+                        self.metrics.retransmit(msg_type, len(expect))
+                    else:
+                        self.send(to, seq, msg_type, data)
+                        if attempt > 0 or retransmit:
+                            self.metrics.retransmit(msg_type)
+                    self.recv_until(
+                        answers, seq, resp_type, timeout, expect, sent, msg_type
+                    )
+                if expect is not None and len(expect) == 0:
+                    break
+                if expect:
+                    self.rtt.expired(expect)
+        for drone in expect or ():
+            self.metrics.timeout(drone)
+        self.observe(answers, msg_type, started)
+        self.track(msg_type, data, answers, expect)
         return answers
 
+    def track(self, msg_type: str, data, answers: dict, pending=None):
+        """Update the inventory after assigning or resetting drones
+
+        The known UCI state of reset or upgraded drones is dropped.
+
+        Args:
+            msg_type (str): type of the request
+            data (dict): data of the request
+            answers (dict): received messages by drone
+            pending (list): drones which did not answer
+        """
+        if msg_type in ("!reset", "upgrade"):
+            self.uci.forget(list(answers) + list(pending or ()))
+        if msg_type not in ("!assign", "!reset"):
+            return
+        done = [
+            drone
+            for drone, msg in answers.items()
+            if msg and (msg.data or {}).get("code") == 0
+        ]
+        if msg_type == "!assign":
+            self.inventory.update(done, data["group"])
+            self.inventory.forget(set(answers) - set(done))
+        else:
+            self.inventory.update(done, None)
+        self.inventory.forget(pending or ())
+
+    def _round(self, msg_type: str, seq: int, retransmit: bool, pending=None):
+        return self.tracer.span(
+            "retransmit" if retransmit else "request",
+            "round",
+            type=msg_type,
+            seq=seq,
+            pending=None if pending is None else len(pending),
+        )
+
     def call_multi(
         self,
         nodes: list,
@@ -203,6 +454,8 @@ class DroneHost(object):
         msg_type: str,
         data: dict = None,
         resp_type: str = None,
+        retransmit: bool = False,
+        started: float = None,
     ) -> dict:
         """
         Send data to multiple drones and receive responses
@@ -213,6 +466,9 @@ class DroneHost(object):
             msg_type (str): send message of type
             data (dict): data to send to group
             resp_type (str): receive message of type
+            retransmit (bool): the sequence was sent before
+            started (float): monotonic time the sequence was first sent,
+                latencies are measured from it
 
         Returns:
             dict: received message from drones
@@ -222,13 +478,28 @@ class DroneHost(object):
             seq = self.genseq()
 
         answers = {}
-
-        for timeout in self.resent_strategy:
-            for node in nodes:
-                self.send(node, seq, msg_type, data)
-            self.recv_until(answers, seq, resp_type, timeout, nodes)
-            if len(nodes) == 0:
-                break
+        if started is None:
+            started = time.monotonic()
+
+        with self.dispatcher.subscribe(seq):
+            for attempt in range(self.resent_attempts):
+                timeout = self.rtt.timeout(nodes)
+                sent = time.time() if attempt == 0 and not retransmit else None
+                with self._round(msg_type, seq, attempt > 0 or retransmit, nodes):
+                    for node in nodes:
+                        self.send(node, seq, msg_type, data)
+                    if attempt > 0 or retransmit:
+                        self.metrics.retransmit(msg_type, len(nodes))
+                    self.recv_until(
+                        answers, seq, resp_type, timeout, nodes, sent, msg_type
+                    )
+                if len(nodes) == 0:
+                    break
+                self.rtt.expired(nodes)
+        for node in nodes:
+            self.metrics.timeout(node)
+        self.observe(answers, msg_type, started)
+        self.track(msg_type, data, answers, nodes)
         return answers
 
     def whois(
@@ -250,18 +521,31 @@ class DroneHost(object):
         answers = {}
         if seq is None:
             seq = self.genseq()
-        for timeout in self.resent_strategy:
-            data = {}
-            if board:
-                data["board"] = board
+        data = {}
+        if board:
+            data["board"] = board
 
+        if need == 0:
             self.send(group, seq, "!whois", data)
-            if need == 0:
-                break
-            self.recv_until(answers, seq, "status", timeout)
-            if need and len(answers) >= need:
-                break
+            return answers
+
+        started = time.monotonic()
+        with self.dispatcher.subscribe(seq):
+            for attempt in range(self.resent_attempts):
+                # Replies of many drones spread beyond the RTO of single ones
+                timeout = max(self.rtt.timeout(), UDRONE_WHOIS_WINDOW)
+                sent = time.time() if attempt == 0 else None
+                with self._round("!whois", seq, attempt > 0):
+                    self.send(group, seq, "!whois", data)
+                    if attempt > 0:
+                        self.metrics.retransmit("!whois")
+                    self.recv_until(
+                        answers, seq, "status", timeout, sent=sent, request="!whois"
+                    )
+                if need and len(answers) >= need:
+                    break
 
+        self.observe(answers, "!whois", started)
         return answers
 
     def reset(self, whom, how=None, expect=None):
@@ -269,7 +553,7 @@ class DroneHost(object):
         return self.call(whom, None, "!reset", data, "status", expect)
 
     def Group(self, groupid: str, absolute: bool = False):
-        """Create new group
+        """Create new group or return the existing group of the name
 
         Args:
             groupid (str): Name of the new group
@@ -281,6 +565,10 @@ class DroneHost(object):
         if not absolute:
             groupid = f"{self.hostid}_{groupid}"
 
+        for group in self.groups:
+            if group.groupid == groupid:
+                return group
+
         group = DroneGroup(self, groupid)
         self.groups.append(group)
         return group
@@ -288,4 +576,5 @@ class DroneHost(object):
     def disband(self, reset=None):
         for group in self.groups:
             group.reset(reset)
+            self.keepalive.remove(group)
         self.groups = []
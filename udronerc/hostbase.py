@@ -0,0 +1,94 @@
+import logging
+
+from .message import Message
+
+logger = logging.getLogger(__name__)
+
+
+class HostBase(object):
+    """Request bookkeeping shared by `DroneHost` and `AsyncDroneHost`
+
+    Both hosts decode replies, decide about retransmits and record metrics
+    the same way, only sending and receiving differ. Subclasses provide
+    `codec`, `counters`, `metrics`, `rtt` and `unicast_ratio`.
+    """
+
+    def decode(self, packet) -> Message:
+        """Decode a received datagram
+
+        Replies are routed by their sender, type and sequence number, so
+        datagrams with fields of another type are dropped as malformed
+        instead of breaking the receive loop.
+
+        Args:
+            packet (bytes): Raw datagram
+
+        Returns:
+            Message: Decoded message, None if malformed
+        """
+        try:
+            msg = Message.from_dict(self.codec.loads(packet))
+        except (self.codec.error, KeyError, TypeError):
+            msg = None
+        if (
+            msg is None
+            or not isinstance(msg.sender, str)
+            or not isinstance(msg.type, str)
+            or not isinstance(msg.seq, int)
+            or not msg.sender
+            or not msg.type
+        ):
+            self.counters["malformed"] += 1
+            logger.debug("Dropping malformed datagram: %s", bytes(packet[:80]))
+            return None
+        return msg
+
+    def sample(self, msg, request: str, rtt: float):
+        """Sample the round trip time of the first reply to a request
+
+        Drones answer `!` control messages and send `accept` replies right
+        away. Final answers of other requests include the time the command
+        ran on the drone and would inflate the timeouts, they are not
+        sampled. Callers must not pass replies to retransmitted requests
+        (Karn's algorithm).
+
+        Args:
+            msg (Message): first reply of a drone
+            request (str): type of the request
+            rtt (float): seconds between sending the request and the reply
+        """
+        if request.startswith("!") or msg.type == "accept":
+            self.rtt.sample(msg.sender, rtt)
+
+    def observe(self, answers: dict, msg_type: str, started: float):
+        """Record the latency of answers to a request
+
+        Every answer is measured once, `accept` replies are not final and
+        are skipped.
+
+        Args:
+            answers (dict): received messages by drone
+            msg_type (str): type of the request
+            started (float): monotonic time the request was first sent
+        """
+        for drone, msg in answers.items():
+            if msg is None or msg.received is None or msg.latency is not None:
+                continue
+            if msg.type == "accept":
+                continue
+            msg.latency = msg.received - started
+            self.metrics.observe(drone, msg_type, msg.latency)
+
+    def unicast(self, pending, members: int) -> bool:
+        """Decide whether to address pending drones individually
+
+        Args:
+            pending (set): drones without answer
+            members (int): number of drones in the addressed group
+
+        Returns:
+            bool: retransmit to each pending drone instead of the group
+        """
+        if not pending:
+            return False
+        return len(pending) <= max(1, members * self.unicast_ratio)
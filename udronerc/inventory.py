@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from .constants import UDRONE_INVENTORY_TTL
+from .rtt import RttTable
+
+logger = logging.getLogger(__name__)
+
+
+class Inventory(object):
+    """Drones recently heard of by a host
+
+    Every reply received by the host updates the last seen time of its
+    sender, `!whois` answers and keep-alive replies additionally carry the
+    board and group. Drones not heard of for `ttl` seconds are considered
+    gone. The inventory is kept on disk between runs, so groups can assign
+    known drones directly instead of discovering them by broadcast first.
+    """
+
+    def __init__(
+        self, path: Path = None, rtt: RttTable = None, ttl: float = UDRONE_INVENTORY_TTL
+    ):
+        """
+        Args:
+            path (Path): File to persist the inventory in, None keeps it in
+                memory only
+            rtt (RttTable): Round trip times of the host, restored from and
+                persisted with the inventory
+            ttl (float): Seconds after which unheard drones expire
+        """
+        self.path = Path(path) if path else None
+        self.rtt = rtt
+        self.ttl = ttl
+        self.drones = {}
+        self.lock = threading.Lock()
+        if self.path and self.path.is_file():
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.drones)
+
+    def load(self):
+        """Load fresh drones from the inventory file"""
+        try:
+            drones = json.loads(self.path.read_text())
+        except ValueError as e:
+            logger.warning(f"Ignoring corrupt inventory {self.path}: {e}")
+            return
+
+        now = time.time()
+        with self.lock:
+            for drone, record in drones.items():
+                if now - record["last_seen"] > self.ttl:
+                    continue
+                self.drones[drone] = record
+                if self.rtt is not None and record.get("rtt"):
+                    self.rtt.sample(drone, record["rtt"])
+        logger.debug(f"Loaded {len(self.drones)} drones from {self.path}")
+
+    def save(self):
+        """Write fresh drones to the inventory file
+
+        The file is replaced atomically, so concurrent processes read either
+        the old or the new inventory.
+        """
+        if not self.path:
+            return
+        self.expire()
+        with self.lock:
+            drones = {drone: dict(record) for drone, record in self.drones.items()}
+        if self.rtt is not None:
+            for drone, record in drones.items():
+                record["rtt"] = self.rtt.get(drone).srtt
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        tmp.write_text(json.dumps(drones, indent="  "))
+        tmp.replace(self.path)
+        logger.debug(f"Stored {len(drones)} drones to {self.path}")
+
+    def _record(self, drone: str) -> dict:
+        record = self.drones.get(drone)
+        if record is None:
+            record = self.drones[drone] = {
+                "board": None,
+                "group": None,
+                "last_seen": 0,
+            }
+        return record
+
+    def seen(self, msg):
+        """Update the inventory from a received message
+
+        Args:
+            msg (Message): Message received from a drone
+        """
+        with self.lock:
+            record = self._record(msg.sender)
+            record["last_seen"] = time.time()
+            if msg.type == "status" and isinstance(msg.data, dict):
+                if "board" in msg.data:
+                    record["board"] = msg.data["board"]
+                if "group" in msg.data:
+                    record["group"] = msg.data["group"]
+
+    def update(self, drones, group: str = None):
+        """Set the group of drones after they were assigned or reset
+
+        Args:
+            drones (list): Drone IDs
+            group (str): New group, None for unassigned drones
+        """
+        with self.lock:
+            for drone in drones:
+                self._record(drone)["group"] = group
+
+    def forget(self, drones):
+        """Remove drones which did not answer
+
+        Args:
+            drones (list): Drone IDs
+        """
+        with self.lock:
+            for drone in drones:
+                self.drones.pop(drone, None)
+
+    def expire(self):
+        """Remove drones not heard of within the TTL"""
+        now = time.time()
+        with self.lock:
+            for drone in [
+                d for d, r in self.drones.items() if now - r["last_seen"] > self.ttl
+            ]:
+                del self.drones[drone]
+
+    def candidates(self, board: str = None, group: str = None) -> list:
+        """Return fresh drones, most recently seen first
+
+        Args:
+            board (str): Limit to drones of a board
+            group (str): Limit to drones of a group, None for unassigned
+
+        Returns:
+            list: Drone IDs
+        """
+        now = time.time()
+        with self.lock:
+            drones = [
+                (record["last_seen"], drone)
+                for drone, record in self.drones.items()
+                if now - record["last_seen"] <= self.ttl
+                and record["group"] == group
+                and (board is None or record["board"] == board)
+            ]
+        return [drone for _, drone in sorted(drones, reverse=True)]
+
+    def groups(self) -> dict:
+        """
+        Returns:
+            dict: Fresh drones by the group they are assigned to
+        """
+        now = time.time()
+        groups = {}
+        with self.lock:
+            for drone, record in self.drones.items():
+                if record["group"] and now - record["last_seen"] <= self.ttl:
+                    groups.setdefault(record["group"], []).append(drone)
+        return groups
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: Records of fresh drones with their age in seconds instead
+                of the time they were last seen
+        """
+        now = time.time()
+        with self.lock:
+            return {
+                drone: {
+                    "board": record["board"],
+                    "group": record["group"],
+                    "age": now - record["last_seen"],
+                }
+                for drone, record in self.drones.items()
+                if now - record["last_seen"] <= self.ttl
+            }
+
+    def restore(self, snapshot: dict):
+        """Replace the inventory by a snapshot
+
+        Args:
+            snapshot (dict): Records as returned by `snapshot`
+        """
+        now = time.time()
+        with self.lock:
+            self.drones = {
+                drone: {
+                    "board": record["board"],
+                    "group": record["group"],
+                    "last_seen": now - record["age"],
+                }
+                for drone, record in snapshot.items()
+            }
+
+    def state(self) -> dict:
+        """
+        Returns:
+            dict: Record of every known drone
+        """
+        with self.lock:
+            return {drone: dict(record) for drone, record in self.drones.items()}
@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from .constants import UDRONE_KEEPALIVE_SLACK
+
+logger = logging.getLogger(__name__)
+
+
+class KeepAliveScheduler(object):
+    """Send the keep-alives of all groups of a host from a single thread
+
+    Groups are kept in a heap ordered by the earliest time their keep-alive
+    may be sent. Requests of a group only update its last activity, the
+    scheduler notices the postponed deadline when the group comes up and
+    reschedules it without sending anything. A keep-alive may be sent up to
+    `slack` seconds (at most half the interval) early, so keep-alives falling
+    due close to each other are sent in one wake-up.
+    """
+
+    def __init__(self, slack: float = UDRONE_KEEPALIVE_SLACK):
+        """
+        Args:
+            slack (float): Seconds a keep-alive may be sent before it is due
+        """
+        self.slack = slack
+        self.heap = []
+        self.groups = {}
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, name="keepalive", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def _send_at(self, group) -> float:
+        slack = min(self.slack, group.idle_intval / 2)
+        return group.last_activity + group.idle_intval - slack
+
+    def _push(self, group, token: int, send_at: float = None) -> float:
+        if send_at is None:
+            send_at = self._send_at(group)
+        heapq.heappush(self.heap, (send_at, token, group))
+        return send_at
+
+    def add(self, group):
+        """Schedule the keep-alives of a group
+
+        Adding a scheduled group again reschedules it, e.g. after its
+        `idle_intval` changed.
+
+        Args:
+            group (DroneGroup): Group with `last_activity`, `idle_intval` and
+                a `_keepalive` method
+        """
+        with self.condition:
+            token = self.groups[group] = next(self.counter)
+            if self._push(group, token) <= self.heap[0][0]:
+                self.condition.notify()
+
+    def remove(self, group):
+        """Stop the keep-alives of a group
+
+        Heap entries of removed groups are dropped when they come up.
+        """
+        with self.condition:
+            self.groups.pop(group, None)
+
+    def _due(self) -> list:
+        """Pop all groups whose keep-alive is due, waiting until one is
+
+        Returns:
+            list: Groups and their tokens to send a keep-alive to, empty
+                when stopped
+        """
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                if self.heap[0][0] > now:
+                    self.condition.wait(self.heap[0][0] - now)
+                    continue
+
+                due = []
+                while self.heap and self.heap[0][0] <= now:
+                    _, token, group = heapq.heappop(self.heap)
+                    if self.groups.get(group) != token:
+                        continue
+                    if self._send_at(group) > now:
+                        self._push(group, token)  # Recent traffic postponed it
+                        continue
+                    due.append((group, token))
+                if due:
+                    return due
+            return []
+
+    def _run(self):
+        while self.running:
+            due = self._due()
+            logger.debug("Sending %i keep-alives", len(due))
+            failed = set()
+            for group, _ in due:
+                try:
+                    group._keepalive()
+                except Exception:
+                    logger.exception(f"Keep-alive of {group.groupid} failed")
+                    failed.add(group)
+            with self.condition:
+                for group, token in due:
+                    if self.groups.get(group) != token:
+                        continue
+                    if group in failed:  # Retry after an interval, not right away
+                        self._push(group, token, time.monotonic() + group.idle_intval)
+                    else:
+                        self._push(group, token)
@@ -0,0 +1,311 @@
+import itertools
+import logging
+import threading
+import time
+from errno import ENOENT, ETIMEDOUT
+
+from .constants import UDRONE_GROUP_DEFAULT, UDRONE_LEASE_TTL_FACTOR
+from .errors import DroneNotFoundError
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseRequest(object):
+    """Drones a group waits for"""
+
+    def __init__(
+        self,
+        group,
+        min_drones: int,
+        max_drones: int,
+        board: str,
+        priority: int,
+        slots: int,
+    ):
+        self.group = group
+        self.min_drones = min_drones
+        self.max_drones = max_drones
+        self.board = board
+        self.priority = priority
+        self.slots = slots
+        self.drones = None
+
+
+class LeaseManager(object):
+    """Hand out the drones known to a host to its groups
+
+    Groups request a number of drones between a minimum and a maximum of a
+    board and are queued by priority, then in order of arrival. Drones are
+    taken from the unassigned drones of the host inventory, so concurrently
+    starting groups do not race for the same `!whois` answers. A request
+    receives an equal share of the free drones among the groups expected to
+    run at the same time (`slots`, may be given per request) and the queued
+    requests. A request which
+    can not be served yet blocks later requests for the same board, so large
+    groups are not starved by small ones.
+
+    Leases are renewed by the requests and keep-alives of their group and
+    expire after `UDRONE_LEASE_TTL_FACTOR` keep-alive intervals without,
+    e.g. if the keep-alives of a group were stopped without reset. Released drones are handed to waiting groups right away, drones
+    of expired leases are reset by the next waiting group first. A request
+    gives up if it can not be served and no other group holding drones is
+    running, as nothing would release them.
+
+    Groups kept for a later run are parked. Their drones are taken back and
+    reset once a request can not be served otherwise, unless a suite runs on
+    the group again.
+    """
+
+    def __init__(
+        self, host, slots: int = 1, interval: float = 1.0, timeout: float = None
+    ):
+        """
+        Args:
+            host (DroneHost): Host whose inventory provides the drones
+            slots (int): Number of groups expected to hold drones at once
+            interval (float): Seconds between expiry checks while waiting
+            timeout (float): Seconds a request waits by default, None waits
+                as long as running groups may still release drones
+        """
+        self.host = host
+        self.slots = slots
+        self.interval = interval
+        self.timeout = timeout
+        self.leases = {}
+        self.renewed = {}
+        self.parked = set()
+        self.stale = {}
+        self.reclaiming = set()
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.discovery = threading.Lock()
+
+    def leased(self, group=None) -> list:
+        """
+        Args:
+            group (DroneGroup): Limit to drones of a group
+
+        Returns:
+            list: Leased drone IDs
+        """
+        with self.condition:
+            return [d for d, g in self.leases.items() if group is None or g is group]
+
+    def renew(self, group):
+        """Extend the leases of a group"""
+        with self.condition:
+            if group in self.renewed:
+                self.renewed[group] = time.monotonic()
+
+    def _free(self, board: str = None) -> list:
+        candidates = self.host.inventory.candidates(board)
+        return [d for d in candidates if d not in self.leases]
+
+    def _known(self, board: str = None) -> set:
+        known = set(self.host.inventory.candidates(board))
+        for group in set(self.renewed) | set(self.stale):
+            known.update(self.host.inventory.candidates(board, group.groupid))
+        known.update(self.reclaiming)
+        return known
+
+    def _running(self, group) -> bool:
+        """Whether another group holding drones may still release them"""
+        return any(g is not group and g.users > 0 for g in self.renewed)
+
+    def _expire(self):
+        now = time.monotonic()
+        for group, renewed in list(self.renewed.items()):
+            if now - renewed <= group.idle_intval * UDRONE_LEASE_TTL_FACTOR:
+                continue
+            drones = [d for d, g in self.leases.items() if g is group]
+            logger.warning(f"Leases of {group.groupid} expired, reclaiming {drones}")
+            self._release(group, drones)
+            self.stale.setdefault(group, set()).update(drones)
+
+    def _preempt(self, requester, board: str, need: int):
+        """Take back the drones of parked groups not running"""
+        for group in list(self.parked):
+            if need <= 0:
+                break
+            if group is requester or group.users > 0:
+                continue
+            drones = [d for d, g in self.leases.items() if g is group]
+            matching = set(drones)
+            matching &= set(self.host.inventory.candidates(board, group.groupid))
+            if not matching:
+                continue
+            logger.info(f"Taking back {drones} of kept group {group.groupid}")
+            self._release(group, drones)
+            self.stale.setdefault(group, set()).update(drones)
+            need -= len(matching)
+
+    def _reclaim(self):
+        """Reset drones of expired or taken back leases to lease them again"""
+        with self.condition:
+            stale, self.stale = self.stale, {}
+            for drones in stale.values():
+                self.reclaiming.update(drones)
+        if not stale:
+            return
+        try:
+            for group, drones in stale.items():
+                if not drones:
+                    continue
+                group.assigned_drones -= drones
+                if not group.assigned_drones:
+                    self.host.keepalive.remove(group)
+                self.host.call_multi(list(drones), None, "!reset", None, "status")
+        finally:
+            with self.condition:
+                for drones in stale.values():
+                    self.reclaiming -= drones
+                self._grant()
+
+    def _release(self, group, drones):
+        for drone in drones:
+            if self.leases.get(drone) is group:
+                del self.leases[drone]
+        if group not in self.leases.values():
+            self.renewed.pop(group, None)
+            self.parked.discard(group)
+
+    def _grant(self):
+        """Serve queued requests in order while drones are free"""
+        self._expire()
+        now = time.monotonic()
+        blocked = set()
+        for request in sorted(self.queue, key=lambda r: -r.priority):
+            if request.board in blocked or None in blocked:
+                continue
+            free = self._free(request.board)
+            if len(free) < request.min_drones:
+                need = request.min_drones - len(free)
+                self._preempt(request.group, request.board, need)
+                blocked.add(request.board)
+                continue
+            holders = len(set(self.leases.values()))
+            slots = request.slots or self.slots
+            share = len(free) // max(slots - holders, len(self.queue), 1)
+            drones = free[: max(request.min_drones, min(request.max_drones, share))]
+            for drone in drones:
+                self.leases[drone] = request.group
+            self.renewed[request.group] = now
+            self.parked.discard(request.group)
+            request.drones = drones
+            self.queue.remove(request)
+        self.condition.notify_all()
+
+    def _discover(self, need: int, min_drones: int, board: str):
+        """Look for unassigned drones if the inventory does not know enough"""
+        with self.discovery:
+            with self.condition:
+                if len(self._free(board)) >= min_drones:
+                    return
+            logger.debug(f"Discover {need} {board} drones")
+            self.host.whois(UDRONE_GROUP_DEFAULT, need, board=board)
+
+    def acquire(
+        self,
+        group,
+        min_drones: int = 1,
+        max_drones: int = None,
+        board: str = None,
+        priority: int = 0,
+        timeout: float = None,
+        slots: int = None,
+    ) -> list:
+        """Lease drones to a group, waiting until enough drones are free
+
+        Args:
+            group (DroneGroup): Group to lease drones to
+            min_drones (int): Minimal number of drones
+            max_drones (int): Maximal number of drones, defaults to the minimum
+            board (str): Limit to drones of a board
+            priority (int): Requests with higher priority are served first
+            timeout (float): Seconds to wait, defaults to the `timeout` of
+                the lease manager
+            slots (int): Number of groups expected to hold drones at once,
+                defaults to the `slots` of the lease manager
+
+        Returns:
+            list: Leased drones, not assigned yet
+
+        Raises:
+            DroneNotFoundError: Not enough drones exist, no running group may
+                release them or the timeout passed
+        """
+        max_drones = max(max_drones or min_drones, min_drones)
+        if timeout is None:
+            timeout = self.timeout
+        self._discover(max_drones, min_drones, board)
+
+        request = LeaseRequest(group, min_drones, max_drones, board, priority, slots)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.queue.append(request)
+            self._grant()
+        while True:
+            self._reclaim()
+            with self.condition:
+                if request.drones is not None:
+                    break
+                error = None
+                if len(self._known(board)) < min_drones:
+                    error = (ENOENT, f"needs {min_drones} {board} drones")
+                elif not self.stale and not self._running(group):
+                    error = (ENOENT, "no running group releases drones")
+                wait = self.interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        error = (ETIMEDOUT, "waited too long for drones")
+                if error:
+                    error = (error[0], f"{group.groupid} {error[1]}")
+                    self.queue.remove(request)
+                    raise DroneNotFoundError(error)
+                self.condition.wait(wait)
+                if request.drones is None:
+                    self._grant()
+
+        logger.debug(f"Leased {request.drones} to {group.groupid}")
+        return request.drones
+
+    def claim(self, group, drones):
+        """Lease given drones to a group, e.g. drones already assigned to it
+
+        Args:
+            group (DroneGroup): Group holding the drones
+            drones (list): Drone IDs
+        """
+        with self.condition:
+            for drone in drones:
+                self.leases[drone] = group
+            for stale in self.stale.values():
+                stale.difference_update(drones)
+            self.renewed[group] = time.monotonic()
+            self.parked.discard(group)
+
+    def park(self, group):
+        """Keep the drones of a group until other groups need them
+
+        Args:
+            group (DroneGroup): Group kept for a later run
+        """
+        with self.condition:
+            if group in self.leases.values():
+                self.parked.add(group)
+                self._grant()
+
+    def release(self, group, drones=None):
+        """End leases and hand the drones to waiting groups
+
+        Args:
+            group (DroneGroup): Group holding the drones
+            drones (list): Drones to release, all drones of the group if None
+        """
+        with self.condition:
+            if drones is None:
+                drones = [d for d, g in self.leases.items() if g is group]
+            self._release(group, drones)
+            self._grant()
@@ -0,0 +1,111 @@
+class Message(object):
+    """Message received from a drone
+
+    A compact replacement for the decoded message dict. Items are accessible
+    like in a dict (`msg["from"]`, `msg.get("data")`) so existing call
+    helpers keep working, while attributes avoid the per-message dict.
+    `received` holds the monotonic time the message arrived, `latency` and
+    `accepts` are filled in once the message answers a request.
+    """
+
+    __slots__ = (
+        "sender",
+        "to",
+        "type",
+        "seq",
+        "data",
+        "status",
+        "received",
+        "latency",
+        "accepts",
+    )
+
+    def __init__(self, sender, to, type, seq, data=None, status=None):
+        self.sender = sender
+        self.to = to
+        self.type = type
+        self.seq = seq
+        self.data = data
+        self.status = status
+        self.received = None
+        self.latency = None
+        self.accepts = None
+
+    @classmethod
+    def from_dict(cls, msg: dict):
+        """Create message from a decoded packet
+
+        Args:
+            msg (dict): Decoded packet
+
+        Returns:
+            Message: New message
+        """
+        return cls(msg["from"], msg["to"], msg["type"], msg["seq"], msg.get("data"))
+
+    @staticmethod
+    def _slot(key: str) -> str:
+        if key == "from":
+            return "sender"
+        if key not in Message.__slots__:
+            raise KeyError(key)
+        return key
+
+    def __getitem__(self, key: str):
+        value = getattr(self, self._slot(key))
+        if value is None and key in ("status", "received", "latency", "accepts"):
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        setattr(self, self._slot(key), value)
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key: str, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def to_dict(self) -> dict:
+        msg = {
+            "from": self.sender,
+            "to": self.to,
+            "type": self.type,
+            "seq": self.seq,
+            "data": self.data,
+        }
+        for key in ("status", "latency", "accepts"):
+            value = getattr(self, key)
+            if value is not None:
+                msg[key] = value
+        return msg
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Message):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+def jsonable(obj):
+    """`default` hook for `json.dumps` serializing messages in results
+
+    Args:
+        obj: Object unknown to the JSON encoder
+
+    Returns:
+        dict: Serializable representation
+    """
+    if isinstance(obj, Message):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
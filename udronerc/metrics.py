@@ -0,0 +1,258 @@
+import logging
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+
+def percentile(values: list, pct: float) -> float:
+    """Return the nearest-rank percentile of values
+
+    Args:
+        values (list): Measured values
+        pct (float): Percentile between 0 and 100
+
+    Returns:
+        float: Percentile or 0 for no values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Histogram(object):
+    """Fixed bucket histogram of observed values
+
+    Memory does not grow with the number of observations, so histograms can
+    be kept for every drone and message type of long running suites.
+    Quantiles are estimated by interpolating within the matching bucket.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (tuple): Sorted upper bounds of the buckets
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the observations of a histogram with the same buckets"""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: Estimated value, None without observations
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else self.min
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def state(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics(object):
+    """Latency, retransmit and traffic metrics of a drone host
+
+    Latencies are measured from the first transmission of a request to the
+    reply of each drone and kept per drone and per message type. A slow drone
+    shows up in its own histogram only, a slow controller or lossy network in
+    all of them together with retransmits and timeouts.
+    """
+
+    def __init__(self, received: dict = None):
+        """
+        Args:
+            received (dict): Receive counters of the host to include
+        """
+        self.received = received if received is not None else {}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.drones = {}
+            self.types = {}
+            self.retransmits = {}
+            self.timeouts = {}
+            self.accepts = {}
+            self.sent = {"packets": 0, "bytes": 0}
+
+    def observe(self, drone: str, msg_type: str, latency: float):
+        """Record the latency of a reply
+
+        Args:
+            drone (str): Answering drone
+            msg_type (str): Type of the request
+            latency (float): Seconds since the request was first sent
+        """
+        with self.lock:
+            histogram = self.drones.get(drone)
+            if histogram is None:
+                histogram = self.drones[drone] = Histogram()
+            histogram.observe(latency)
+            histogram = self.types.get(msg_type)
+            if histogram is None:
+                histogram = self.types[msg_type] = Histogram()
+            histogram.observe(latency)
+
+    def _count(self, counter: dict, key: str, count: int = 1):
+        with self.lock:
+            counter[key] = counter.get(key, 0) + count
+
+    def retransmit(self, msg_type: str, packets: int = 1):
+        self._count(self.retransmits, msg_type, packets)
+
+    def timeout(self, drone: str):
+        self._count(self.timeouts, drone)
+
+    def accepted(self, msg_type: str):
+        self._count(self.accepts, msg_type)
+
+    def send(self, size: int):
+        with self.lock:
+            self.sent["packets"] += 1
+            self.sent["bytes"] += size
+
+    def state(self) -> dict:
+        """
+        Returns:
+            dict: Snapshot of all metrics
+        """
+        with self.lock:
+            return {
+                "latency": {
+                    "drone": {d: h.state() for d, h in self.drones.items()},
+                    "type": {t: h.state() for t, h in self.types.items()},
+                },
+                "retransmits": dict(self.retransmits),
+                "timeouts": dict(self.timeouts),
+                "accept_cycles": dict(self.accepts),
+                "sent": dict(self.sent),
+                "received": dict(self.received),
+            }
+
+    def prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: Metrics text
+        """
+        lines = []
+
+        def family(name, kind, doc):
+            lines.append(f"# HELP udronerc_{name} {doc}")
+            lines.append(f"# TYPE udronerc_{name} {kind}")
+
+        def histogram(name, label, histograms):
+            family(name, "histogram", f"Reply latency by {label} in seconds")
+            for key, h in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(
+                        f'udronerc_{name}_bucket{{{label}="{key}",le="{bound}"}} '
+                        f"{cumulative}"
+                    )
+                lines.append(f'udronerc_{name}_sum{{{label}="{key}"}} {h.sum}')
+                lines.append(f'udronerc_{name}_count{{{label}="{key}"}} {h.count}')
+
+        def counter(name, label, values, doc):
+            family(name, "counter", doc)
+            for key, value in sorted(values.items()):
+                lines.append(f'udronerc_{name}{{{label}="{key}"}} {value}')
+
+        with self.lock:
+            histogram("drone_latency_seconds", "drone", self.drones)
+            histogram("type_latency_seconds", "type", self.types)
+            counter(
+                "retransmits_total", "type", self.retransmits, "Retransmitted packets"
+            )
+            counter("timeouts_total", "drone", self.timeouts, "Requests without reply")
+            counter(
+                "accept_cycles_total", "type", self.accepts, "Commands in progress"
+            )
+            counter("sent_total", "unit", self.sent, "Sent packets and bytes")
+            counter(
+                "received_total", "counter", self.received, "Receive counters"
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path):
+        """Write metrics for the node exporter textfile collector
+
+        The file is replaced atomically so scrapes never see partial content.
+
+        Args:
+            path (Path): Output file, usually ending in `.prom`
+        """
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_text(self.prometheus())
+        tmp.replace(path)
+        logger.info(f"Stored metrics to {path}")
@@ -38,7 +38,7 @@ def checkip(
         if check_ipv4:
             ipv4_addresses = response["data"].get("ipv4-address", [])
             if not specific_ipv4:
-                if len(ipv4_addresses) > 0:
+                if len(ipv4_addresses) == 0:
                     response["status"] = "failed"
             else:
                 found = False
@@ -51,7 +51,7 @@ def checkip(
         if check_ipv6:
             ipv6_addresses = response["data"].get("ipv6-address", [])
             if not specific_ipv6:
-                if len(ipv6_addresses) > 0:
+                if len(ipv6_addresses) == 0:
                     response["status"] = "failed"
             else:
                 found = False
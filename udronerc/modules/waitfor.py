@@ -0,0 +1,113 @@
+from ..commands import get_helper
+from ..dronegroup import DroneGroup
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending(object):
+    """View of a group limited to the drones which are not ready yet
+
+    Call helpers only use `host`, `groupid`, `assigned_drones` and `call` of
+    a group, so they run unchanged against the view. Requests never wait
+    beyond the deadline of the wait.
+    """
+
+    def __init__(self, group: DroneGroup, drones: set, deadline: float):
+        self.group = group
+        self.host = group.host
+        self.groupid = group.groupid
+        self.assigned_drones = drones
+        self.deadline = deadline
+
+    def call(
+        self, msg_type, data=None, timeout=60, result=None, stream=None, drones=None
+    ):
+        timeout = min(timeout, max(self.deadline - time.monotonic(), 0.1))
+        if drones is None:
+            drones = self.assigned_drones
+        else:
+            drones = set(drones) & self.assigned_drones
+        return self.group.call(msg_type, data, timeout, result, stream, drones=drones)
+
+
+def _matches(data, until) -> bool:
+    if isinstance(until, dict):
+        return isinstance(data, dict) and all(
+            key in data and _matches(data[key], value) for key, value in until.items()
+        )
+    return data == until
+
+
+def wait_for(
+    group: DroneGroup,
+    timeout: float = 60,
+    interval: float = 1,
+    backoff: float = 1.5,
+    max_interval: float = 10,
+    until: dict = None,
+    **command,
+):
+    """Poll a drone command until it succeeds on every drone
+
+    The command is given like a task, e.g. `checkip: {interface: lan}`, and
+    is repeated for drones which are not ready yet, waiting `interval`
+    seconds before the first retry and `backoff` times longer after every
+    further one. A drone is ready once the command returns `ok` and its
+    data contains everything given in `until`. The latency of a ready
+    drone's response is the time it took the drone to become ready.
+
+    Args:
+        group (DroneGroup): Group with drones to wait for
+        timeout (float): Seconds until waiting drones fail
+        interval (float): Seconds between the first polls
+        backoff (float): Factor the interval grows by after every poll
+        max_interval (float): Maximal seconds between polls
+        until (dict): Data the response must contain, e.g. `{code: 0}`
+
+    Returns:
+        dict: Last response of every drone, `failed` if it did not become
+            ready in time
+    """
+    if len(command) != 1:
+        logger.error(f"wait_for needs exactly one command, got {list(command)}")
+        quit(1)
+    cmd, args = next(iter(command.items()))
+    helper = get_helper(cmd)
+    if not callable(helper):
+
+        def helper(group, **data):
+            return group.call(cmd, data or None)
+
+    started = time.monotonic()
+    deadline = started + timeout
+    pending = set(group.assigned_drones)
+    responses = {}
+    while pending:
+        polled = helper(_Pending(group, pending, deadline), **(args or {}))
+        now = time.monotonic()
+        for drone, response in polled.items():
+            if drone not in pending:
+                continue
+            responses[drone] = response
+            if response["status"] == "ok" and (
+                until is None or _matches(response.get("data"), until)
+            ):
+                pending.discard(drone)
+                response["latency"] = now - started
+                logger.info(f"ok: [{drone}]: ready after {now - started:.1f}s")
+
+        if not pending or now >= deadline:
+            break
+        time.sleep(min(interval, deadline - now))
+        interval = min(interval * backoff, max_interval)
+
+    for drone in pending:
+        logger.warning(f"Drone {drone} not ready after {timeout}s")
+        if drone not in responses:
+            responses[drone] = {"status": "unreachable"}
+        elif responses[drone]["status"] == "ok":
+            responses[drone]["status"] = "failed"
+
+    return responses
@@ -0,0 +1,124 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+from .commands import task_command, task_name
+from .message import jsonable
+
+logger = logging.getLogger(__name__)
+
+
+class ResultWriter(object):
+    """Stream suite results into a JSON lines file
+
+    Every finished task writes one record per drone, host tasks write a
+    single record without drone. Records are flushed after `flush_records`
+    records or `flush_interval` seconds, so memory stays flat for long
+    suites and a crash loses at most the last unflushed records. The writer
+    may be shared by concurrently running suites.
+    """
+
+    def __init__(
+        self, path: Path, flush_interval: float = 1.0, flush_records: int = 100
+    ):
+        """
+        Args:
+            path (Path): Output file, replaced like `results.json`
+            flush_interval (float): Maximal seconds between flushes
+            flush_records (int): Maximal records between flushes
+        """
+        self.path = Path(path)
+        self.file = self.path.open("w")
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.pending = 0
+        self.records = 0
+        self.flushed = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(
+        self,
+        suite: dict,
+        iteration: int,
+        task: dict,
+        results: dict = None,
+        duration: float = None,
+    ):
+        """Write the results of a finished task
+
+        Args:
+            suite (dict): Suite the task belongs to
+            iteration (int): Repetition of the suite
+            task (dict): Task as defined in the suite
+            results (dict): Responses by drone, None for host tasks
+            duration (float): Seconds the task took
+        """
+        base = {
+            "time": time.time(),
+            "suite": suite["id"],
+            "iteration": iteration,
+            "task": task_name(task),
+            "cmd": task_command(task),
+            "duration": duration,
+        }
+        if results is None:
+            lines = [json.dumps({**base, "drone": None, "status": "ok"})]
+        else:
+            lines = [
+                json.dumps(
+                    {
+                        **base,
+                        "drone": drone,
+                        "status": response.get("status"),
+                        "response": response,
+                    },
+                    default=jsonable,
+                )
+                for drone, response in results.items()
+            ]
+
+        with self.lock:
+            for line in lines:
+                self.file.write(line + "\n")
+            self.pending += len(lines)
+            self.records += len(lines)
+            if (
+                self.pending >= self.flush_records
+                or time.monotonic() - self.flushed >= self.flush_interval
+            ):
+                self._flush()
+
+    def _flush(self):
+        self.file.flush()
+        self.pending = 0
+        self.flushed = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._flush()
+                self.file.close()
+        logger.info(f"Stored {self.records} result records to {self.path}")
+
+
+class ResultTee(object):
+    """Pass task results to multiple writers, e.g. a file and a `ResultStore`"""
+
+    def __init__(self, *writers):
+        self.writers = writers
+
+    def write(self, *args, **kwargs):
+        for writer in self.writers:
+            writer.write(*args, **kwargs)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
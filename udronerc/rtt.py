@@ -0,0 +1,135 @@
+import threading
+
+from .constants import UDRONE_RTO_INITIAL, UDRONE_RTO_MAX, UDRONE_RTO_MIN
+
+
+class RttEstimator(object):
+    """Round trip time estimator of a single drone
+
+    Implements the smoothed RTT and RTT variance estimation of RFC 6298. Every
+    retransmission timeout doubles the timeout until an answer arrives.
+    """
+
+    alpha = 1 / 8
+    beta = 1 / 4
+
+    def __init__(
+        self,
+        initial: float = UDRONE_RTO_INITIAL,
+        minimum: float = UDRONE_RTO_MIN,
+        maximum: float = UDRONE_RTO_MAX,
+    ):
+        """
+        Args:
+            initial (float): Timeout before the first sample
+            minimum (float): Lower bound of the timeout
+            maximum (float): Upper bound of the timeout including backoff
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial
+        self.backoff = 0
+        self.samples = 0
+
+    def sample(self, rtt: float):
+        """Add a measured round trip time
+
+        Only answers to requests which were not retransmitted must be sampled
+        (Karn's algorithm).
+
+        Args:
+            rtt (float): Seconds between sending a request and its answer
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(
+                self.srtt - rtt
+            )
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.minimum), self.maximum)
+        self.backoff = 0
+        self.samples += 1
+
+    def expired(self):
+        """Back off after a retransmission timeout"""
+        if self.timeout() < self.maximum:
+            self.backoff += 1
+
+    def timeout(self) -> float:
+        """
+        Returns:
+            float: Seconds to wait before retransmitting
+        """
+        return min(self.rto * 2 ** self.backoff, self.maximum)
+
+    def state(self) -> dict:
+        return {
+            "srtt": self.srtt,
+            "rttvar": self.rttvar,
+            "rto": self.rto,
+            "backoff": self.backoff,
+            "timeout": self.timeout(),
+            "samples": self.samples,
+        }
+
+
+class RttTable(object):
+    """Round trip time estimators of all drones known to a host"""
+
+    def __init__(self, initial: float = UDRONE_RTO_INITIAL):
+        """
+        Args:
+            initial (float): Timeout used for drones without samples
+        """
+        self.initial = initial
+        self.estimators = {}
+        self.lock = threading.Lock()
+
+    def get(self, drone: str) -> RttEstimator:
+        with self.lock:
+            estimator = self.estimators.get(drone)
+            if estimator is None:
+                estimator = self.estimators[drone] = RttEstimator(self.initial)
+            return estimator
+
+    def timeout(self, drones=None) -> float:
+        """Return the retransmission timeout for a set of drones
+
+        The slowest drone determines the timeout. Without given drones, e.g.
+        for a `!whois` broadcast, the timeouts of all drones with samples are
+        considered without their backoff, so unreachable drones do not delay
+        discovery.
+
+        Args:
+            drones (list): Drones expected to answer
+
+        Returns:
+            float: Seconds to wait before retransmitting
+        """
+        if drones is None:
+            with self.lock:
+                timeouts = [e.rto for e in self.estimators.values() if e.samples]
+        else:
+            timeouts = [self.get(drone).timeout() for drone in drones]
+        if not timeouts:
+            return self.initial
+        return max(timeouts)
+
+    def sample(self, drone: str, rtt: float):
+        self.get(drone).sample(rtt)
+
+    def expired(self, drones):
+        for drone in drones:
+            self.get(drone).expired()
+
+    def state(self) -> dict:
+        """
+        Returns:
+            dict: Estimator state by drone
+        """
+        with self.lock:
+            return {drone: e.state() for drone, e in self.estimators.items()}
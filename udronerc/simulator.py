@@ -0,0 +1,427 @@
+import heapq
+import itertools
+import json
+import logging
+import random
+import select
+import socket
+import threading
+import time
+
+from .chunks import split
+from .constants import (
+    UDRONE_CHUNK_SIZE,
+    UDRONE_CHUNK_WINDOW,
+    UDRONE_GROUP_DEFAULT,
+    UDRONE_MAX_DGRAM,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class VirtualDrone(object):
+    """State of a single simulated drone
+
+    A virtual drone mirrors the state a real `udrone` client keeps: the group
+    it is assigned to, the controller owning it, the current group sequence
+    and the replies already sent for a sequence so retransmitted requests are
+    answered without running the command again.
+    """
+
+    def __init__(self, droneid: str, board: str = "generic"):
+        """
+        Args:
+            droneid (str): Unique identifier of the drone
+            board (str): Board name reported to `!whois` requests
+        """
+        self.droneid = droneid
+        self.board = board
+        self.group = None
+        self.owner = None
+        self.seq = 0
+        self.last_seen = 0
+        self.replies = {}
+        self.uci = {}
+        self.down_until = 0
+
+    def reset(self):
+        self.group = None
+        self.owner = None
+        self.seq = 0
+        self.replies = {}
+
+
+class DroneFleet(object):
+    """In-process fleet of virtual drones speaking the udrone protocol
+
+    All drones of a fleet share one UDP socket bound to loopback. A
+    `DroneHost` pointed at `fleet.addr` talks to the fleet exactly as it
+    would talk to real drones on the multicast group, which allows measuring
+    `DroneHost` and `DroneGroup` without any hardware.
+
+    Replies are scheduled with a configurable latency and jitter and may be
+    dropped with a given probability. Commands listed in `accept_types` are
+    acknowledged with an `accept` message first and answered with the final
+    result after `accept_delay` seconds. Replies larger than a datagram are
+    split into `chunk` messages, the first window is sent right away and
+    further chunks on `!chunks` requests. Restarting the network service of
+    a drone removes its interface addresses for up to `restart_delay`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        count: int = 1,
+        board: str = "generic",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        accept_delay: float = 0.0,
+        accept_types: set = None,
+        idle_timeout: float = 60,
+        prefix: str = "drone",
+        seed: int = None,
+        files: dict = None,
+        restart_delay: float = 0.0,
+    ):
+        """
+        Args:
+            count (int): Number of virtual drones
+            board (str): Board name of all drones
+            latency (float): Base reply latency in seconds
+            jitter (float): Maximal random latency added to each reply
+            loss (float): Probability to drop a request or reply
+            accept_delay (float): Delay between `accept` and the final reply
+            accept_types (set): Commands answered with `accept` first
+            idle_timeout (float): Seconds until an idle drone leaves its group
+            prefix (str): Prefix of generated drone IDs
+            seed (int): Seed for latency and loss randomness
+            files (dict): Content of files read via ubus by path, other
+                paths return a short text
+            restart_delay (float): Maximal seconds a drone has no address
+                after a network restart, each drone is down between half
+                and the full delay
+        """
+        self.drones = {
+            f"{prefix}{i:04d}": VirtualDrone(f"{prefix}{i:04d}", board)
+            for i in range(count)
+        }
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.accept_delay = accept_delay
+        self.files = files or {}
+        self.restart_delay = restart_delay
+        if accept_types is None:
+            accept_types = {"system"} if accept_delay else set()
+        self.accept_types = set(accept_types)
+        self.idle_timeout = idle_timeout
+        self.expired_at = 0
+        self.random = random.Random(seed)
+
+        self.rx_packets = 0
+        self.tx_packets = 0
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.dropped = 0
+
+        self.addr = None
+        self.socket = None
+        self.thread = None
+        self.running = False
+        self.queue = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+        self.handlers = {
+            "sysinfo": self._handle_sysinfo,
+            "system": self._handle_system,
+            "ubus": self._handle_ubus,
+            "uci_set": self._handle_uci_set,
+            "uci_get": self._handle_uci_get,
+            "uci_dump": self._handle_uci_get,
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self, bind: tuple = ("127.0.0.1", 0)):
+        """Bind the fleet socket and start answering requests
+
+        Args:
+            bind (tuple): Local address to listen on
+
+        Returns:
+            tuple: Address a `DroneHost` should send to
+        """
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.socket.bind(bind)
+        self.socket.setblocking(0)
+        self.addr = self.socket.getsockname()
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, name="udronerc-fleet", daemon=True
+        )
+        self.thread.start()
+        logger.info(f"Simulating {len(self.drones)} drones on {self.addr}")
+        return self.addr
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    def _run(self):
+        poll = select.poll()
+        poll.register(self.socket, select.POLLIN)
+        while self.running:
+            now = time.time()
+            timeout = 100
+            with self.lock:
+                while self.queue and self.queue[0][0] <= now:
+                    _, _, packet, addr = heapq.heappop(self.queue)
+                    self._sendto(packet, addr)
+                if self.queue:
+                    timeout = min(timeout, (self.queue[0][0] - now) * 1000)
+            if poll.poll(max(timeout, 0)):
+                self._drain()
+
+    def _drain(self):
+        while True:
+            try:
+                packet, addr = self.socket.recvfrom(UDRONE_MAX_DGRAM)
+            except BlockingIOError:
+                return
+            self.rx_packets += 1
+            self.rx_bytes += len(packet)
+            try:
+                msg = json.loads(packet)
+            except ValueError:
+                logger.debug(f"Fleet dropped malformed packet from {addr}")
+                continue
+            self.handle(msg, addr)
+
+    def _sendto(self, packet: bytes, addr: tuple):
+        try:
+            self.socket.sendto(packet, addr)
+        except OSError as e:
+            logger.debug(f"Fleet failed to reply to {addr}: {e}")
+            return
+        self.tx_packets += 1
+        self.tx_bytes += len(packet)
+
+    def _lost(self) -> bool:
+        if self.loss and self.random.random() < self.loss:
+            self.dropped += 1
+            return True
+        return False
+
+    def _reply(
+        self,
+        drone,
+        msg: dict,
+        addr: tuple,
+        msg_type: str,
+        data,
+        delay=0,
+        chunks: list = None,
+    ):
+        payload = json.dumps(data, separators=(",", ":"))
+        if len(payload) + 256 > UDRONE_MAX_DGRAM or chunks is not None:
+            parts = split(payload, UDRONE_CHUNK_SIZE)
+            if chunks is None:
+                chunks = range(min(UDRONE_CHUNK_WINDOW, len(parts)))
+            for index in chunks:
+                if 0 <= index < len(parts):
+                    chunk = {
+                        "type": msg_type,
+                        "index": index,
+                        "count": len(parts),
+                        "part": parts[index],
+                    }
+                    self._send(drone, msg, addr, "chunk", chunk, delay)
+            return
+        self._send(drone, msg, addr, msg_type, data, delay)
+
+    def _send(self, drone, msg: dict, addr: tuple, msg_type: str, data, delay=0):
+        if self._lost():
+            return
+        packet = json.dumps(
+            {
+                "from": drone.droneid,
+                "to": msg["from"],
+                "type": msg_type,
+                "seq": msg["seq"],
+                "data": data,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        due = time.time() + delay + self.latency
+        if self.jitter:
+            due += self.random.uniform(0, self.jitter)
+        with self.lock:
+            heapq.heappush(self.queue, (due, next(self.counter), packet, addr))
+
+    def targets(self, to: str) -> list:
+        """Return drones addressed by a destination
+
+        Args:
+            to (str): Drone ID, group ID or the default group
+
+        Returns:
+            list: Addressed virtual drones
+        """
+        if to in self.drones:
+            return [self.drones[to]]
+        if to == UDRONE_GROUP_DEFAULT:
+            return [d for d in self.drones.values() if d.group is None]
+        return [d for d in self.drones.values() if d.group == to]
+
+    def handle(self, msg: dict, addr: tuple):
+        """Process a message received from a controller
+
+        Args:
+            msg (dict): Decoded udrone message
+            addr (tuple): Address of the sending controller
+        """
+        now = time.time()
+        if self.idle_timeout and now - self.expired_at > 1:
+            self.expired_at = now
+            for drone in self.drones.values():
+                if drone.group and now - drone.last_seen > self.idle_timeout:
+                    logger.debug(f"Drone {drone.droneid} idled out of {drone.group}")
+                    drone.reset()
+
+        msg_type = msg.get("type")
+        data = msg.get("data") or {}
+        for drone in self.targets(msg.get("to")):
+            if self._lost():
+                continue
+            if drone.group and drone.owner not in (None, msg.get("from")):
+                continue
+            drone.last_seen = now
+
+            if msg_type == "!whois":
+                board = data.get("board")
+                if board and board != drone.board:
+                    continue
+                self._reply(
+                    drone,
+                    msg,
+                    addr,
+                    "status",
+                    {"code": 0, "board": drone.board, "group": drone.group},
+                )
+            elif msg_type == "!assign":
+                if drone.group not in (None, data.get("group")):
+                    self._reply(
+                        drone, msg, addr, "status", {"code": 16, "errstr": "busy"}
+                    )
+                    continue
+                drone.group = data.get("group")
+                drone.owner = msg.get("from")
+                drone.seq = data.get("seq", 0)
+                self._reply(drone, msg, addr, "status", {"code": 0})
+            elif msg_type == "!reset":
+                drone.reset()
+                self._reply(drone, msg, addr, "status", {"code": 0})
+            elif drone.group is None:
+                continue
+            elif msg_type == "!chunks":
+                if msg["seq"] in drone.replies:
+                    reply_type, reply_data = drone.replies[msg["seq"]]
+                    self._reply(
+                        drone,
+                        msg,
+                        addr,
+                        reply_type,
+                        reply_data,
+                        chunks=data.get("chunks", []),
+                    )
+            elif msg["seq"] in drone.replies:
+                reply_type, reply_data = drone.replies[msg["seq"]]
+                self._reply(drone, msg, addr, reply_type, reply_data)
+            else:
+                self._execute(drone, msg, addr)
+
+    def _execute(self, drone, msg: dict, addr: tuple):
+        handler = self.handlers.get(msg["type"])
+        if handler is None:
+            result = ("unsupported", {})
+        else:
+            result = handler(drone, msg.get("data") or {})
+
+        drone.seq = max(drone.seq, msg["seq"])
+        drone.replies = {msg["seq"]: result}
+
+        if msg["type"] in self.accept_types:
+            self._reply(drone, msg, addr, "accept", {})
+            self._reply(drone, msg, addr, *result, delay=self.accept_delay)
+        else:
+            self._reply(drone, msg, addr, *result)
+
+    def _handle_sysinfo(self, drone, data: dict):
+        return "sysinfo", {
+            "board": drone.board,
+            "hostname": drone.droneid,
+            "uptime": int(time.monotonic()),
+        }
+
+    def _handle_system(self, drone, data: dict):
+        cmd = data.get("cmd", [])
+        return "system", {
+            "code": 0,
+            "stdout": "".join(data.get("stdin", [""])) or " ".join(cmd),
+            "stderr": "",
+        }
+
+    def _handle_ubus(self, drone, data: dict):
+        path = data.get("path", "")
+        method = data.get("method")
+        param = data.get("param") or {}
+        if path == "file" and method == "read":
+            content = self.files.get(param.get("path"))
+            if content is None:
+                content = f"{param.get('path')} of {drone.droneid}\n"
+            return "ubus", {"data": content}
+        if path.startswith("network.interface.") and method == "dump":
+            if time.time() < drone.down_until:
+                return "ubus", {"ipv4-address": [], "ipv6-address": []}
+            index = list(self.drones).index(drone.droneid)
+            return "ubus", {
+                "ipv4-address": [
+                    {"address": f"10.{index >> 8 & 255}.{index & 255}.1", "mask": 24}
+                ],
+                "ipv6-address": [],
+            }
+        if path == "luci" and method == "setInitAction":
+            if param.get("name") == "network" and param.get("action") == "restart":
+                delay = self.restart_delay * self.random.uniform(0.5, 1)
+                drone.down_until = time.time() + delay
+            return "ubus", {"result": True}
+        return "status", {"code": 2, "errstr": f"Unknown ubus call {path} {method}"}
+
+    def _handle_uci_set(self, drone, data: dict):
+        for config, sections in data.items():
+            if not isinstance(sections, dict):
+                continue
+            for section, options in sections.items():
+                drone.uci.setdefault(config, {}).setdefault(section, {}).update(
+                    options if isinstance(options, dict) else {}
+                )
+        return "status", {"code": 0}
+
+    def _handle_uci_get(self, drone, data: dict):
+        config = data.get("config")
+        if config:
+            return "uci", {config: drone.uci.get(config, {})}
+        return "uci", dict(drone.uci)
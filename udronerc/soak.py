@@ -0,0 +1,169 @@
+import json
+import logging
+import threading
+import time
+
+from .commands import task_name
+from .message import jsonable
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class SoakStats(object):
+    """Rolling aggregate of the responses of a task or a drone"""
+
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.latency = Histogram()
+        self.first_failure = None
+        self.last_failure = None
+        self.reported = (0, 0)
+
+    def observe(self, iteration: int, drone: str, response):
+        """Add a response, only failures are kept
+
+        Args:
+            iteration (int): Repetition of the suite
+            drone (str): Drone which answered
+            response (Message): Evaluated response
+        """
+        self.count += 1
+        latency = response.get("latency")
+        if latency is not None:
+            self.latency.observe(latency)
+        if response.get("status") == "ok":
+            return
+
+        self.failed += 1
+        failure = {
+            "time": time.time(),
+            "iteration": iteration,
+            "drone": drone,
+            "response": json.loads(json.dumps(response, default=jsonable)),
+        }
+        if self.first_failure is None:
+            self.first_failure = failure
+        self.last_failure = failure
+
+    def ratio(self) -> float:
+        return (self.count - self.failed) / self.count if self.count else None
+
+    def recent(self) -> tuple:
+        """Return responses and failures since the previous call
+
+        Returns:
+            tuple: Number of responses and failures
+        """
+        count, failed = self.count - self.reported[0], self.failed - self.reported[1]
+        self.reported = (self.count, self.failed)
+        return count, failed
+
+    def state(self) -> dict:
+        return {
+            "count": self.count,
+            "failed": self.failed,
+            "success_ratio": self.ratio(),
+            "latency": self.latency.state(),
+            "first_failure": self.first_failure,
+            "last_failure": self.last_failure,
+        }
+
+
+class SoakWriter(object):
+    """Aggregate task results of long repeated suites in constant memory
+
+    Used in place of a `ResultWriter`, every response only updates the
+    statistics of its task and its drone: success ratio, a latency histogram
+    and the first and last failure including its full response. Successful
+    responses are dropped. A progress summary with the success ratio since
+    the previous summary is logged every `interval` seconds, so the log
+    shows when a long run started to degrade.
+    """
+
+    def __init__(self, interval: float = 60):
+        """
+        Args:
+            interval (float): Seconds between progress summaries
+        """
+        self.interval = interval
+        self.tasks = {}
+        self.drones = {}
+        self.iterations = {}
+        self.started = time.time()
+        self.reported = time.monotonic()
+        self.lock = threading.Lock()
+
+    def write(
+        self,
+        suite: dict,
+        iteration: int,
+        task: dict,
+        results: dict = None,
+        duration: float = None,
+    ):
+        """Add the results of a finished task
+
+        Args:
+            suite (dict): Suite the task belongs to
+            iteration (int): Repetition of the suite
+            task (dict): Task as defined in the suite
+            results (dict): Responses by drone, None for host tasks
+            duration (float): Seconds the task took
+        """
+        name = f"{suite['id']}/{task_name(task)}"
+        with self.lock:
+            self.iterations[suite["id"]] = iteration
+            stats = self.tasks.get(name)
+            if stats is None:
+                stats = self.tasks[name] = SoakStats()
+            for drone, response in (results or {}).items():
+                stats.observe(iteration, drone, response)
+                if drone not in self.drones:
+                    self.drones[drone] = SoakStats()
+                self.drones[drone].observe(iteration, drone, response)
+
+            if time.monotonic() - self.reported >= self.interval:
+                self.reported = time.monotonic()
+                self.report()
+
+    def report(self):
+        """Log a progress summary"""
+        elapsed = time.time() - self.started
+        logger.info(
+            f"SOAK {elapsed:.0f}s iterations {self.iterations} "
+            f"drones {len(self.drones)}"
+        )
+        for name, stats in self.tasks.items():
+            count, failed = stats.recent()
+            p95 = stats.latency.quantile(0.95)
+            logger.info(
+                f"SOAK [{name}] {stats.count - stats.failed}/{stats.count} ok, "
+                f"{failed}/{count} failed since last report"
+                + (f", p95 {p95 * 1000:.1f}ms" if p95 is not None else "")
+            )
+        for drone, stats in self.drones.items():
+            count, failed = stats.recent()
+            if failed:
+                logger.warning(
+                    f"SOAK [{drone}] {failed}/{count} failed since last report"
+                )
+
+    def state(self) -> dict:
+        """
+        Returns:
+            dict: Statistics per task and per drone
+        """
+        with self.lock:
+            return {
+                "started": self.started,
+                "duration": time.time() - self.started,
+                "iterations": dict(self.iterations),
+                "tasks": {name: s.state() for name, s in self.tasks.items()},
+                "drones": {drone: s.state() for drone, s in self.drones.items()},
+            }
+
+    def close(self):
+        with self.lock:
+            self.report()
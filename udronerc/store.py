@@ -0,0 +1,287 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .commands import task_command, task_name
+from .message import jsonable
+from .metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    suite TEXT NOT NULL,
+    board TEXT,
+    source TEXT,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    iteration INTEGER NOT NULL,
+    task TEXT,
+    cmd TEXT,
+    time REAL NOT NULL,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL REFERENCES tasks(id),
+    drone TEXT NOT NULL,
+    status TEXT,
+    latency REAL,
+    response TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started);
+CREATE INDEX IF NOT EXISTS tasks_run ON tasks(run_id);
+CREATE INDEX IF NOT EXISTS tasks_task ON tasks(task, time);
+CREATE INDEX IF NOT EXISTS responses_task ON responses(task_id);
+CREATE INDEX IF NOT EXISTS responses_drone ON responses(drone, status);
+"""
+
+
+class ResultStore(object):
+    """Index suite results in a SQLite database
+
+    Runs, tasks and per-drone responses are stored in separate tables with
+    indices on time, task, drone and status, so results of many runs can be
+    queried without loading result files. The store offers the `write` and
+    `close` interface of `ResultWriter` and can be passed to `run_suite`.
+
+    Every suite dict written is a run of its own, `run_suite` loads the suite
+    on every invocation, so concurrent or repeated runs of the same suite are
+    stored as separate runs.
+    """
+
+    def __init__(self, path: Path = "results.db"):
+        """
+        Args:
+            path (Path): Database file, created if missing
+        """
+        self.path = Path(path)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.runs = {}  # Suite and run ID by id() of the suite, kept alive
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def begin_run(self, suite: dict, source: str = None, started: float = None):
+        """Create a new run of a suite
+
+        Args:
+            suite (dict): Suite of the run
+            source (str): Suite or result file the run originates from
+            started (float): Start of the run, defaults to now
+
+        Returns:
+            int: Run ID
+        """
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO runs (suite, board, source, started) VALUES (?, ?, ?, ?)",
+                (suite["id"], suite.get("board"), source, started or time.time()),
+            )
+            self.runs[id(suite)] = (suite, cursor.lastrowid)
+            return cursor.lastrowid
+
+    def write(
+        self,
+        suite: dict,
+        iteration: int,
+        task: dict,
+        results: dict = None,
+        duration: float = None,
+        started: float = None,
+    ):
+        """Store the results of a finished task
+
+        Args:
+            suite (dict): Suite the task belongs to
+            iteration (int): Repetition of the suite
+            task (dict): Task as defined in the suite
+            results (dict): Responses by drone, None for host tasks
+            duration (float): Seconds the task took
+            started (float): Time the task finished, defaults to now
+        """
+        run = self.runs.get(id(suite))
+        run_id = run[1] if run else self.begin_run(suite)
+
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO tasks (run_id, iteration, task, cmd, time, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    run_id,
+                    iteration,
+                    task_name(task),
+                    task_command(task),
+                    started or time.time(),
+                    duration,
+                ),
+            )
+            self.db.executemany(
+                "INSERT INTO responses (task_id, drone, status, latency, response) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        cursor.lastrowid,
+                        drone,
+                        response.get("status"),
+                        response.get("latency"),
+                        json.dumps(response, default=jsonable),
+                    )
+                    for drone, response in (results or {}).items()
+                ],
+            )
+            self.db.commit()
+
+    def import_results(self, path: Path) -> int:
+        """Import a `results.json` or streamed `.jsonl` results file
+
+        Args:
+            path (Path): Results file
+
+        Returns:
+            int: Number of imported runs
+        """
+        path = Path(path)
+        started = path.stat().st_mtime
+
+        if path.suffix == ".jsonl":
+            runs = {}
+            for line in path.read_text().splitlines():
+                record = json.loads(line)
+                suite = runs.get(record["suite"])
+                if suite is None:
+                    suite = runs[record["suite"]] = {"id": record["suite"]}
+                    self.begin_run(suite, str(path), record["time"])
+                results = None
+                if record["drone"]:
+                    results = {record["drone"]: record["response"]}
+                self.write(
+                    suite,
+                    record["iteration"],
+                    {"name": record["task"], record["cmd"]: None},
+                    results,
+                    record.get("duration"),
+                    record["time"],
+                )
+            return len(runs)
+
+        content = json.loads(path.read_text())
+        if isinstance(content, list):
+            content = {str(path): content}
+
+        imported = 0
+        for source, tasks in content.items():
+            if not isinstance(tasks, list):
+                logger.warning(f"Skipping {source}: {tasks}")
+                continue
+            suite = {"id": Path(source).stem}
+            self.begin_run(suite, str(path), started)
+            for task, results in tasks:
+                self.write(suite, 0, task, results, started=started)
+            imported += 1
+        return imported
+
+    def query(
+        self,
+        drone: str = None,
+        task: str = None,
+        status: str = None,
+        suite: str = None,
+        board: str = None,
+        since: float = None,
+        limit: int = None,
+    ) -> list:
+        """Return stored responses matching all given filters
+
+        Args:
+            drone (str): Drone ID
+            task (str): Task name or command
+            status (str): Response status, e.g. `failed`
+            suite (str): Suite ID
+            board (str): Board of the suite
+            since (float): Earliest task time as UNIX timestamp
+            limit (int): Maximal number of rows
+
+        Returns:
+            list: Rows as dicts, newest first
+        """
+        where = []
+        params = []
+        for column, value in (
+            ("responses.drone", drone),
+            ("responses.status", status),
+            ("runs.suite", suite),
+            ("runs.board", board),
+        ):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if task is not None:
+            where.append("(tasks.task = ? OR tasks.cmd = ?)")
+            params.extend([task, task])
+        if since is not None:
+            where.append("tasks.time >= ?")
+            params.append(since)
+
+        sql = (
+            "SELECT tasks.time, runs.suite, runs.board, tasks.iteration, tasks.task, "
+            "tasks.cmd, responses.drone, responses.status, responses.latency, "
+            "tasks.duration FROM responses "
+            "JOIN tasks ON tasks.id = responses.task_id "
+            "JOIN runs ON runs.id = tasks.run_id"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY tasks.time DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        with self.lock:
+            cursor = self.db.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def summary(self, rows: list, by: tuple = ("drone", "task")) -> list:
+        """Aggregate queried rows
+
+        Args:
+            rows (list): Rows returned by `query`
+            by (tuple): Columns to group by
+
+        Returns:
+            list: Count, failures and latency percentiles per group
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row[c] for c in by), []).append(row)
+
+        summary = []
+        for key, group in sorted(groups.items(), key=lambda g: str(g[0])):
+            latencies = [r["latency"] for r in group if r["latency"] is not None]
+            summary.append(
+                {
+                    **dict(zip(by, key)),
+                    "count": len(group),
+                    "failed": sum(r["status"] != "ok" for r in group),
+                    "p50": percentile(latencies, 50) if latencies else None,
+                    "p95": percentile(latencies, 95) if latencies else None,
+                }
+            )
+        return summary
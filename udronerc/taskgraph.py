@@ -0,0 +1,125 @@
+import logging
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .constants import UDRONE_TASK_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+class TaskGraph(object):
+    """Dependencies between the tasks of a suite
+
+    Without further declarations every task depends on the task before it,
+    so suites run serially as written. A task listing `depends_on` only
+    waits for the tasks with the given `id`s, an empty list lets it start
+    right away. The tasks of a `parallel` block all depend on the entry
+    before the block and the entry after the block waits for all of them.
+    """
+
+    def __init__(self, tasks: list):
+        """
+        Args:
+            tasks (list): Tasks of a suite as loaded from YAML
+        """
+        self.tasks = []
+        self.depends = []
+        declared = {}
+        ids = {}
+        previous = set()
+        for entry in tasks:
+            block = entry.get("parallel") if isinstance(entry, dict) else None
+            if block is None:
+                block = [entry]
+            current = set()
+            for task in block:
+                index = len(self.tasks)
+                self.tasks.append(task)
+                self.depends.append(previous)
+                if "depends_on" in task:
+                    declared[index] = task["depends_on"]
+                if "id" in task:
+                    if task["id"] in ids:
+                        logger.error(f"Task ID {task['id']} used twice")
+                        quit(1)
+                    ids[task["id"]] = index
+                current.add(index)
+            previous = current
+
+        for index, depends in declared.items():
+            if isinstance(depends, str):
+                depends = [depends]
+            unknown = [d for d in depends if d not in ids]
+            if unknown:
+                logger.error(f"Task {self.name(index)} depends on unknown {unknown}")
+                quit(1)
+            self.depends[index] = {ids[d] for d in depends}
+
+        self._check_cycles()
+
+    def _check_cycles(self):
+        state = {}
+
+        def visit(index):
+            if state.get(index) == "done":
+                return
+            if state.get(index) == "visiting":
+                logger.error(f"Task {self.name(index)} depends on itself")
+                quit(1)
+            state[index] = "visiting"
+            for dependency in self.depends[index]:
+                visit(dependency)
+            state[index] = "done"
+
+        for index in range(len(self.tasks)):
+            visit(index)
+
+    def name(self, index: int) -> str:
+        task = self.tasks[index]
+        return task.get("name", task.get("id", str(index)))
+
+    def run(self, run_task, concurrency: int = UDRONE_TASK_CONCURRENCY) -> list:
+        """Run all tasks, independent tasks concurrently
+
+        A failing task stops new tasks from starting, the error is raised
+        once the running tasks finished.
+
+        Args:
+            run_task (callable): Called with a task, returns its results
+            concurrency (int): Maximal number of tasks running at once
+
+        Returns:
+            list: Tasks and their results in suite order
+        """
+        concurrency = max(concurrency, 1)
+        results = [None] * len(self.tasks)
+        waiting = set(range(len(self.tasks)))
+        done = set()
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            while waiting or running:
+                ready = sorted(i for i in waiting if self.depends[i] <= done)
+                while error is None and ready and len(running) < concurrency:
+                    index = ready.pop(0)
+                    waiting.remove(index)
+                    task = self.tasks[index]
+                    context = contextvars.copy_context()  # e.g. log forwarding
+                    running[executor.submit(context.run, run_task, task)] = index
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = running.pop(future)
+                    try:
+                        results[index] = (self.tasks[index], future.result())
+                    except BaseException as e:
+                        logger.error(f"Task {self.name(index)} failed: {e!r}")
+                        error = error or e
+                    done.add(index)
+
+        if error is not None:
+            raise error
+        return results
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class Span(object):
+    """Time a with block and record it as a complete trace event"""
+
+    __slots__ = ("tracer", "name", "cat", "args", "begin")
+
+    def __init__(self, tracer, name: str, cat: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.complete(
+            self.name, self.cat, self.begin, time.perf_counter(), self.args
+        )
+
+
+class NullSpan(object):
+    """Span of a disabled tracer, does nothing"""
+
+    args = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    """Record spans in the Chrome trace event format
+
+    The resulting file can be loaded into `chrome://tracing` or Perfetto and
+    shows per thread where the wall clock time of a suite goes. A disabled
+    tracer returns a shared no-op span, so instrumented code paths cost
+    almost nothing unless tracing was requested.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Args:
+            enabled (bool): Record events
+        """
+        self.enabled = enabled
+        self.events = []
+        self.threads = set()
+        self.pid = os.getpid()
+        self.start = time.perf_counter()
+
+    def __bool__(self) -> bool:
+        return self.enabled
+
+    def span(self, name: str, cat: str = "udronerc", **args):
+        """Record the duration of a with block
+
+        Arguments of the span may be added within the block via `span.args`.
+
+        Args:
+            name (str): Name of the span
+            cat (str): Category, e.g. `task` or `net`
+
+        Returns:
+            Span: Context manager timing the block
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def _thread(self) -> int:
+        tid = threading.get_ident()
+        if tid not in self.threads:
+            self.threads.add(tid)
+            self.events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "tid": tid,
+                    "args": {"name": threading.current_thread().name},
+                }
+            )
+        return tid
+
+    def complete(self, name: str, cat: str, begin: float, end: float, args: dict):
+        """Record a finished span
+
+        Args:
+            name (str): Name of the span
+            cat (str): Category of the span
+            begin (float): `time.perf_counter` at the start
+            end (float): `time.perf_counter` at the end
+            args (dict): Additional arguments shown with the span
+        """
+        self.events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (begin - self.start) * 1e6,
+                "dur": (end - begin) * 1e6,
+                "pid": self.pid,
+                "tid": self._thread(),
+                "args": args,
+            }
+        )
+
+    def instant(self, name: str, cat: str = "udronerc", **args):
+        """Record a point in time
+
+        Args:
+            name (str): Name of the event
+            cat (str): Category of the event
+        """
+        if not self.enabled:
+            return
+        self.events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "i",
+                "s": "t",
+                "ts": (time.perf_counter() - self.start) * 1e6,
+                "pid": self.pid,
+                "tid": self._thread(),
+                "args": args,
+            }
+        )
+
+    def save(self, path: Path):
+        """Write recorded events as Chrome trace JSON
+
+        Args:
+            path (Path): Output file
+        """
+        Path(path).write_text(
+            json.dumps({"traceEvents": self.events, "displayTimeUnit": "ms"})
+        )
+        logger.info(f"Stored {len(self.events)} trace events to {path}")
@@ -0,0 +1,100 @@
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def merge(target: dict, data: dict):
+    """Merge nested UCI data into a dict
+
+    Args:
+        target (dict): Data to update in place
+        data (dict): Configs, sections and options to merge
+    """
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        elif isinstance(value, dict):
+            target[key] = json.loads(json.dumps(value))
+        else:
+            target[key] = value
+
+
+def diff(known: dict, data: dict) -> dict:
+    """Return the parts of nested UCI data differing from known data
+
+    Args:
+        known (dict): Data known to be set
+        data (dict): Data to set
+
+    Returns:
+        dict: Configs, sections and options of `data` not set yet
+    """
+    delta = {}
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(known.get(key), dict):
+            changed = diff(known[key], value)
+            if changed:
+                delta[key] = changed
+        elif key not in known or known[key] != value:
+            delta[key] = value
+    return delta
+
+
+class UciCache(object):
+    """UCI state of drones as known by the host
+
+    The cache is filled from `uci_get`/`uci_dump` replies and from successful
+    `uci_set` requests. It only ever holds options whose value was confirmed
+    by a drone, so options missing from the cache are always sent. Drones
+    are forgotten when they are reset, upgraded or a request failed, as
+    their configuration is unknown afterwards.
+    """
+
+    def __init__(self):
+        self.drones = {}
+        self.lock = threading.Lock()
+
+    def update(self, drone: str, data: dict):
+        """Record UCI data confirmed by a drone
+
+        Args:
+            drone (str): Drone ID
+            data (dict): Configs, sections and options set on the drone
+        """
+        if not isinstance(data, dict):
+            return
+        with self.lock:
+            merge(self.drones.setdefault(drone, {}), data)
+
+    def delta(self, drone: str, data: dict) -> dict:
+        """Return the UCI data a drone still needs
+
+        Args:
+            drone (str): Drone ID
+            data (dict): Configs, sections and options to set
+
+        Returns:
+            dict: Part of `data` not known to be set on the drone
+        """
+        with self.lock:
+            return diff(self.drones.get(drone, {}), data)
+
+    def forget(self, drones):
+        """Drop the known UCI state of drones
+
+        Args:
+            drones (list): Drone IDs
+        """
+        with self.lock:
+            for drone in drones:
+                self.drones.pop(drone, None)
+
+    def state(self) -> dict:
+        """
+        Returns:
+            dict: Known UCI data by drone
+        """
+        with self.lock:
+            return json.loads(json.dumps(self.drones))
@@ -1,22 +1,56 @@
+import binascii
+import contextvars
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import yaml
 import json
 
-from .dronegroup import DroneGroup
+from .commands import get_helper, task_command, task_name
+from .constants import UDRONE_GROUP_DEFAULT, UDRONE_TASK_CONCURRENCY
+from .dronegroup import DroneGroup, evaluate
 from .dronehost import DroneHost
-from .modules.checkip import checkip
-
-with open("config.yml") as c:
-    conf = yaml.safe_load(c.read())
+from .errors import DroneNotFoundError
+from .message import Message, jsonable
+from .results import ResultWriter
+from .taskgraph import TaskGraph
 
 logger = logging.getLogger(__name__)
 
 
-def get_host():
-    return DroneHost(conf["address"], hostid=conf["hostid"])
+def get_host(conf: dict, capture: Path = None, replay: Path = None, realtime=False):
+    """Create a host as configured
+
+    `address` may list several local addresses to reach drones on separate
+    networks. Without `address` the interfaces named by `ifname` are used.
+
+    Args:
+        conf (dict): Loaded config.yml
+        capture (Path): Record all datagrams to this capture file
+        replay (Path): Replay this capture file instead of using the network
+        realtime (bool): Replay with the recorded timing
+
+    Returns:
+        DroneHost: Initialized drone host
+    """
+    if replay:
+        from .capture import Replay
+
+        return DroneHost(replay=Replay(replay, realtime), capture=capture)
+
+    address = conf.get("address")
+    interfaces = conf.get("ifname") if not address else None
+    if isinstance(interfaces, str):
+        interfaces = [interfaces]
+    return DroneHost(
+        address,
+        hostid=conf["hostid"],
+        inventory=conf.get("inventory"),
+        interfaces=interfaces,
+        capture=capture,
+    )
 
 
 def replace_tags(msg: str, data: dict):
@@ -60,11 +94,76 @@ def host_raw(cmd):
 
 
 def uci_set(group: DroneGroup, data: dict, commit: bool = True):
-    responses = group.call("uci_set", data)
+    """
+    Set UCI options, sending every drone only the options it still needs
+
+    Drones are grouped by the options they miss according to the host UCI
+    cache, each set of options is sent once to the drones missing it. Drones
+    already having all options are not contacted and answer `ok`.
+
+    Args:
+        data (dict): Options to set by config and section
+        commit (bool): Commit the changes
+    """
+    uci = group.host.uci
+    deltas = {}
+    for drone in group.assigned_drones:
+        delta = uci.delta(drone, data)
+        key = json.dumps(delta, sort_keys=True)
+        deltas.setdefault(key, (delta, set()))[1].add(drone)
+
+    responses = {}
+    for delta, drones in deltas.values():
+        if not delta:
+            logger.debug(f"UCI of {sorted(drones)} up to date")
+            current = {
+                drone: Message(drone, group.host.hostid, "status", None, {"code": 0})
+                for drone in drones
+            }
+            responses.update(evaluate(current, group.assigned_drones))
+            continue
+
+        if len(deltas) == 1:
+            drones = None
+        for drone, response in group.call("uci_set", delta, drones=drones).items():
+            responses[drone] = response
+            if response["status"] == "ok":
+                uci.update(drone, delta)
+            else:
+                uci.forget([drone])
 
     return responses
 
 
+def uci_get(group: DroneGroup, config: str = None):
+    """
+    Read UCI options and remember them in the host UCI cache
+
+    Args:
+        config (str): Config to read, all configs if not set
+    """
+    responses = group.call("uci_get", {"config": config} if config else None)
+    _cache_uci(group, responses)
+    return responses
+
+
+def uci_dump(group: DroneGroup):
+    """
+    Read all UCI configs and remember them in the host UCI cache
+    """
+    responses = group.call("uci_dump")
+    _cache_uci(group, responses)
+    return responses
+
+
+def _cache_uci(group: DroneGroup, responses: dict):
+    for drone, response in responses.items():
+        if response["status"] == "ok" and response["type"] == "uci":
+            group.host.uci.update(drone, response["data"])
+        else:
+            group.host.uci.forget([drone])
+
+
 def service(group: DroneGroup, name: str, action: str):
     responses = group.call(
         "ubus",
@@ -88,57 +187,34 @@ def system(group: DroneGroup, cmd, stdin=[""]):
     return responses
 
 
-def read_file(group: DroneHost, path, base64=False):
+def read_file(group: DroneGroup, path, base64=False, dest=None):
+    """
+    Read a file of every drone, large files are transferred in chunks
+
+    Args:
+        path (str): Path of the file on the drones
+        base64 (bool): Transfer the file base64 encoded
+        dest (str): Directory to store the files in as `<drone>_<name>`
+    """
     responses = group.call(
         "ubus",
         {"path": "file", "method": "read", "param": {"path": path, "base64": base64},},
     )
 
-    return responses
-
+    if dest:
+        Path(dest).mkdir(parents=True, exist_ok=True)
+        for drone, response in responses.items():
+            if response["status"] != "ok":
+                continue
+            content = response["data"].get("data", "")
+            target = Path(dest) / f"{drone}_{Path(path).name}"
+            if base64:
+                target.write_bytes(binascii.a2b_base64(content))
+            else:
+                target.write_text(content)
+            logger.info(f"Stored {path} of {drone} to {target}")
 
-# this is the map of all complex call helpers
-cmds_drone = {
-    "read_file": read_file,
-    "checkip": checkip,
-    "checknetmask": {},
-    "cloudlogin": {},
-    "cloudlogout": {},
-    "cloudwispr": {},
-    "comment": {},
-    "dhcp": {},
-    "dns_flood": {},
-    "download": {},
-    "essid": {},
-    "fatserver": {},
-    "getifaddrs": {},
-    "ping": {},
-    "readfile": {},
-    "setmask": {},
-    "sysinfo": sysinfo,
-    "system": system,
-    "ubus": {},
-    "service": service,
-    "ubus_call": {},
-    "uci_dump": {},
-    "uci_get": {},
-    "uci_replace": {},
-    "uci_set": uci_set,
-    "upgrade": {},
-    "webui_auth": {},
-    "webui_ip": {},
-    "webui_rpc": {},
-}
-
-cmds_host = {
-    "host_sleep": host_sleep,
-    "host_comment": host_comment,
-    "host_raw": host_raw,
-}
-
-
-cmds_drone_set = set(cmds_drone.keys())
-cmds_host_set = set(cmds_host.keys())
+    return responses
 
 
 def print_results(results):
@@ -151,62 +227,197 @@ def print_results(results):
 
 
 def run_task(group, task: dict):
-    cmd_set = set(task.keys()) & (cmds_drone_set ^ cmds_host_set)
-    logger.debug(f"{cmd_set=}")
-
-    if len(cmd_set) > 1:
-        logger.error("Only one command per task allowed")
-        quit(1)
+    cmd = task_command(task)
+    logger.debug(f"{cmd=}")
 
-    if len(cmd_set) != 1:
-        logger.error("Command in task missing or unknown")
+    if cmd is None:
+        logger.error("Task needs exactly one known command")
         quit(1)
 
-    cmd = cmd_set.pop()
-    desc = task.get("name", cmd)
+    desc = task_name(task)
     logger.info(f"TASK [{desc}]")
 
-    if cmd.startswith("host"):
-        if task[cmd]:
-            cmds_host[cmd](**task[cmd])
-        else:
-            cmds_host[cmd]()
-    else:
-        if task[cmd]:
-            results = cmds_drone[cmd](group, **task[cmd])
+    with group.host.tracer.span(desc, "task", cmd=cmd, group=group.groupid):
+        if cmd.startswith("host"):
+            with group.host.tracer.span(cmd, "host", **(task[cmd] or {})):
+                if task[cmd]:
+                    get_helper(cmd)(**task[cmd])
+                else:
+                    get_helper(cmd)()
         else:
-            results = cmds_drone[cmd](group)
-
-        print_results(results)
-        return results
-
-
-def run_suite(host: DroneHost, path: str):
+            if task[cmd]:
+                results = get_helper(cmd)(group, **task[cmd])
+            else:
+                results = get_helper(cmd)(group)
+
+            print_results(results)
+            return results
+
+
+def run_suite(
+    host: DroneHost,
+    path: str,
+    candidates: list = None,
+    groupid: str = None,
+    writer: ResultWriter = None,
+    repeat: int = None,
+    keep: bool = False,
+    collect: bool = None,
+    slots: int = None,
+):
     """
     Run a suitea
 
+    Tasks run in the order of the suite unless they declare dependencies
+    via `id`/`depends_on` or are grouped in `parallel` blocks, independent
+    tasks then run concurrently, at most `concurrency` of the suite at once.
+
     Args:
         path (str): Path to suite YAML file
+        candidates (list): Drones to assign instead of discovering them
+        groupid (str): Group name, defaults to the suite ID
+        writer (ResultWriter): Pass results of finished tasks to a writer
+        repeat (int): Override the repetitions of the suite
+        keep (bool): Keep the group and its drones for the next run of the
+            suite instead of resetting it
+        collect (bool): Return the results, defaults to only without writer
+        slots (int): Number of suites sharing the drones of the host
+
+    Returns:
+        list: Tasks and their results, empty if not collected
     """
+    if collect is None:
+        collect = writer is None
     results = []
     suite = load_suite(path)
-    group = host.Group(suite["id"])
-    group.assign(
-        suite.get("drones_max", 1),
-        suite.get("drones_min", 1),
-        board=suite.get("board"),
-    )
+    group = host.Group(groupid or suite["id"])
+    with group.in_use():
+        members = len(group.assigned_drones)
+        if members < suite.get("drones_min", 1):
+            group.assign(
+                suite.get("drones_min", 1) - members,
+                suite.get("drones_max", 1) - members,
+                board=suite.get("board"),
+                candidates=candidates,
+                priority=suite.get("priority", 0),
+                slots=slots,
+            )
+        else:
+            logger.info(f"Reusing {members} drones of group {suite['id']}")
+            host.leases.claim(group, group.assigned_drones)
+
+        graph = TaskGraph(suite["tasks"])
+        concurrency = suite.get("concurrency", UDRONE_TASK_CONCURRENCY)
+
+        loop_end = (suite.get("repeat", 1) if repeat is None else repeat) + 1
+        for i in range(loop_end):
+            logger.info(f"PLAY {suite['id']} - {suite['name']} [{i}/{loop_end}]")
+
+            def run_timed(task, i=i):
+                start = time.monotonic()
+                task_results = run_task(group, task)
+                if writer:
+                    writer.write(suite, i, task, task_results, time.monotonic() - start)
+                return task_results
+
+            task_results = graph.run(run_timed, concurrency)
+            if collect:
+                results.extend(task_results)
+
+        if not keep:
+            logger.info(f"Reset group {suite['id']}")
+            group.reset()
+        else:
+            host.leases.park(group)
 
-    loop_end = suite.get("repeat", 1) + 1
-    for i in range(loop_end):
-        logger.info(f"PLAY {suite['id']} - {suite['name']} [{i}/{loop_end}]")
-        for task in suite["tasks"]:
-            results.append((task, run_task(group, task)))
+    return results
 
-    logger.info(f"Reset group {suite['id']}")
-    group.reset()
 
-    return results
+def _run_leased(
+    host: DroneHost,
+    path: str,
+    groupid: str,
+    writer: ResultWriter,
+    repeat: int = None,
+    keep: bool = False,
+    collect: bool = None,
+    slots: int = None,
+):
+    try:
+        return run_suite(
+            host,
+            path,
+            groupid=groupid,
+            writer=writer,
+            repeat=repeat,
+            keep=keep,
+            collect=collect,
+            slots=slots,
+        )
+    except DroneNotFoundError as e:
+        logger.error(f"Suite {path} skipped: {e}")
+        return {"error": str(e)}
+    except (SystemExit, EnvironmentError) as e:
+        logger.error(f"Suite {path} failed: {e}")
+        return {"error": str(e)}
+
+
+def run_suites(
+    host: DroneHost,
+    paths: list,
+    parallel: int = 1,
+    writer: ResultWriter = None,
+    repeat: int = None,
+    keep: bool = False,
+    collect: bool = None,
+) -> dict:
+    """
+    Run multiple suites concurrently on a shared host
+
+    Drones are discovered once for all suites and split between the running
+    suites by the lease manager of the host. A suite waits until finished
+    suites release enough drones, suites with a higher `priority` first.
+
+    Args:
+        paths (list): Paths to suite YAML files
+        parallel (int): Maximal number of suites running at the same time
+        writer (ResultWriter): Pass results of finished tasks to a writer
+        repeat (int): Override the repetitions of all suites
+        keep (bool): Keep the groups and their drones after the suites
+        collect (bool): Return the results, defaults to only without writer
+
+    Returns:
+        dict: Results of each suite by path
+    """
+    suites = {path: load_suite(path) for path in paths}
+
+    drones = set()
+    for board in {suite.get("board") for suite in suites.values()}:
+        need = sum(
+            max(s.get("drones_max", 1), s.get("drones_min", 1))
+            for s in suites.values()
+            if s.get("board") == board
+        )
+        drones.update(host.whois(UDRONE_GROUP_DEFAULT, need, board=board))
+    logger.info(f"Running {len(paths)} suites on {len(drones)} drones")
+
+    with ThreadPoolExecutor(parallel) as executor:
+        futures = {
+            path: executor.submit(
+                contextvars.copy_context().run,
+                _run_leased,
+                host,
+                path,
+                f"{suites[path]['id']}_{i}",
+                writer,
+                repeat,
+                keep,
+                collect,
+                parallel,
+            )
+            for i, path in enumerate(paths)
+        }
+    return {path: future.result() for path, future in futures.items()}
 
 
 def load_suite(path: str) -> dict:
@@ -220,9 +431,102 @@ def load_suite(path: str) -> dict:
     return yaml.safe_load(suite_path.read_text())
 
 
-def disband():
-    get_host().disband()
+def run_paths(
+    host: DroneHost,
+    paths: list,
+    parallel: int = 1,
+    output: Path = Path("results.json"),
+    db: Path = None,
+    metrics: Path = None,
+    trace: Path = None,
+    repeat: int = None,
+    soak: bool = False,
+    progress: float = 60,
+    keep: bool = False,
+):
+    """
+    Run suites and store their results as requested by `suite run`
 
+    Args:
+        paths (list): Paths to suite YAML files
+        parallel (int): Maximal number of suites running at the same time
+        output (Path): Results file, *.jsonl streams the results
+        db (Path): Also index results in a SQLite database
+        metrics (Path): Store host metrics, *.json as JSON, otherwise in
+            Prometheus text format
+        trace (Path): Store a Chrome trace of the run
+        repeat (int): Override the repetitions of suites
+        soak (bool): Keep aggregates and failures only
+        progress (float): Seconds between soak progress summaries
+        keep (bool): Keep the groups and their drones after the suites
+    """
+    from .results import ResultTee
+    from .soak import SoakWriter
+    from .store import ResultStore
+    from .trace import Tracer
+
+    output = Path(output)
+    streamed = soak or output.suffix == ".jsonl"  # Replace results.json
+    if trace:
+        host.tracer = Tracer()
+    writers = []
+    if soak:
+        soak = SoakWriter(progress)
+        writers.append(soak)
+    elif output.suffix == ".jsonl":
+        writers.append(ResultWriter(output))
+    if db:
+        writers.append(ResultStore(db))
+    writer = ResultTee(*writers) if writers else None
+
+    try:
+        if len(paths) == 1:
+            results_suite = run_suite(
+                host,
+                paths[0],
+                writer=writer,
+                repeat=repeat,
+                keep=keep,
+                collect=not streamed,
+            )
+        else:
+            results_suite = run_suites(
+                host, paths, parallel, writer, repeat, keep, collect=not streamed
+            )
+    finally:
+        if writer:
+            writer.close()
+        if trace:
+            host.tracer.save(trace)
+            host.tracer = Tracer(enabled=False)
+
+    if metrics and Path(metrics).suffix == ".json":
+        Path(metrics).write_text(json.dumps(host.metrics.state(), indent="  "))
+    elif metrics:
+        host.metrics.write_prometheus(metrics)
+    if soak:
+        output.write_text(json.dumps(soak.state(), indent="  "))
+        logger.info(f"Stored soak statistics to {output}")
+        return
+    if output.suffix == ".jsonl":
+        return
+
+    output.write_text(json.dumps(results_suite, indent="  ", default=jsonable))
+    logger.info(f"Stored suite results to {output}")
+
+
+def disband(conf: dict):
+    """Reset the groups of this host's ID other runs left behind
+
+    Args:
+        conf (dict): Loaded config.yml
+    """
+    host = get_host(conf)
+    prefix = f"{host.hostid}_"
+    for groupid, drones in host.inventory.groups().items():
+        if groupid.startswith(prefix):
+            group = host.Group(groupid, absolute=True)
+            group.assigned_drones = set(drones)
+    host.disband()
+    host.close()
 
-def whois(group, board):
-    return get_host().whois(group, board=board)